@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark clone end-to-end: chạy CLI web_cloner.py trên website tổng hợp phục vụ bởi fixture server local
+
+Mỗi profile (xem fixture_server.PROFILES) được sinh tất định theo seed, phục vụ với độ trễ và
+băng thông giả lập, rồi clone bằng subprocess để đo đúng như người dùng chạy CLI. Đo wall time,
+CPU time (user + sys), peak RSS của process clone và số request/giây server nhận được; lấy
+median qua --repeat lần chạy. Lưu kết quả ra JSON (kèm commit git) để so sánh giữa các commit.
+
+Chạy:
+    python benchmarks/bench_clone.py
+    python benchmarks/bench_clone.py --profiles landing media --latency 30 --bandwidth 4096 --repeat 5
+    python benchmarks/bench_clone.py --output before.json
+    python benchmarks/bench_clone.py --compare before.json -- -j 16
+    python benchmarks/bench_clone.py --error-rate 0.1 --drop-rate 0.05 --max-concurrency 4 -- -j 16 --per-host 16
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import PROFILES, FixtureServer, add_fault_arguments, fault_options, generate_site
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+CLI = REPO_DIR / 'web_cloner.py'
+METRICS = ('wall', 'cpu', 'peak_rss_mb', 'requests_per_sec')
+
+# ru_maxrss của process con tính cả image của process đã fork ra nó (trước exec), nên clone không
+# được fork trực tiếp từ process benchmark (đang giữ cả site fixture trong RAM). Launcher nhỏ này
+# spawn clone, chờ và in rusage của nó.
+LAUNCHER = """
+import os, sys
+pid = os.posix_spawn(sys.argv[1], sys.argv[1:], os.environ,
+                     file_actions=[(os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0)])
+_, status, usage = os.wait4(pid, 0)
+print(os.waitstatus_to_exitcode(status), usage.ru_utime + usage.ru_stime, usage.ru_maxrss)
+"""
+
+
+def run_clone(command):
+    """Chạy một lần clone. Trả về (exit code, wall, cpu, peak RSS MB); cpu/RSS là None nếu
+    nền tảng không hỗ trợ os.posix_spawn/os.wait4 (Windows)"""
+    started = time.perf_counter()
+    if not hasattr(os, 'wait4') or not hasattr(os, 'posix_spawn'):
+        code = subprocess.call(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return code, time.perf_counter() - started, None, None
+    
+    output = subprocess.run([sys.executable, '-S', '-c', LAUNCHER] + command, cwd=REPO_DIR,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    wall = time.perf_counter() - started
+    code, cpu, maxrss = output.split()
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    rss = int(maxrss) / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return int(code), wall, float(cpu), rss
+
+
+def bench_profile(name, args, extra_args):
+    """Benchmark một profile, trả về dict kết quả (median qua các lần chạy)"""
+    server = FixtureServer(latency=args.latency / 1000, bandwidth=args.bandwidth * 1024 or None,
+                           **fault_options(args))
+    server.files = generate_site(f'127.0.0.1:{server.port}', f'localhost:{server.port}',
+                                 seed=args.seed, **PROFILES[name])
+    server.start()
+    site_bytes = sum(len(body) for body in server.files.values())
+    runs = []
+    try:
+        for _ in range(args.repeat):
+            output_dir = tempfile.mkdtemp(prefix=f'bench_clone_{name}_')
+            command = [sys.executable, str(CLI), f'http://127.0.0.1:{server.port}/index.html',
+                       '-o', output_dir, '-d', str(args.depth)]
+            if not args.plain:
+                # Tài nguyên ở localhost được xử lý như CDN (tải về, sửa URL)
+                command += ['--cdn-domain', 'localhost']
+            command += extra_args
+            server.reset_counters()
+            try:
+                code, wall, cpu, rss = run_clone(command)
+                files = sum(1 for path in Path(output_dir).rglob('*') if path.is_file())
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+            if code != 0:
+                print(f"  ! {name}: clone exit code {code}")
+            runs.append({
+                'exit_code': code,
+                'wall': wall,
+                'cpu': cpu,
+                'peak_rss_mb': rss,
+                'requests': server.requests,
+                'faults': server.faults,
+                'bytes': server.bytes_sent,
+                'requests_per_sec': server.requests / wall if wall else 0.0,
+                'files': files,
+            })
+    finally:
+        server.stop()
+    
+    result = {
+        'profile': name,
+        'site_files': len(server.files),
+        'site_mb': site_bytes / 1024 / 1024,
+        'runs': runs,
+    }
+    for key in METRICS + ('requests', 'faults', 'files'):
+        values = [run[key] for run in runs if run[key] is not None]
+        result[key] = statistics.median(values) if values else None
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _fmt(value, spec):
+    return 'n/a' if value is None else format(value, spec)
+
+
+def _delta(value, base):
+    if value is None or not base:
+        return ''
+    return f" ({(value - base) / base * 100:+.1f}%)"
+
+
+def print_results(results, baseline=None):
+    base = {item['profile']: item for item in (baseline or {}).get('results', [])}
+    print(f"\n{'profile':<10} {'wall (s)':>18} {'cpu (s)':>18} {'peak RSS (MB)':>20} {'req/s':>18} "
+          f"{'requests':>9} {'faults':>7} {'files':>6}")
+    for item in results:
+        old = base.get(item['profile'], {})
+        print(f"{item['profile']:<10} "
+              f"{_fmt(item['wall'], '.2f') + _delta(item['wall'], old.get('wall')):>18} "
+              f"{_fmt(item['cpu'], '.2f') + _delta(item['cpu'], old.get('cpu')):>18} "
+              f"{_fmt(item['peak_rss_mb'], '.1f') + _delta(item['peak_rss_mb'], old.get('peak_rss_mb')):>20} "
+              f"{_fmt(item['requests_per_sec'], '.0f') + _delta(item['requests_per_sec'], old.get('requests_per_sec')):>18} "
+              f"{_fmt(item['requests'], '.0f'):>9} {_fmt(item.get('faults'), '.0f'):>7} "
+              f"{_fmt(item['files'], '.0f'):>6}")
+    if baseline:
+        print(f"\n(% so với {baseline.get('commit') or 'baseline'}; wall/cpu/RSS giảm là tốt, req/s tăng là tốt)")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark clone end-to-end trên fixture server local',
+        epilog='Tham số sau "--" được chuyển thẳng cho web_cloner.py (vd: -- -j 16 --per-host 8)')
+    parser.add_argument('--profiles', nargs='+', choices=sorted(PROFILES), default=['small', 'landing', 'multipage'],
+                        help='Các kịch bản cần chạy')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần chạy mỗi profile (lấy median)')
+    parser.add_argument('--latency', type=float, default=20, metavar='MS', help='Độ trễ mỗi request (ms)')
+    parser.add_argument('--bandwidth', type=int, default=0, metavar='KB/s',
+                        help='Băng thông mỗi kết nối, 0 = không giới hạn')
+    parser.add_argument('--depth', type=int, default=3, help='Độ sâu crawl (-d của web_cloner.py)')
+    parser.add_argument('--seed', type=int, default=0)
+    add_fault_arguments(parser)
+    parser.add_argument('--plain', action='store_true',
+                        help='Không truyền --cdn-domain (để chạy với commit cũ chưa có tùy chọn này)')
+    parser.add_argument('--output', metavar='FILE', help='Lưu kết quả ra JSON')
+    parser.add_argument('--compare', metavar='FILE', help='So sánh với kết quả JSON của lần chạy trước')
+    argv = sys.argv[1:]
+    extra_args = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, extra_args = argv[:split], argv[split + 1:]
+    args = parser.parse_args(argv)
+    
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    
+    results = []
+    for name in args.profiles:
+        print(f"Benchmark '{name}' ({args.repeat} lần, latency {args.latency:g} ms, "
+              f"bandwidth {args.bandwidth or 'không giới hạn'} KB/s)...")
+        results.append(bench_profile(name, args, extra_args))
+    
+    print_results(results, baseline)
+    
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'settings': {
+                'latency_ms': args.latency,
+                'bandwidth_kbps': args.bandwidth,
+                'depth': args.depth,
+                'seed': args.seed,
+                'faults': fault_options(args),
+                'repeat': args.repeat,
+                'cli_args': extra_args,
+            },
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nĐã lưu kết quả: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
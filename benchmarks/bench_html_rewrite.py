@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark rewrite HTML của WebsiteCloner trên một trang LadiPage-like cỡ lớn (không cần mạng)
+
+So sánh chi phí duyệt cây: ~15 lượt find_all riêng lẻ (cách làm cũ) với scan_html
+(duyệt một lần rồi dispatch theo tag/thuộc tính), và đo toàn bộ rewrite_html.
+
+Chạy:
+    python benchmarks/bench_html_rewrite.py
+    python benchmarks/bench_html_rewrite.py --sections 3000 --repeat 5
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from web_cloner import WebsiteCloner
+
+BASE_URL = 'https://example-landing.test/'
+
+
+def generate_page(sections):
+    """Sinh HTML giống landing page LadiPage với `sections` khối nội dung"""
+    head = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        '<link rel="dns-prefetch" href="//w.ladicdn.com">',
+        '<link rel="preconnect" href="https://fonts.googleapis.com">',
+        '<link rel="preload" href="https://w.ladicdn.com/v2/source/ladipage.min.js" as="script">',
+        '<link rel="stylesheet" href="https://w.ladicdn.com/v2/source/ladipage.min.css">',
+        '<link rel="icon" href="https://w.ladicdn.com/s/favicon.png">',
+        '<style id="style_page">',
+    ]
+    for i in range(sections // 10 + 1):
+        head.append(f'#SECTION{i}{{background-image:url("https://w.ladicdn.com/s/bg{i}.jpg")}}')
+    head.append('</style><script src="https://w.ladicdn.com/v2/source/ladipage.vi.min.js"></script></head>')
+    
+    body = ['<body><div class="ladi-wraper">']
+    for i in range(sections):
+        body.append(
+            f'<div id="SECTION{i}" class="ladi-section"><div class="ladi-section-background" '
+            f'style="background-image:url(\'https://w.ladicdn.com/s/sec{i}.png\')"></div>'
+            f'<div class="ladi-container"><div id="HEADLINE{i}" class="ladi-element">'
+            f'<h3 class="ladi-headline">Tiêu đề {i}</h3></div>'
+            f'<div id="IMAGE{i}" class="ladi-element"><div class="ladi-image">'
+            f'<img src="https://w.ladicdn.com/s/img{i}.jpg" '
+            f'srcset="https://w.ladicdn.com/s/img{i}_400.jpg 400w, https://w.ladicdn.com/s/img{i}_800.jpg 800w">'
+            f'</div></div>'
+            f'<div id="BUTTON{i}" class="ladi-element"><a href="#POPUP{i}" class="ladi-button">'
+            f'<span class="ladi-button-text">Đăng ký</span></a></div>'
+            f'<svg class="ladi-icon"><use xlink:href="#shape_{i % 20}"></use></svg>'
+            f'<p class="ladi-paragraph">{"Nội dung mô tả sản phẩm. " * 4}</p></div></div>'
+        )
+        if i % 50 == 0:
+            body.append(f'<video src="https://w.ladicdn.com/s/clip{i}.mp4"></video>')
+    body.append('</div><script>window.ladi_viewport = function(){ var img = '
+                '"https://w.ladicdn.com/s/lazy.png"; var cdn = "https://w.ladicdn.com/"; };</script>')
+    body.append('</body></html>')
+    return '\n'.join(head + body)
+
+
+class OfflineCloner(WebsiteCloner):
+    """WebsiteCloner không dùng mạng: mỗi URL được gán một đường dẫn local giả"""
+    
+    def download_resource(self, url, is_main_page=False, page_path=None):
+        if url not in self.url_mapping:
+            resource_type = self.get_resource_type(url)
+            ext = os.path.splitext(url)[1] or '.bin'
+            name = hashlib.md5(url.encode()).hexdigest()[:10] + ext
+            self.url_mapping[url] = self.output_dir / resource_type / name
+            self.downloaded_urls.add(url)
+        return self.url_mapping[url]
+    
+    def process_css(self, css_path, original_url):
+        return
+
+
+def legacy_traversal(soup):
+    """Các lượt find_all riêng lẻ như process_html trước đây"""
+    soup.find_all('link', rel='dns-prefetch')
+    soup.find_all('link', rel='preconnect')
+    soup.find_all('link', rel='preload')
+    soup.find_all('style')
+    soup.find_all('link', rel='stylesheet')
+    soup.find_all('script', src=True)
+    soup.find_all('img', src=True)
+    soup.find_all('img', srcset=True)
+    soup.find_all(style=True)
+    for tag in soup.find_all(['video', 'audio']):
+        tag.find_all('source', src=True)
+    soup.find_all('link', rel=lambda x: x and 'icon' in str(x).lower())
+    soup.find_all(['image', 'use'])
+    soup.find_all('a', href=True)
+    soup.find_all('script')
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark rewrite HTML (single-pass vs multi-pass)')
+    parser.add_argument('--sections', type=int, default=2000, help='Số section trong trang (mặc định: 2000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần lặp, lấy kết quả tốt nhất (mặc định: 3)')
+    args = parser.parse_args()
+    
+    html = generate_page(args.sections)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cloner = OfflineCloner(BASE_URL, tmp, max_depth=0, jobs=1, log_callback=lambda message: None)
+        soup = BeautifulSoup(html, 'html.parser')
+        nodes = len(soup.find_all(True))
+        
+        print(f"Page size: {len(html) / 1024 / 1024:.2f} MB, {nodes} elements")
+        
+        legacy = best_of(args.repeat, lambda: legacy_traversal(soup))
+        single = best_of(args.repeat, lambda: cloner.scan_html(soup))
+        print(f"Traversal  multi-pass find_all: {legacy * 1000:8.1f} ms")
+        print(f"Traversal  single-pass scan   : {single * 1000:8.1f} ms  ({legacy / single:.1f}x faster)")
+        
+        html_path = Path(tmp) / 'index.html'
+        
+        def rewrite():
+            page = BeautifulSoup(html, 'html.parser')
+            cloner.rewrite_html(page, html_path, BASE_URL)
+        
+        parse = best_of(args.repeat, lambda: BeautifulSoup(html, 'html.parser'))
+        total = best_of(args.repeat, rewrite)
+        print(f"Parse (html.parser)           : {parse * 1000:8.1f} ms")
+        print(f"Full rewrite_html (incl parse): {total * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
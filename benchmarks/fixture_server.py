@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Fixture server cho benchmark: sinh website LadiPage-like (tất định theo seed) và phục vụ qua HTTP local
+
+Trang HTML nằm ở host 127.0.0.1, tài nguyên "CDN" ở host localhost (cùng server), để chạy
+được cả nhánh xử lý CDN khi clone với --cdn-domain localhost. Server hỗ trợ HEAD, Range
+(206) và ETag, có thể giả lập độ trễ mỗi request và giới hạn băng thông mỗi kết nối, cùng các
+lỗi tạm thời (503 / 429 kèm Retry-After, đứt kết nối giữa chừng) để kiểm tra retry và điều tốc.
+
+Chạy riêng để thử bằng tay:
+    python benchmarks/fixture_server.py --profile landing --port 8000 --latency 20 --bandwidth 2048
+    python benchmarks/fixture_server.py --error-rate 0.1 --drop-rate 0.05 --max-concurrency 4
+"""
+
+import argparse
+import hashlib
+import mimetypes
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Các kịch bản chuẩn: giữ nguyên tham số để kết quả so sánh được giữa các commit
+PROFILES = {
+    # Landing page nhỏ
+    'small': dict(pages=1, sections=20, srcset=2, css_depth=1, media=0, media_mb=0),
+    # Landing page LadiPage điển hình: nhiều ảnh, srcset dày, CSS @import lồng nhau
+    'landing': dict(pages=1, sections=300, srcset=4, css_depth=3, media=0, media_mb=0),
+    # Nhiều trang dùng chung tài nguyên (crawl theo depth)
+    'multipage': dict(pages=20, sections=40, srcset=2, css_depth=2, media=0, media_mb=0),
+    # Trang có video lớn (tải theo Range)
+    'media': dict(pages=1, sections=10, srcset=2, css_depth=1, media=2, media_mb=24),
+}
+
+
+def asset_bytes(path, size, prefix=b''):
+    """Nội dung tất định, khác nhau theo path (để dedup theo nội dung không gộp file)"""
+    seed = hashlib.sha256(path.encode()).digest()
+    body = prefix + path.encode() + b'\n'
+    return (body + seed * (size // len(seed) + 1))[:max(size, len(body))]
+
+
+def generate_site(host, cdn_host, pages=1, sections=100, srcset=3, css_depth=2, media=0, media_mb=16,
+                  seed=0):
+    """Sinh website: trả về dict path -> bytes.
+    
+    host/cdn_host: 'ip:port' của trang và của CDN. Mỗi section có ảnh (src + srcset),
+    background inline và một icon; CSS chính @import lồng css_depth tầng, mỗi tầng có
+    font và ảnh nền; JS bundle chứa URL ảnh lazy-load trên CDN.
+    """
+    rng = random.Random(seed)
+    cdn = f'http://{cdn_host}'
+    files = {}
+    
+    def asset(path, low, high, prefix=b''):
+        files[path] = asset_bytes(path, rng.randint(low, high), prefix)
+        return path
+    
+    # CSS: main.css -> nested1.css -> ... -> nested{css_depth}.css
+    for level in range(css_depth, -1, -1):
+        name = 'main.css' if level == 0 else f'nested{level}.css'
+        rules = []
+        if level < css_depth:
+            rules.append(f'@import "nested{level + 1}.css";')
+        for i in range(10):
+            asset(f'/cdn/images/css{level}_{i}.jpg', 4000, 30000, b'\xff\xd8\xff')
+            rules.append(f'.bg{level}_{i}{{background:url(../images/css{level}_{i}.jpg) no-repeat}}')
+        asset(f'/cdn/fonts/font{level}.woff2', 20000, 60000, b'wOF2')
+        rules.append(f'@font-face{{font-family:F{level};src:url("../fonts/font{level}.woff2") format("woff2")}}')
+        rules.append('.ladi-section{position:relative;width:100%}' * 20)
+        files[f'/cdn/css/{name}'] = '\n'.join(rules).encode()
+    
+    # JS bundle với URL ảnh lazy-load
+    lazy = [asset(f'/cdn/images/lazy{i}.png', 2000, 20000, b'\x89PNG') for i in range(20)]
+    js = ['window.LadiPageScript=window.LadiPageScript||{};']
+    js.extend(f'LadiPageScript.lazy{i}="{cdn}{path}";' for i, path in enumerate(lazy))
+    js.append('function ladi_run(){for(var i=0;i<100;i++){/* runtime */}}' * 200)
+    files['/cdn/js/ladipage.min.js'] = '\n'.join(js).encode()
+    
+    # Ảnh dùng chung giữa các trang
+    shared = [asset(f'/cdn/images/shared{i}.jpg', 5000, 80000, b'\xff\xd8\xff') for i in range(sections)]
+    
+    for page in range(pages):
+        name = 'index.html' if page == 0 else f'page{page}.html'
+        html = [
+            '<!DOCTYPE html><html><head><meta charset="utf-8">',
+            f'<link rel="dns-prefetch" href="//{cdn_host}">',
+            '<link rel="preconnect" href="https://fonts.googleapis.com">',
+            f'<link rel="stylesheet" href="{cdn}/cdn/css/main.css">',
+            f'<link rel="icon" href="{cdn}{asset("/cdn/images/favicon.png", 500, 2000, b"PNG")}">',
+            f'<script src="{cdn}/cdn/js/ladipage.min.js"></script>',
+            '<style id="style_page">',
+        ]
+        for i in range(0, sections, 10):
+            path = asset(f'/cdn/images/p{page}_bg{i}.jpg', 10000, 60000, b'\xff\xd8\xff')
+            html.append(f'#SECTION{i}{{background-image:url("{cdn}{path}")}}')
+        html.append('</style></head><body><div class="ladi-wraper">')
+        
+        for i in range(sections):
+            image = asset(f'/cdn/images/p{page}_img{i}.jpg', 5000, 120000, b'\xff\xd8\xff')
+            candidates = ', '.join(
+                f'{cdn}{asset(f"/cdn/images/p{page}_img{i}_{w}.jpg", 3000, 60000, b"JPG")} {w}w'
+                for w in (400 * (k + 1) for k in range(srcset)))
+            html.append(
+                f'<div id="SECTION{i}" class="ladi-section">'
+                f'<div class="ladi-section-background" style="background-image:url(\'{cdn}{shared[i]}\')"></div>'
+                f'<div class="ladi-image"><img src="{cdn}{image}" srcset="{candidates}"></div>'
+                f'<h3 class="ladi-headline">Tiêu đề {i}</h3>'
+                f'<p class="ladi-paragraph">{"Nội dung mô tả sản phẩm. " * rng.randint(2, 8)}</p></div>')
+        
+        for i in range(media):
+            path = f'/cdn/media/clip{i}.mp4'
+            files[path] = asset_bytes(path, media_mb * 1024 * 1024, b'\x00\x00\x00\x18ftypmp42')
+            html.append(f'<video controls><source src="{cdn}{path}" type="video/mp4"></video>')
+        
+        # Link tới các trang khác (crawl)
+        html.extend(f'<a href="page{other}.html">Trang {other}</a>' for other in range(1, pages) if other != page)
+        html.append('</div></body></html>')
+        files[f'/{name}'] = '\n'.join(html).encode()
+    
+    return files
+
+
+class FixtureServer:
+    """HTTP server chạy trong thread nền, phục vụ dict path -> bytes.
+    
+    latency: độ trễ (giây) trước mỗi response; bandwidth: byte/giây mỗi kết nối (None = không giới hạn).
+    Lỗi giả lập (tất định theo seed): error_rate là tỉ lệ GET trả về 503, drop_rate là tỉ lệ response
+    bị cắt giữa body; quá max_concurrency request đồng thời thì trả về 429. 503/429 kèm Retry-After
+    (giây, None = không gửi). Đếm số request, số lỗi đã giả lập và số byte đã gửi.
+    """
+    
+    CHUNK = 16 * 1024
+    
+    def __init__(self, files=None, host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                 error_rate=0.0, drop_rate=0.0, max_concurrency=None, retry_after=1, seed=0):
+        self.files = files or {}
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        self.requests = 0
+        self.faults = 0
+        self.active = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._etags = {}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+    
+    def etag(self, path):
+        tag = self._etags.get(path)
+        if tag is None:
+            tag = self._etags[path] = '"%s"' % hashlib.md5(self.files[path]).hexdigest()
+        return tag
+    
+    def set_file(self, path, body):
+        """Thêm / thay nội dung một file (ETag được tính lại theo nội dung mới)"""
+        with self._lock:
+            self.files[path] = body
+            self._etags.pop(path, None)
+    
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.faults = 0
+            self.bytes_sent = 0
+    
+    def _fault(self, head):
+        """Chọn lỗi giả lập cho request vừa nhận: 429 / 503 / 'drop' hoặc None (đang giữ lock)"""
+        if self.max_concurrency is not None and self.active > self.max_concurrency:
+            return 429
+        if head:
+            return None
+        roll = self._random.random()
+        if roll < self.error_rate:
+            return 503
+        if roll < self.error_rate + self.drop_rate:
+            return 'drop'
+        return None
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def do_HEAD(self):
+                self._respond(head=True)
+            
+            def do_GET(self):
+                self._respond(head=False)
+            
+            def _respond(self, head):
+                with server._lock:
+                    server.requests += 1
+                    server.active += 1
+                    fault = server._fault(head)
+                    if fault is not None:
+                        server.faults += 1
+                try:
+                    self._send(head, fault)
+                finally:
+                    with server._lock:
+                        server.active -= 1
+            
+            def _send(self, head, fault):
+                if server.latency:
+                    time.sleep(server.latency)
+                
+                if fault in (429, 503):
+                    self.send_response(fault)
+                    if server.retry_after is not None:
+                        self.send_header('Retry-After', str(server.retry_after))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                
+                path = self.path.split('?', 1)[0].split('#', 1)[0]
+                body = server.files.get(path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                
+                status, start, end = 200, 0, len(body)
+                match = re.match(r'bytes=(\d*)-(\d*)$', self.headers.get('Range', ''))
+                if_range = self.headers.get('If-Range')
+                if match and (if_range is None or if_range == server.etag(path)):
+                    first, last = match.groups()
+                    if first:
+                        start, end = int(first), min(int(last) + 1 if last else len(body), len(body))
+                    else:
+                        start = max(0, len(body) - int(last))
+                    status = 206
+                
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(end - start))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('ETag', server.etag(path))
+                if status == 206:
+                    self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(body)}')
+                self.end_headers()
+                if head:
+                    return
+                
+                view = memoryview(body)[start:end]
+                if fault == 'drop':
+                    # Đứt kết nối sau nửa body (client nhận thiếu so với Content-Length)
+                    view = view[:len(view) // 2]
+                    self.close_connection = True
+                for offset in range(0, len(view), server.CHUNK):
+                    chunk = view[offset:offset + server.CHUNK]
+                    try:
+                        self.wfile.write(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        return
+                    with server._lock:
+                        server.bytes_sent += len(chunk)
+                    if server.bandwidth:
+                        time.sleep(len(chunk) / server.bandwidth)
+        
+        return Handler
+    
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def add_fault_arguments(parser):
+    """Tùy chọn giả lập lỗi (dùng chung cho fixture_server và bench_clone)"""
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Tỉ lệ GET trả về 503 (0-1)')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Tỉ lệ response bị đứt giữa body (0-1)')
+    parser.add_argument('--max-concurrency', type=int, default=None, metavar='N',
+                        help='Trả về 429 khi có hơn N request đồng thời')
+    parser.add_argument('--retry-after', type=int, default=1, metavar='SECONDS',
+                        help='Giá trị Retry-After của 503/429, âm = không gửi header')
+
+
+def fault_options(args):
+    return dict(error_rate=args.error_rate, drop_rate=args.drop_rate, max_concurrency=args.max_concurrency,
+                retry_after=args.retry_after if args.retry_after >= 0 else None, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Phục vụ website LadiPage-like tổng hợp để test/benchmark')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='landing')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, metavar='MS', help='Độ trễ mỗi request (ms)')
+    parser.add_argument('--bandwidth', type=int, default=0, metavar='KB/s',
+                        help='Băng thông mỗi kết nối, 0 = không giới hạn')
+    parser.add_argument('--seed', type=int, default=0)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    
+    server = FixtureServer(port=args.port, latency=args.latency / 1000,
+                           bandwidth=args.bandwidth * 1024 or None, **fault_options(args))
+    server.files = generate_site(f'127.0.0.1:{server.port}', f'localhost:{server.port}',
+                                 seed=args.seed, **PROFILES[args.profile])
+    total = sum(len(body) for body in server.files.values())
+    print(f"Serving profile '{args.profile}': {len(server.files)} files, {total / 1024 / 1024:.1f} MB")
+    print(f"  http://127.0.0.1:{server.port}/index.html  (CDN: localhost:{server.port})")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Test HtmlTokenStream (rewrite HTML streaming): token không được chọn phải ghi ra nguyên văn
+
+Chạy: python -m pytest tests   (hoặc python -m unittest discover tests)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from web_cloner import HtmlTokenStream
+
+
+def rewrite(html, chunk_size=7):
+    """Chạy HtmlTokenStream theo từng chunk nhỏ; element <style> được bọc trong [...]"""
+    output = []
+    parser = HtmlTokenStream(lambda tag, attrs: tag == 'style', lambda fragment, name, whole: f'[{fragment}]',
+                             lambda text, markup: output.append(text), buffered=('style',))
+    for offset in range(0, len(html), chunk_size):
+        parser.feed(html[offset:offset + chunk_size])
+    parser.close()
+    return ''.join(output)
+
+
+class HtmlTokenStreamTest(unittest.TestCase):
+    
+    def test_end_tags_keep_source_case(self):
+        html = ('<svg><defs><linearGradient id="g"><stop offset="0"/></linearGradient ></defs>'
+                '<foreignObject></foreignObject></svg><math><annotation-xml></annotation-xml></math>'
+                '<script>var s = "</div>";</SCRIPT><P>text</P>')
+        self.assertEqual(rewrite(html), html)
+    
+    def test_buffered_element_keeps_end_tag(self):
+        html = '<div><STYLE>a { color: red }</STYLE></div>'
+        self.assertEqual(rewrite(html), '<div>[<STYLE>a { color: red }</STYLE>]</div>')
+
+
+if __name__ == '__main__':
+    unittest.main()
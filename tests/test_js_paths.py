@@ -0,0 +1,67 @@
+"""
+Test đường dẫn thay vào file JS ngoài: tài nguyên JS nạp lúc chạy phải đúng với cả trang trong thư mục con
+
+Chạy: python -m pytest tests   (hoặc python -m unittest discover tests)
+"""
+
+import posixpath
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(REPO_DIR / 'benchmarks'))
+
+from fixture_server import FixtureServer
+from web_cloner import WebsiteCloner
+
+
+class JsAssetPathTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.server = FixtureServer().start()
+        cdn = f'http://localhost:{self.server.port}'
+        script = f'<script src="{cdn}/static/lazy.js"></script>'.encode()
+        self.server.files = {
+            '/index.html': b'<html><body><a href="/sub/page/index.html">page</a>' + script + b'</body></html>',
+            '/sub/page/index.html': b'<html><body>' + script + b'</body></html>',
+            '/static/lazy.js': f'var image = "{cdn}/assets/x.png", root = "{cdn}";'.encode(),
+            '/assets/x.png': b'\x89PNG\r\n\x1a\n' + b'x' * 64,
+        }
+        self.output_dir = Path(tempfile.mkdtemp(prefix='test_js_paths_'))
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+    
+    def clone(self, max_depth):
+        cloner = WebsiteCloner(f'http://127.0.0.1:{self.server.port}/index.html', self.output_dir, max_depth,
+                               resume=False, external_cdn_domains=['localhost'], log_callback=lambda message: None)
+        self.assertIsNotNone(cloner.clone())
+        return (self.output_dir / 'js' / 'lazy.js').read_text(encoding='utf-8')
+    
+    def resolve(self, page, url):
+        """File trong output mà trình duyệt nạp khi JS của trang page yêu cầu url"""
+        base = '/' if url.startswith('/') else '/' + posixpath.dirname(page) + '/'
+        return self.output_dir / posixpath.normpath(base + url).lstrip('/')
+    
+    def test_depth_one_page_uses_root_absolute_paths(self):
+        js = self.clone(1)
+        self.assertIn('"/images/x.png"', js)
+        self.assertIn('root = ""', js)
+        self.assertTrue((self.output_dir / 'sub' / 'page' / 'index.html').is_file())
+        for page in ('index.html', 'sub/page/index.html'):
+            self.assertTrue(self.resolve(page, '/images/x.png').is_file(), page)
+    
+    def test_single_page_uses_relative_paths(self):
+        js = self.clone(0)
+        self.assertIn('"images/x.png"', js)
+        self.assertIn('root = "."', js)
+        self.assertTrue(self.resolve('index.html', 'images/x.png').is_file())
+
+
+if __name__ == '__main__':
+    unittest.main()
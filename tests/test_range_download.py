@@ -0,0 +1,104 @@
+"""
+Test tải file media lớn theo Range: segment bị đứt giữa chừng, lần chạy sau tiếp tục từ file .part
+
+Chạy: python -m pytest tests   (hoặc python -m unittest discover tests)
+"""
+
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import urllib3
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(REPO_DIR / 'benchmarks'))
+
+from fixture_server import FixtureServer, asset_bytes
+from web_cloner import WebsiteCloner
+
+MEDIA_PATH = '/media/clip.mp4'
+MEDIA_SIZE = 6 * 1024 * 1024 + 12345  # Không chia hết cho số segment
+
+
+class RangeResumeTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.body = asset_bytes(MEDIA_PATH, MEDIA_SIZE, b'\x00\x00\x00\x18ftypmp42')
+        self.server = FixtureServer({MEDIA_PATH: self.body}).start()
+        self.url = f'http://127.0.0.1:{self.server.port}{MEDIA_PATH}'
+        self.output_dir = Path(tempfile.mkdtemp(prefix='test_range_'))
+        self.logs = []
+    
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+    
+    def make_cloner(self):
+        return WebsiteCloner(f'http://127.0.0.1:{self.server.port}/', self.output_dir, resume=False,
+                             range_threshold=1024 * 1024, range_segments=4,
+                             log_callback=self.logs.append)
+    
+    def partial_files(self):
+        return sorted(path.suffix for path in (self.output_dir / '.partial').iterdir())
+    
+    def test_resume_after_dropped_segments(self):
+        dest_path = self.output_dir / 'clip.mp4'
+        
+        # Lần 1: mọi response GET bị cắt giữa body -> hết lượt retry, giữ lại .part + trạng thái
+        self.server.drop_rate = 1.0
+        cloner = self.make_cloner()
+        with self.assertRaises(urllib3.exceptions.HTTPError):
+            cloner.fetch_ranged(self.url, dest_path)
+        cloner.close()
+        self.assertFalse(dest_path.exists())
+        self.assertEqual(self.partial_files(), ['.json', '.part'])
+        
+        # Trạng thái chỉ tính byte đã thực sự nằm trong file .part
+        state_path = next((self.output_dir / '.partial').glob('*.json'))
+        segments = json.loads(state_path.read_text(encoding='utf-8'))['segments']
+        part = state_path.with_suffix('.part').read_bytes()
+        self.assertGreater(sum(done for _, _, done in segments), 0)
+        for start, _, done in segments:
+            self.assertEqual(part[start:start + done], self.body[start:start + done])
+        
+        # Lần 2: server hết lỗi -> chỉ tải phần còn thiếu của từng segment
+        self.server.drop_rate = 0.0
+        self.server.reset_counters()
+        self.logs.clear()
+        cloner = self.make_cloner()
+        content_type = cloner.fetch_ranged(self.url, dest_path)
+        cloner.close()
+        
+        self.assertEqual(content_type, 'video/mp4')
+        self.assertTrue(any('Resuming' in message for message in self.logs))
+        self.assertLess(self.server.bytes_sent, MEDIA_SIZE // 2)
+        self.assertEqual(dest_path.read_bytes(), self.body)
+        self.assertFalse((self.output_dir / '.partial').exists())
+    
+    def test_changed_file_restarts_download(self):
+        dest_path = self.output_dir / 'clip.mp4'
+        self.server.drop_rate = 1.0
+        cloner = self.make_cloner()
+        with self.assertRaises(urllib3.exceptions.HTTPError):
+            cloner.fetch_ranged(self.url, dest_path)
+        cloner.close()
+        
+        # File trên server đổi (ETag khác): trạng thái cũ bị bỏ, không ghép byte cũ với byte mới
+        self.body = self.body[::-1]
+        self.server.set_file(MEDIA_PATH, self.body)
+        self.server.drop_rate = 0.0
+        self.logs.clear()
+        cloner = self.make_cloner()
+        cloner.fetch_ranged(self.url, dest_path)
+        cloner.close()
+        
+        self.assertFalse(any('Resuming' in message for message in self.logs))
+        self.assertEqual(dest_path.read_bytes(), self.body)
+
+
+if __name__ == '__main__':
+    unittest.main()
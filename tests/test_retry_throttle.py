@@ -0,0 +1,136 @@
+"""
+Test retry lỗi tạm thời và điều tốc theo host (HostThrottle) khi server trả 503 / 429 / đứt kết nối
+
+Chạy: python -m pytest tests   (hoặc python -m unittest discover tests)
+"""
+
+import hashlib
+import json
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(REPO_DIR / 'benchmarks'))
+
+from fixture_server import PROFILES, FixtureServer, generate_site
+from web_cloner import CloneJournal, HostThrottle, WebsiteCloner
+
+
+def tree_digests(root):
+    """Đường dẫn tương đối -> md5 của các file output (bỏ journal / metrics thay đổi theo mỗi lần chạy)"""
+    return {str(path.relative_to(root)): hashlib.md5(path.read_bytes()).hexdigest()
+            for path in Path(root).rglob('*')
+            if path.is_file() and path.name not in (CloneJournal.FILENAME, WebsiteCloner.METRICS_FILENAME)}
+
+
+class FakeClock:
+    """Đồng hồ điều khiển bằng tay cho HostThrottle (test không phụ thuộc thời gian thực)"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+    
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class HostThrottleTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.clock = FakeClock()
+    
+    def test_rate_limit_halves_concurrency(self):
+        throttle = HostThrottle(8, clock=self.clock)
+        self.assertTrue(throttle.record(0.01, rate_limited=True))
+        self.assertEqual(int(throttle.limit), 4)
+        # Nhiều 429 cùng lúc chỉ tính là một tín hiệu
+        self.assertFalse(throttle.record(0.01, rate_limited=True))
+        self.assertEqual(int(throttle.limit), 4)
+        self.clock.advance(HostThrottle.DECREASE_INTERVAL)
+        self.assertTrue(throttle.record(0.01, rate_limited=True))
+        self.assertEqual(int(throttle.limit), 2)
+        self.assertEqual(throttle.decreases, 2)
+    
+    def test_sporadic_errors_keep_concurrency(self):
+        throttle = HostThrottle(8, clock=self.clock)
+        throttle.record(failed=True)
+        for _ in range(20):
+            self.clock.advance(0.1)
+            throttle.record(0.01)
+        self.assertEqual(int(throttle.limit), 8)
+        self.assertEqual(throttle.decreases, 0)
+    
+    def test_recovers_after_quiet_period(self):
+        throttle = HostThrottle(8, clock=self.clock)
+        throttle.record(0.01, rate_limited=True)
+        self.clock.advance(HostThrottle.RECOVERY_INTERVAL - 0.1)
+        throttle.record(0.01)
+        self.assertEqual(int(throttle.limit), 4)
+        self.clock.advance(0.1)
+        throttle.record(0.01)
+        self.assertEqual(int(throttle.limit), 5)
+        # Tăng tối đa +1 mỗi INCREASE_INTERVAL
+        throttle.record(0.01)
+        self.assertEqual(int(throttle.limit), 5)
+        self.clock.advance(HostThrottle.INCREASE_INTERVAL)
+        throttle.record(0.01)
+        self.assertEqual(int(throttle.limit), 6)
+    
+    def test_block_delays_new_slots(self):
+        throttle = HostThrottle(4, clock=self.clock)
+        throttle.block(0.3)
+        self.assertAlmostEqual(throttle.try_acquire(), 0.3)
+        self.clock.advance(0.3)
+        self.assertEqual(throttle.try_acquire(), 0)
+        self.assertEqual(throttle.active, 1)
+
+
+class FaultyServerCloneTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.server = FixtureServer(seed=1).start()
+        self.server.files = generate_site(f'127.0.0.1:{self.server.port}', f'localhost:{self.server.port}',
+                                          **PROFILES['small'])
+        self.output_dirs = []
+    
+    def tearDown(self):
+        self.server.stop()
+        for output_dir in self.output_dirs:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    
+    def clone(self):
+        output_dir = tempfile.mkdtemp(prefix='test_retry_')
+        self.output_dirs.append(output_dir)
+        cloner = WebsiteCloner(f'http://127.0.0.1:{self.server.port}/index.html', output_dir, 0,
+                               jobs=8, per_host_limit=8, retries=6, resume=False,
+                               external_cdn_domains=['localhost'], log_callback=lambda message: None)
+        self.assertIsNotNone(cloner.clone())
+        with open(Path(output_dir) / WebsiteCloner.METRICS_FILENAME, 'r', encoding='utf-8') as f:
+            return cloner, json.load(f), tree_digests(output_dir)
+    
+    def test_clone_survives_transient_faults(self):
+        _, _, expected = self.clone()
+        
+        # 503 (không Retry-After để test chạy nhanh), response bị cắt giữa body, 429 khi quá 3 kết nối
+        self.server.error_rate = 0.1
+        self.server.drop_rate = 0.05
+        self.server.max_concurrency = 3
+        self.server.retry_after = None
+        self.server.reset_counters()
+        cloner, metrics, digests = self.clone()
+        
+        self.assertGreater(self.server.faults, 0)
+        self.assertEqual(metrics['totals']['failed'], 0)
+        self.assertEqual(digests, expected)
+        # 429 khi quá 3 kết nối: concurrency tới server phải được giảm ít nhất một lần
+        self.assertGreater(sum(slot.decreases for slot in cloner._host_slots.values()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Test serve mode (CloneServer): phục vụ file có sẵn, tải file thiếu từ origin một lần, nhớ 404
+
+Chạy: python -m pytest tests   (hoặc python -m unittest discover tests)
+"""
+
+import asyncio
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(REPO_DIR / 'benchmarks'))
+
+from fixture_server import FixtureServer
+from web_cloner import CloneJournal
+from web_cloner_serve import CloneServer, aiohttp
+
+
+@unittest.skipIf(aiohttp is None, "Serve mode cần aiohttp")
+class CloneServerTest(unittest.IsolatedAsyncioTestCase):
+    
+    async def asyncSetUp(self):
+        self.origin = FixtureServer({'/js/app.js': b'console.log(1)', '/index.html': b'<html>origin</html>'}).start()
+        self.output_dir = Path(tempfile.mkdtemp(prefix='test_serve_'))
+        (self.output_dir / 'index.html').write_text('<html>clone</html>', encoding='utf-8')
+        (self.output_dir / CloneJournal.FILENAME).write_text('', encoding='utf-8')
+        self.server = CloneServer(self.output_dir, origin=f'http://127.0.0.1:{self.origin.port}',
+                                  log_callback=lambda message: None)
+        host, port = await self.server.start('127.0.0.1', 0)
+        self.base = f'http://{host}:{port}'
+        self.http = aiohttp.ClientSession()
+    
+    async def asyncTearDown(self):
+        await self.http.close()
+        await self.server.stop()
+        self.origin.stop()
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+    
+    async def get(self, path):
+        async with self.http.get(self.base + path) as response:
+            return response.status, await response.read()
+    
+    async def test_serves_existing_file(self):
+        self.assertEqual(await self.get('/'), (200, b'<html>clone</html>'))
+        self.assertEqual(self.origin.requests, 0)
+    
+    async def test_concurrent_requests_fetch_once(self):
+        self.origin.latency = 0.2
+        results = await asyncio.gather(*(self.get('/js/app.js') for _ in range(8)))
+        
+        self.assertEqual(results, [(200, b'console.log(1)')] * 8)
+        self.assertEqual(self.origin.requests, 1)
+        self.assertEqual((self.output_dir / 'js' / 'app.js').read_bytes(), b'console.log(1)')
+        
+        # File đã tải được ghi vào journal / mapping: lần sau phục vụ từ đĩa
+        url = f'http://127.0.0.1:{self.origin.port}/js/app.js'
+        self.assertEqual(self.server.url_for_path['js/app.js'], url)
+        self.assertEqual(CloneJournal(self.output_dir).entries[url]['p'], 'js/app.js')
+        self.assertEqual(await self.get('/js/app.js'), (200, b'console.log(1)'))
+        self.assertEqual(self.origin.requests, 1)
+    
+    async def test_missing_file_is_remembered(self):
+        self.assertEqual((await self.get('/js/missing.js'))[0], 404)
+        self.assertEqual((await self.get('/js/missing.js'))[0], 404)
+        self.assertEqual(self.origin.requests, 1)
+        self.assertIn('js/missing.js', self.server.failed)
+    
+    async def test_transient_error_is_retried(self):
+        # 503 là lỗi tạm thời: không nhớ 404, request sau tải lại được
+        self.origin.error_rate = 1.0
+        self.assertEqual((await self.get('/js/app.js'))[0], 404)
+        self.assertNotIn('js/app.js', self.server.failed)
+        self.origin.error_rate = 0.0
+        self.assertEqual(await self.get('/js/app.js'), (200, b'console.log(1)'))
+    
+    async def test_rejects_paths_outside_root(self):
+        self.assertEqual(self.server.local_name('/../../etc/passwd'), 'etc/passwd')
+        self.assertEqual(self.server.local_name('/js/../../../index.html'), 'index.html')
+        self.assertIsNone(self.server.local_name(f'/{CloneJournal.FILENAME}'))
+        self.assertIsNone(self.server.local_name('/.staging/x.js'))
+        self.assertEqual((await self.get('/%2e%2e/%2e%2e/etc/passwd'))[0], 404)
+        self.assertEqual((await self.get(f'/{CloneJournal.FILENAME}'))[0], 404)
+        self.assertFalse((self.output_dir.parent / 'etc').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
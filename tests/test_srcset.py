@@ -0,0 +1,47 @@
+"""
+Test chọn ứng viên srcset (--srcset): xếp hạng theo kích thước trong cùng một loại descriptor
+
+Chạy: python -m pytest tests   (hoặc python -m unittest discover tests)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+from web_cloner import parse_srcset, parse_srcset_mode, select_srcset
+
+
+def select(srcset, spec):
+    return [candidate.url for candidate in select_srcset(parse_srcset(srcset), parse_srcset_mode(spec))]
+
+
+class SelectSrcsetTest(unittest.TestCase):
+    
+    def test_width_descriptors(self):
+        srcset = 'a.jpg 400w, b.jpg 800w, c.jpg 1600w'
+        self.assertEqual(select(srcset, 'largest'), ['c.jpg'])
+        self.assertEqual(select(srcset, '700w'), ['b.jpg'])
+        self.assertEqual(select(srcset, '2'), ['a.jpg', 'c.jpg'])
+        self.assertEqual(select(srcset, 'all'), ['a.jpg', 'b.jpg', 'c.jpg'])
+    
+    def test_mixed_descriptors_rank_widths_only(self):
+        # 3x không "lớn hơn" 800w: có w thì chỉ xếp hạng các ứng viên w
+        srcset = 'small.jpg 1x, medium.jpg 400w, large.jpg 800w, retina.jpg 3x'
+        self.assertEqual(select(srcset, 'largest'), ['large.jpg'])
+        self.assertEqual(select(srcset, '1'), ['large.jpg'])
+        self.assertEqual(select(srcset, '3'), ['medium.jpg', 'large.jpg'])
+        self.assertEqual(select(srcset, '300w'), ['medium.jpg'])
+        self.assertEqual(select(srcset, '2x'), ['retina.jpg'])
+    
+    def test_density_descriptors(self):
+        srcset = 'a.jpg, b.jpg 2x, c.jpg 3x'
+        self.assertEqual(select(srcset, 'largest'), ['c.jpg'])
+        self.assertEqual(select(srcset, '1.5x'), ['b.jpg'])
+        self.assertEqual(select(srcset, '800w'), ['c.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,71 +5,1715 @@ Tự động download và cập nhật đường dẫn để có thể chạy of
 """
 
 import os
+import gc
 import re
 import sys
 import hashlib
+import json
 import mimetypes
-from urllib.parse import urljoin, urlparse, unquote
+import random
+import shutil
+import sqlite3
+import threading
+import time
+import gzip
+import io
+import html
+import subprocess
+import tarfile
+import tempfile
+import zipfile
+import posixpath
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urljoin, urlparse, unquote, urldefrag
 from pathlib import Path
-from collections import deque
+from email.utils import parsedate_to_datetime
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from itertools import islice
 import argparse
+from functools import partial
+from html.parser import HTMLParser
 
 import requests
+import urllib3
 from bs4 import BeautifulSoup
 
+# Parser backend tùy chọn (xem PARSER_BACKENDS)
+try:
+    import lxml
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Thư viện tùy chọn cho bước tối ưu output (xem optimize_output)
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    from PIL import Image, features as pil_features
+except ImportError:
+    Image = pil_features = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Sự kiện tiến trình gửi tới progress_callback
+# kind: 'queued' | 'started' | 'bytes' | 'done' | 'failed'
+ProgressEvent = namedtuple('ProgressEvent', ['kind', 'url', 'bytes', 'total', 'path', 'error'],
+                           defaults=(0, None, None, None))
+
+# Mức log (cùng thang với module logging); log_handler nhận (level, message) nên UI
+# không cần đoán mức từ nội dung chuỗi
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'SUCCESS': 25, 'WARNING': 30, 'ERROR': 40}
+
+# Handler rewrite HTML: stage = bước xử lý, attr/match = điều kiện khớp tag
+HtmlHandler = namedtuple('HtmlHandler', ['stage', 'attr', 'match', 'rewrite', 'collect'])
+
+
+def file_digest(path):
+    """SHA-256 của nội dung file (đọc theo chunk)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Một tham chiếu trong CSS: ref = URL gốc, [start, end) = vị trí ref,
+# [token_start, token_end) = cả token url(...) / @import, is_import = ref là stylesheet @import
+CssRef = namedtuple('CssRef', ['ref', 'start', 'end', 'token_start', 'token_end', 'is_import'])
+
+
+def _css_url_token(prefix):
+    """Regex cho url("..."), url('...') và url(...) không quote (group prefix_dq/_sq/_bare)"""
+    return (r'url\(\s*(?:"(?P<%s_dq>[^"\\\n]*(?:\\.[^"\\\n]*)*)"'
+            r"|'(?P<%s_sq>[^'\\\n]*(?:\\.[^'\\\n]*)*)'"
+            r'|(?P<%s_bare>[^)"\'\s]*))\s*\)') % (prefix, prefix, prefix)
+
+
+# Token CSS cần quan tâm: comment, @import "...", @import url(...), url(...), chuỗi (bỏ qua)
+_CSS_TOKEN_RE = re.compile(
+    r'(?P<comment>/\*.*?(?:\*/|\Z))'
+    r'|(?P<import>@import)\s*(?:"(?P<import_dq>[^"\\\n]*(?:\\.[^"\\\n]*)*)"'
+    r"|'(?P<import_sq>[^'\\\n]*(?:\\.[^'\\\n]*)*)'"
+    r'|' + _css_url_token('import_url') + r')'
+    r'|' + _css_url_token('url') +
+    r'|"(?:[^"\\\n]|\\.)*"?'
+    r"|'(?:[^'\\\n]|\\.)*'?",
+    re.IGNORECASE | re.DOTALL)
+_CSS_REF_GROUPS = ('import_dq', 'import_sq', 'import_url_dq', 'import_url_sq', 'import_url_bare',
+                   'url_dq', 'url_sq', 'url_bare')
+
+
+def css_references(css_content):
+    """Tokenizer CSS một lượt (tuyến tính): trả về CssRef cho mỗi url(...) và @import.
+    
+    Comment và chuỗi được bỏ qua nên url() nằm trong comment/chuỗi không bị đụng tới;
+    data URI và url() rỗng cũng bị bỏ qua.
+    """
+    refs = []
+    for match in _CSS_TOKEN_RE.finditer(css_content):
+        for group in _CSS_REF_GROUPS:
+            ref = match.group(group)
+            if ref is None:
+                continue
+            stripped = ref.strip()
+            if stripped and not stripped.startswith('data:'):
+                start = match.start(group) + (len(ref) - len(ref.lstrip()))
+                refs.append(CssRef(stripped, start, start + len(stripped), match.start(), match.end(),
+                                   match.group('import') is not None))
+            break
+    return refs
+
+
+def splice_text(content, replacements):
+    """Thay các đoạn [start, end) bằng text mới trong một lượt (replacements theo thứ tự, không chồng nhau)"""
+    parts = []
+    last = 0
+    for start, end, text in replacements:
+        parts.append(content[last:start])
+        parts.append(text)
+        last = end
+    parts.append(content[last:])
+    return ''.join(parts)
+
+
+def rewrite_css(css_content, replacements, whole_token=False):
+    """Thay các CssRef bằng text mới trong một lượt. replacements: [(CssRef, text hoặc None)]
+    
+    whole_token=True: thay cả token url(...) thay vì chỉ phần URL bên trong (không dùng cho @import).
+    """
+    return splice_text(css_content, [
+        (ref.token_start, ref.token_end, text) if whole_token else (ref.start, ref.end, text)
+        for ref, text in replacements if text is not None
+    ])
+
+
+# URL tuyệt đối nằm trọn trong một chuỗi JS ("...", '...' hoặc `...`), kể cả dạng escape https:\/\/
+JsRef = namedtuple('JsRef', ['url', 'start', 'end', 'escaped'])
+_JS_URL_RE = re.compile(r'(["\'`])(https?:(?:\\?/){2}[^"\'`\s<>\\]*(?:\\/[^"\'`\s<>\\]*)*)\1')
+
+
+def js_url_references(js_content):
+    """Quét JS một lượt (tuyến tính) tìm các chuỗi là URL http(s) tuyệt đối"""
+    refs = []
+    for match in _JS_URL_RE.finditer(js_content):
+        raw = match.group(2)
+        escaped = '\\/' in raw
+        refs.append(JsRef(raw.replace('\\/', '/') if escaped else raw, match.start(2), match.end(2), escaped))
+    return refs
+
+
+# Một ứng viên trong srcset: URL và descriptor ('800w', '2x' hoặc '' = 1x)
+SrcsetCandidate = namedtuple('SrcsetCandidate', ['url', 'descriptor'])
+_SRCSET_DESCRIPTOR_RE = re.compile(r'(\d+(?:\.\d+)?|\.\d+)([wx])', re.IGNORECASE)
+
+
+def parse_srcset(value):
+    """Tách srcset thành các SrcsetCandidate theo thuật toán của HTML spec
+    (URL có thể chứa dấu phẩy, vd: ảnh Cloudinary w_400,h_300)"""
+    candidates = []
+    pos, length = 0, len(value)
+    while pos < length:
+        while pos < length and (value[pos].isspace() or value[pos] == ','):
+            pos += 1
+        start = pos
+        while pos < length and not value[pos].isspace():
+            pos += 1
+        url = value[start:pos]
+        descriptor = ''
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            # Descriptor kéo dài tới dấu phẩy kế tiếp nằm ngoài ngoặc
+            start, depth = pos, 0
+            while pos < length and (value[pos] != ',' or depth):
+                if value[pos] == '(':
+                    depth += 1
+                elif value[pos] == ')':
+                    depth = max(0, depth - 1)
+                pos += 1
+            descriptor = ' '.join(value[start:pos].split())
+        if url:
+            candidates.append(SrcsetCandidate(url, descriptor))
+    return candidates
+
+
+def parse_srcset_mode(spec):
+    """Chế độ chọn ứng viên srcset từ chuỗi cấu hình.
+    
+    'all' (giữ tất cả), 'largest', '<N>w' / '<N>x' (ứng viên gần nhất với độ rộng / mật độ điểm ảnh
+    mục tiêu) hoặc một số N (giữ N ứng viên trải đều theo kích thước, luôn có ứng viên lớn nhất).
+    Trả về (kind, target); ValueError nếu không hợp lệ.
+    """
+    spec = str(spec).strip().lower()
+    if spec in ('all', 'largest'):
+        return spec, None
+    if spec.isdigit() and int(spec) > 0:
+        return 'count', int(spec)
+    match = _SRCSET_DESCRIPTOR_RE.fullmatch(spec)
+    if match:
+        return 'nearest', (match.group(2), float(match.group(1)))
+    raise ValueError(f"Invalid srcset mode: {spec} (all, largest, <N>w, <N>x or a number of candidates)")
+
+
+def _srcset_size(candidate):
+    """(đơn vị, giá trị) của descriptor: ('w', 800.0), ('x', 2.0); không có / không hiểu = 1x"""
+    match = _SRCSET_DESCRIPTOR_RE.fullmatch(candidate.descriptor)
+    if match is None:
+        return 'x', 1.0
+    return match.group(2).lower(), float(match.group(1))
+
+
+def select_srcset(candidates, mode):
+    """Các ứng viên srcset được giữ theo mode (xem parse_srcset_mode), theo thứ tự gốc"""
+    kind, target = mode
+    if kind == 'all' or len(candidates) <= 1:
+        return candidates
+    
+    def ranked_by(unit):
+        return sorted((candidate for candidate in candidates if _srcset_size(candidate)[0] == unit),
+                      key=lambda candidate: _srcset_size(candidate)[1])
+    
+    # Độ rộng (w) và mật độ điểm ảnh (x) không cùng thang đo: chỉ xếp hạng trong một loại, ưu tiên w
+    ranked = ranked_by('w') or ranked_by('x')
+    if kind == 'count':
+        if target >= len(candidates):
+            return candidates
+        target = min(target, len(ranked))
+        step = (len(ranked) - 1) / (target - 1) if target > 1 else 0
+        keep = {ranked[round(len(ranked) - 1 - i * step)] for i in range(target)}
+    elif kind == 'nearest':
+        unit, value = target
+        matching = ranked_by(unit)
+        if not matching:
+            keep = {ranked[-1]}
+        else:
+            # Như trình duyệt: ứng viên nhỏ nhất đủ lớn, nếu không có thì lớn nhất
+            keep = {next((candidate for candidate in matching if _srcset_size(candidate)[1] >= value),
+                         matching[-1])}
+    else:
+        keep = {ranked[-1]}
+    return [candidate for candidate in candidates if candidate in keep]
+
+
+class HtmlTokenStream(HTMLParser):
+    """Tokenizer HTML tăng dần (feed từng chunk) cho chế độ rewrite streaming.
+    
+    Token được ghi lại gần như nguyên văn qua write(text, markup). Start tag khớp select(name, attrs)
+    được chuyển cho process(fragment, name, whole) và thay bằng kết quả; với tag trong buffered
+    (style, script, video...) fragment là cả element kèm nội dung (whole=True), còn lại chỉ là
+    start tag. Bộ nhớ chỉ phụ thuộc độ lớn của token/element lớn nhất, không phụ thuộc cả trang.
+    """
+    
+    def __init__(self, select, process, write, buffered=()):
+        super().__init__(convert_charrefs=False)
+        self.select = select
+        self.process = process
+        self.write = write
+        self.buffered = frozenset(buffered)
+        self._element = None  # [tên tag, độ lồng, các phần text] của element đang gom
+        self._in_endtag = False
+        self._endtag = None
+    
+    def _emit(self, text, markup=True):
+        if self._element is not None:
+            self._element[2].append(text)
+        else:
+            self.write(text, markup)
+    
+    def _start(self, tag, attrs, closed):
+        raw = self.get_starttag_text()
+        element = self._element
+        if element is not None:
+            element[2].append(raw)
+            if tag == element[0] and not closed:
+                element[1] += 1
+        elif not self.select(tag, attrs):
+            self.write(raw, True)
+        elif tag in self.buffered and not closed:
+            self._element = [tag, 1, [raw]]
+        else:
+            self.write(self.process(raw, tag, False), True)
+    
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, False)
+    
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, True)
+    
+    def parse_endtag(self, i):
+        # HTMLParser chỉ đưa tên tag đã lowercase: ghi lại end tag nguyên văn từ rawdata để giữ
+        # tag phân biệt hoa thường của SVG / MathML (</linearGradient>)
+        self._in_endtag = True
+        try:
+            end = super().parse_endtag(i)
+        finally:
+            self._in_endtag = False
+        tag, self._endtag = self._endtag, None
+        if tag is not None:
+            self._end(tag, self.rawdata[i:end])
+        return end
+    
+    def handle_endtag(self, tag):
+        if self._in_endtag:
+            self._endtag = tag  # Ghi ra trong parse_endtag, khi đã biết end tag kết thúc ở đâu
+        else:
+            self._end(tag, f'</{tag}>')
+    
+    def _end(self, tag, raw):
+        element = self._element
+        if element is None:
+            self.write(raw, True)
+            return
+        element[2].append(raw)
+        if tag == element[0]:
+            element[1] -= 1
+            if element[1] == 0:
+                self._finish_element()
+    
+    def _finish_element(self):
+        name, _, parts = self._element
+        self._element = None
+        self.write(self.process(''.join(parts), name, True), True)
+    
+    def handle_data(self, data):
+        self._emit(data, False)
+    
+    def handle_entityref(self, name):
+        self._emit(f'&{name};', False)
+    
+    def handle_charref(self, name):
+        self._emit(f'&#{name};', False)
+    
+    def handle_comment(self, data):
+        self._emit(f'<!--{data}-->')
+    
+    def handle_decl(self, decl):
+        self._emit(f'<!{decl}>')
+    
+    def handle_pi(self, data):
+        self._emit(f'<?{data}>')
+    
+    def unknown_decl(self, data):
+        self._emit(f'<![{data}]>')
+    
+    def close(self):
+        super().close()
+        if self._element is not None:  # Element chưa đóng ở cuối file
+            self._finish_element()
+
+
+def stream_html_file(path, parser, chunk_size=1024 * 1024):
+    """Đọc file HTML theo chunk và feed vào parser (HtmlTokenStream).
+    
+    HTMLParser quét lại từ đầu một start tag chưa trọn sau mỗi lần feed, nên chunk quá nhỏ
+    làm tag rất dài (data URI nhiều MB) tốn thời gian bậc hai.
+    """
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            parser.feed(chunk)
+    parser.close()
+
+
+class HtmlStreamWriter:
+    """Ghi output của rewrite streaming ra file, áp post_process (thay URL CDN còn sót) lên từng đoạn.
+    
+    Text liên tiếp được gom lại (URL trong text có thể bị tách ở entity như &amp;) và khi quá
+    text_limit chỉ được cắt ở ký tự không thể nằm trong URL.
+    """
+    
+    URL_BREAK_CHARS = ' \t\r\n"\'<>)'
+    
+    def __init__(self, f, post_process, text_limit=256 * 1024):
+        self.f = f
+        self.post_process = post_process
+        self.text_limit = text_limit
+        self.pending = []
+        self.pending_size = 0
+    
+    def write(self, text, markup):
+        if markup:
+            self.flush()
+            self.f.write(self.post_process(text))
+            return
+        self.pending.append(text)
+        self.pending_size += len(text)
+        if self.pending_size > self.text_limit:
+            text = ''.join(self.pending)
+            cut = max(text.rfind(char) for char in self.URL_BREAK_CHARS) + 1 or len(text)
+            self.f.write(self.post_process(text[:cut]))
+            self.pending = [text[cut:]]
+            self.pending_size = len(text) - cut
+    
+    def flush(self):
+        if self.pending:
+            self.f.write(self.post_process(''.join(self.pending)))
+            self.pending = []
+            self.pending_size = 0
+
+
+# Kết quả lượt quét streaming của một trang: URL sẽ tải (theo thứ tự bước như collect_html_urls),
+# page_key các link con, URL stylesheet và script (để prefetch tài nguyên bên trong)
+HtmlStreamScan = namedtuple('HtmlStreamScan', ['urls', 'links', 'stylesheets', 'scripts'])
+
+
+# Parser HTML cho process_html: 'html.parser' (stdlib, mặc định), 'lxml' (BeautifulSoup trên lxml),
+# 'selectolax' (Lexbor, không qua BeautifulSoup: cây được bọc bởi LexborDocument / LexborTag)
+PARSER_BACKENDS = ('html.parser', 'lxml', 'selectolax')
+
+
+def parser_available(name):
+    """Thư viện của parser backend đã được cài chưa (tên thư viện trùng tên backend)"""
+    return {'lxml': lxml is not None, 'selectolax': LexborHTMLParser is not None}.get(name, True)
+
+
+class LexborTag:
+    """Bọc một node selectolax theo phần API Tag của BeautifulSoup mà các handler rewrite dùng
+    (name, get, [], has_attr, decompose, get_text, string, find_all)"""
+    
+    __slots__ = ('node',)
+    
+    def __init__(self, node):
+        self.node = node
+    
+    @property
+    def name(self):
+        return self.node.tag
+    
+    def get(self, key, default=None):
+        attrs = self.node.attrs
+        if key not in attrs:
+            return default
+        # Thuộc tính không có giá trị (<img hidden>): BeautifulSoup trả về ''
+        return attrs[key] or ''
+    
+    def __getitem__(self, key):
+        return self.node.attrs[key] or ''
+    
+    def __setitem__(self, key, value):
+        self.node.attrs[key] = value
+    
+    def has_attr(self, key):
+        return key in self.node.attrs
+    
+    def decompose(self):
+        self.node.decompose()
+    
+    def get_text(self):
+        return self.node.text(deep=True)
+    
+    @property
+    def string(self):
+        # Chỉ dùng cho tag chứa text thuần (<script>, <style>)
+        return self.node.text(deep=True) or None
+    
+    @string.setter
+    def string(self, value):
+        self.node.inner_html = value
+    
+    def find_all(self, name, **attrs):
+        selector = name + ''.join(f'[{key}]' for key, value in attrs.items() if value is True)
+        return [LexborTag(node) for node in self.node.css(selector)]
+
+
+class LexborDocument:
+    """Cây HTML parse bằng selectolax (Lexbor); str() trả về HTML đã serialize"""
+    
+    def __init__(self, markup):
+        self.tree = LexborHTMLParser(markup)
+    
+    def find_all(self, name):
+        # Chỉ hỗ trợ find_all(True): mọi element theo thứ tự tài liệu (như scan_html cần)
+        root = self.tree.root
+        if root is None:
+            return []
+        return [LexborTag(node) for node in root.traverse() if node.is_element_node]
+    
+    def __str__(self):
+        return self.tree.html or ''
+
+
+# Một entry trong HttpCache
+CacheEntry = namedtuple('CacheEntry', ['url', 'etag', 'last_modified', 'cache_control', 'content_type',
+                                       'stored_at', 'expires_at', 'size', 'path'])
+
+
+class HttpCache:
+    """Cache HTTP trên đĩa, dùng chung giữa các lần clone (CLI và UI).
+    
+    Metadata (ETag, Last-Modified, Cache-Control...) nằm trong SQLite, nội dung
+    lưu ở cache_dir/bodies. Entry hết hạn được revalidate bằng If-None-Match /
+    If-Modified-Since; khi tổng dung lượng vượt max_size thì xóa theo LRU.
+    """
+    DEFAULT_DIR = Path.home() / '.web_cloner' / 'http_cache'
+    DEFAULT_MAX_SIZE = 1024 * 1024 * 1024  # 1 GB
+    HEURISTIC_MAX_AGE = 24 * 3600  # Giới hạn freshness ước lượng từ Last-Modified
+    
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = Path(cache_dir) if cache_dir else self.DEFAULT_DIR
+        self.max_size = self.DEFAULT_MAX_SIZE if max_size is None else max_size
+        self.bodies_dir = self.cache_dir / 'bodies'
+        self.bodies_dir.mkdir(parents=True, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.cache_dir / 'index.sqlite3'), timeout=30,
+                                   check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, cache_control TEXT, '
+                'content_type TEXT, stored_at REAL, expires_at REAL, size INTEGER, last_access REAL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)')
+    
+    def body_path(self, url):
+        return self.bodies_dir / hashlib.sha256(url.encode()).hexdigest()
+    
+    @staticmethod
+    def _cache_directives(headers):
+        directives = {}
+        for item in headers.get('Cache-Control', '').split(','):
+            name, _, value = item.strip().partition('=')
+            if name:
+                directives[name.lower()] = value.strip('"')
+        return directives
+    
+    def _expires_at(self, headers, now):
+        """Thời điểm entry hết hạn (0 = luôn phải revalidate)"""
+        directives = self._cache_directives(headers)
+        if 'no-cache' in directives:
+            return 0
+        
+        if directives.get('max-age', '').isdigit():
+            age = headers.get('Age', '0')
+            return now + int(directives['max-age']) - (int(age) if age.isdigit() else 0)
+        
+        if headers.get('Expires'):
+            try:
+                return parsedate_to_datetime(headers['Expires']).timestamp()
+            except (TypeError, ValueError):
+                return 0
+        
+        # Heuristic freshness: 10% khoảng thời gian từ Last-Modified
+        if headers.get('Last-Modified'):
+            try:
+                modified = parsedate_to_datetime(headers['Last-Modified']).timestamp()
+            except (TypeError, ValueError):
+                return 0
+            return now + min(max(now - modified, 0) * 0.1, self.HEURISTIC_MAX_AGE)
+        
+        return 0
+    
+    def lookup(self, url):
+        """Trả về CacheEntry của URL (hoặc None), đồng thời cập nhật thời điểm truy cập (LRU)"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT url, etag, last_modified, cache_control, content_type, stored_at, expires_at, size '
+                'FROM entries WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            
+            path = self.body_path(url)
+            if not path.exists():
+                with self._db:
+                    self._db.execute('DELETE FROM entries WHERE url = ?', (url,))
+                return None
+            
+            with self._db:
+                self._db.execute('UPDATE entries SET last_access = ? WHERE url = ?', (time.time(), url))
+        return CacheEntry(*row, path)
+    
+    def is_fresh(self, entry):
+        return entry.expires_at > time.time()
+    
+    def conditional_headers(self, entry):
+        """Header cho request revalidate"""
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+    
+    def store(self, url, headers, src_path):
+        """Lưu nội dung đã download vào cache (bỏ qua nếu response không cache được)"""
+        if 'no-store' in self._cache_directives(headers):
+            return
+        
+        now = time.time()
+        expires_at = self._expires_at(headers, now)
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified and expires_at <= now:
+            return  # Không có validator và không còn fresh: cache vô ích
+        
+        path = self.body_path(url)
+        # pid + thread id: nhiều process của batch có thể dùng chung một thư mục --cache
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(src_path, temp_path)
+        os.replace(temp_path, path)
+        
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, etag, last_modified, headers.get('Cache-Control'), headers.get('Content-Type', ''),
+                 now, expires_at, path.stat().st_size, now)
+            )
+        self.evict()
+    
+    def revalidated(self, entry, headers):
+        """Cập nhật entry sau khi server trả 304 Not Modified"""
+        now = time.time()
+        merged = {
+            'Cache-Control': headers.get('Cache-Control', entry.cache_control or ''),
+            'Expires': headers.get('Expires', ''),
+            'Last-Modified': headers.get('Last-Modified', entry.last_modified or ''),
+            'Age': headers.get('Age', '0'),
+        }
+        with self._lock, self._db:
+            self._db.execute(
+                'UPDATE entries SET etag = ?, last_modified = ?, cache_control = ?, stored_at = ?, '
+                'expires_at = ?, last_access = ? WHERE url = ?',
+                (headers.get('ETag', entry.etag), merged['Last-Modified'] or None, merged['Cache-Control'],
+                 now, self._expires_at(merged, now), now, entry.url)
+            )
+    
+    def copy_to(self, entry, dest_path):
+        """Copy nội dung cache ra dest_path (không hardlink vì file output có thể bị rewrite).
+        Trả về False nếu body đã bị process khác evict sau lookup (coi như cache miss)"""
+        try:
+            shutil.copyfile(entry.path, dest_path)
+        except FileNotFoundError:
+            return False
+        return True
+    
+    def evict(self):
+        """Xóa entry ít dùng nhất cho tới khi tổng dung lượng <= max_size"""
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_size:
+                return
+            
+            rows = self._db.execute('SELECT url, size FROM entries ORDER BY last_access').fetchall()
+            with self._db:
+                for url, size in rows:
+                    if total <= self.max_size:
+                        break
+                    self.body_path(url).unlink(missing_ok=True)
+                    self._db.execute('DELETE FROM entries WHERE url = ?', (url,))
+                    total -= size
+    
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class AssetStore:
+    """Kho tài nguyên dùng chung giữa các clone, đánh địa chỉ theo nội dung (SHA-256).
+    
+    File được lưu theo layout store_dir/<resource_type>/<2 ký tự đầu hash>/<hash><ext>;
+    file output của mỗi clone là hardlink vào kho (hoặc bản copy nếu không link được).
+    """
+    DEFAULT_DIR = Path.home() / '.web_cloner' / 'asset_store'
+    
+    def __init__(self, store_dir=None):
+        self.store_dir = Path(store_dir) if store_dir else self.DEFAULT_DIR
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+    
+    def path_for(self, digest, resource_type, ext=''):
+        return self.store_dir / resource_type / digest[:2] / f"{digest}{ext.lower()}"
+    
+    def place(self, src_path, dest_path, resource_type, digest=None):
+        """Chuyển file vừa tải (src_path) vào kho rồi link ra dest_path. Trả về hash nội dung"""
+        src_path, dest_path = Path(src_path), Path(dest_path)
+        digest = digest or file_digest(src_path)
+        stored_path = self.path_for(digest, resource_type, dest_path.suffix)
+        
+        if stored_path.exists():
+            src_path.unlink()
+        else:
+            stored_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = stored_path.with_name(f"{stored_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                os.replace(src_path, temp_path)
+            except OSError:
+                # Khác ổ đĩa: copy rồi xóa file tạm
+                shutil.copyfile(src_path, temp_path)
+                src_path.unlink()
+            os.replace(temp_path, stored_path)
+        
+        if dest_path.exists():
+            dest_path.unlink()
+        try:
+            os.link(stored_path, dest_path)
+        except OSError:
+            shutil.copyfile(stored_path, dest_path)
+        return digest
+
+
+class DirectoryOutput:
+    """Backend output mặc định: file được ghi thẳng vào thư mục root (hỗ trợ resume, optimize, serve).
+    
+    Mọi backend có cùng giao diện: root = thư mục làm việc chứa file đang xử lý, name(path) = đường
+    dẫn ảo (POSIX, tương đối so với root) của file trong output, commit(path) báo file đã ở trạng thái
+    cuối cùng, close() kết thúc output.
+    """
+    persistent = True  # File còn lại trên đĩa sau clone (journal / resume / optimize dùng được)
+    
+    def __init__(self, path):
+        self.root = Path(path)
+        self.target = self.label = str(self.root)
+    
+    def name(self, path):
+        return Path(path).relative_to(self.root).as_posix()
+    
+    def commit(self, path):
+        pass
+    
+    def close(self):
+        pass
+
+
+class ArchiveOutput:
+    """Backend ghi thẳng vào một archive (stream), không dựng cây thư mục output trên đĩa.
+    
+    HTML/CSS/JS cần rewrite sau khi tải nên vẫn nằm tạm trong thư mục nháp root; commit() đưa
+    file vào archive (theo name(path)) rồi xóa khỏi root ngay, nên root chỉ chứa các file đang
+    xử lý. File chưa commit (vd: lỗi rewrite) được đưa vào archive khi close(). Lớp con cài đặt
+    add(name, path) và finish().
+    """
+    persistent = False
+    
+    def __init__(self, target, scratch_dir=None):
+        self.target = target
+        # Tên hiển thị trong log / metrics (sys.stdout.buffer.name = '<stdout>')
+        self.label = str(target) if isinstance(target, (str, Path)) else getattr(target, 'name', '<memory>')
+        self.root = Path(tempfile.mkdtemp(prefix='web_cloner_', dir=scratch_dir))
+        self.names = []  # Tên file theo thứ tự đã ghi vào archive
+        self._committed = set()
+        self._lock = threading.Lock()
+    
+    def name(self, path):
+        return Path(path).relative_to(self.root).as_posix()
+    
+    def commit(self, path):
+        path = Path(path)
+        name = self.name(path)
+        with self._lock:
+            if name in self._committed or not path.is_file():
+                return
+            self._committed.add(name)
+            self.names.append(name)
+            self.add(name, path)
+        path.unlink()
+    
+    def close(self):
+        """Đưa các file chưa commit vào archive (bỏ file/thư mục tạm bắt đầu bằng '.'), đóng archive"""
+        try:
+            for path in sorted(self.root.rglob('*')):
+                if path.is_file() and not any(part.startswith('.') for part in path.relative_to(self.root).parts):
+                    self.commit(path)
+            self.finish()
+        finally:
+            shutil.rmtree(self.root, ignore_errors=True)
+    
+    def add(self, name, path):
+        raise NotImplementedError
+    
+    def finish(self):
+        pass
+
+
+class ZipOutput(ArchiveOutput):
+    """Ghi output vào file ZIP (target: đường dẫn hoặc file object, kể cả stream không seek được như stdout)"""
+    # Đã nén sẵn: lưu nguyên (ZIP_STORED) thay vì deflate lại
+    STORED_EXTENSIONS = {
+        '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.woff', '.woff2', '.mp4', '.webm',
+        '.mp3', '.ogg', '.zip', '.gz', '.br'
+    }
+    
+    def __init__(self, target, scratch_dir=None):
+        super().__init__(target, scratch_dir)
+        self._zip = zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED)
+    
+    def add(self, name, path):
+        compress_type = zipfile.ZIP_STORED if path.suffix.lower() in self.STORED_EXTENSIONS else None
+        self._zip.write(path, name, compress_type=compress_type)
+    
+    def finish(self):
+        self._zip.close()
+
+
+class TarOutput(ArchiveOutput):
+    """Ghi output vào tar stream (compression: 'gz', 'bz2', 'xz' hoặc '' = không nén)"""
+    
+    def __init__(self, target, compression='gz', scratch_dir=None):
+        super().__init__(target, scratch_dir)
+        mode = f"w|{compression}"
+        if isinstance(target, (str, Path)):
+            self._tar = tarfile.open(target, mode)
+        else:
+            self._tar = tarfile.open(fileobj=target, mode=mode)
+    
+    def add(self, name, path):
+        self._tar.add(path, arcname=name, recursive=False)
+    
+    def finish(self):
+        self._tar.close()
+
+
+class MemoryOutput(ArchiveOutput):
+    """Giữ output trong bộ nhớ: files = {đường dẫn ảo: bytes} (dùng cho test, service)"""
+    
+    def __init__(self, scratch_dir=None):
+        super().__init__(None, scratch_dir)
+        self.files = {}
+    
+    def add(self, name, path):
+        self.files[name] = path.read_bytes()
+
+
+# Định dạng output (open_output); None = đoán theo đuôi của target
+OUTPUT_FORMATS = ('dir', 'zip', 'tar', 'tar.gz', 'memory')
+
+
+def guess_output_format(target):
+    """Định dạng output theo đuôi target: .zip, .tar, .tar.gz/.tgz; '-' (stdout) = tar.gz; còn lại là thư mục"""
+    target = str(target).lower()
+    if target == '-':
+        return 'tar.gz'
+    if target.endswith('.zip'):
+        return 'zip'
+    if target.endswith(('.tar.gz', '.tgz')):
+        return 'tar.gz'
+    if target.endswith('.tar'):
+        return 'tar'
+    return 'dir'
+
+
+def open_output(target, format=None):
+    """Tạo backend output cho target (thư mục, file archive hoặc '-' = stdout)"""
+    format = format or guess_output_format(target)
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {format} (choose from {', '.join(OUTPUT_FORMATS)})")
+    if format == 'dir':
+        if str(target) == '-':
+            raise ValueError("Không ghi output dạng thư mục ra stdout được, chọn zip / tar / tar.gz")
+        return DirectoryOutput(target)
+    if format == 'memory':
+        return MemoryOutput()
+    
+    # Thư mục nháp cạnh file archive (cùng ổ đĩa); stdout thì dùng thư mục tạm của hệ thống
+    if str(target) == '-':
+        target, scratch_dir = sys.stdout.buffer, None
+    else:
+        scratch_dir = Path(target).resolve().parent
+        scratch_dir.mkdir(parents=True, exist_ok=True)
+    if format == 'zip':
+        return ZipOutput(target, scratch_dir)
+    return TarOutput(target, 'gz' if format == 'tar.gz' else '', scratch_dir)
+
+
+class CloneJournal:
+    """Journal append-only (JSON lines) trong output_dir, ghi lại các URL đã xử lý xong.
+
+    Mỗi dòng: k = loại ('asset' | 'css' | 'js' | 'page'), u = URL, p = đường dẫn tương đối
+    trong output_dir, h = SHA-256, s/m = size/mtime lúc ghi, d = URL phụ thuộc
+    (tài nguyên của trang/CSS), l = link trang con. Dòng sau ghi đè dòng trước cùng URL.
+    Entry chỉ được dùng lại khi file còn nguyên và mọi URL phụ thuộc cũng hợp lệ.
+    """
+    FILENAME = '.clone_journal.jsonl'
+
+    def __init__(self, output_dir, resume=True):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / self.FILENAME
+        self.entries = {}  # URL -> entry mới nhất
+        self._valid = {}  # URL -> kết quả kiểm tra (memo)
+        self._invalid = set()  # URL có memo False, kiểm tra lại sau khi có entry mới
+        self._lock = threading.Lock()
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if resume:
+            self._load()
+        elif self.path.exists():
+            self.path.unlink()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['u']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Dòng cuối bị cắt dở khi process chết giữa chừng
+        except FileNotFoundError:
+            return
+
+        # Quá nhiều dòng bị ghi đè: viết lại journal chỉ với entry mới nhất
+        if lines > 2 * len(self.entries) + 100:
+            temp_path = self.path.with_name(f"{self.path.name}.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+            os.replace(temp_path, self.path)
+
+    def local_path(self, url):
+        return self.output_dir / self.entries[url]['p']
+
+    def _file_ok(self, entry):
+        path = self.output_dir / entry['p']
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        if st.st_size != entry['s']:
+            return False
+        if st.st_mtime_ns == entry['m']:
+            return True
+        return file_digest(path) == entry['h']
+
+    def is_valid(self, url):
+        """File của URL còn nguyên vẹn và mọi tài nguyên phụ thuộc đều hợp lệ"""
+        valid = self._valid.get(url)
+        if valid is not None:
+            return valid
+        entry = self.entries.get(url)
+        if entry is None:
+            return False
+
+        self._valid[url] = True  # Chặn vòng lặp phụ thuộc (vd. CSS import lẫn nhau)
+        valid = self._file_ok(entry) and all(self.is_valid(dep) for dep in entry.get('d', ()))
+        self._valid[url] = valid
+        if not valid:
+            self._invalid.add(url)
+        return valid
+
+    def record(self, kind, url, path, digest=None, deps=None, links=None):
+        """Ghi nhận URL đã xử lý xong (file tại path đã ở trạng thái cuối cùng)"""
+        path = Path(path)
+        st = path.stat()
+        entry = {
+            'k': kind, 'u': url, 'p': path.relative_to(self.output_dir).as_posix(),
+            'h': digest or file_digest(path), 's': st.st_size, 'm': st.st_mtime_ns,
+        }
+        if deps:
+            entry['d'] = deps
+        if links:
+            entry['l'] = links
+
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            self.entries[url] = entry
+            for invalid_url in self._invalid:
+                self._valid.pop(invalid_url, None)
+            self._invalid.clear()
+            self._valid[url] = True
+            if self._file.closed:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def refresh(self, paths):
+        """Ghi lại hash/size/mtime cho các entry trỏ tới file vừa bị sửa sau khi clone (optimize_output)"""
+        changed = {Path(path).relative_to(self.output_dir).as_posix() for path in paths}
+        for entry in list(self.entries.values()):
+            if entry['p'] in changed:
+                self.record(entry['k'], entry['u'], self.output_dir / entry['p'],
+                            deps=entry.get('d'), links=entry.get('l'))
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
+class NullJournal:
+    """Journal cho output không resume được (archive, stdout, memory): không ghi nhận gì"""
+    entries = {}
+
+    def is_valid(self, url):
+        return False
+
+    def record(self, kind, url, path, digest=None, deps=None, links=None):
+        pass
+
+    def refresh(self, paths):
+        pass
+
+    def close(self):
+        pass
+
+
+class CloneMetrics:
+    """Đo thời gian theo phase và thống kê từng URL của một lần clone.
+    
+    phase() đo cả thời gian tổng (total, gồm phase con) lẫn thời gian riêng (self, trừ
+    phase con cùng thread), để biết clone chậm do mạng, bs4 hay ghi đĩa. Kết quả ghi ra
+    JSON (write) và, nếu bật trace, file Chrome trace-event (chrome://tracing, Perfetto).
+    """
+    
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.phases = {}  # tên phase -> [count, total, self, max]
+        self.urls = []
+        self.events = []  # Chrome trace events (chỉ khi trace=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    def _add(self, name, start, duration, self_time, args=None):
+        with self._lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = [0, 0.0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] += self_time
+            stats[3] = max(stats[3], duration)
+            if self.trace:
+                event = {'name': name, 'cat': name.split(':', 1)[0], 'ph': 'X',
+                         'ts': round((start - self._origin) * 1e6, 1), 'dur': round(duration * 1e6, 1),
+                         'pid': os.getpid(), 'tid': threading.get_ident()}
+                if args:
+                    event['args'] = args
+                self.events.append(event)
+    
+    @contextmanager
+    def phase(self, name, **args):
+        """Đo một phase (lồng nhau được trong cùng thread)"""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # Thời gian của các phase con
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += duration
+            self._add(name, start, duration, duration - children, args)
+    
+    def span(self, name, start, duration, **args):
+        """Ghi một phase đã đo sẵn (không lồng), vd. download chạy trong coroutine"""
+        self._add(name, start, duration, duration, args)
+    
+    def record_url(self, url, status=None, bytes=0, latency=0.0, cache=None, ranged=False, error=None,
+                   retries=0):
+        entry = {'url': url, 'status': status, 'bytes': bytes, 'latency': round(latency, 6), 'cache': cache}
+        if ranged:
+            entry['ranged'] = True
+        if retries:
+            entry['retries'] = retries
+        if error is not None:
+            entry['error'] = error
+        with self._lock:
+            self.urls.append(entry)
+    
+    def to_dict(self, **summary):
+        with self._lock:
+            phases = {
+                name: {'count': count, 'total': round(total, 6), 'self': round(self_time, 6),
+                       'max': round(longest, 6)}
+                for name, (count, total, self_time, longest) in self.phases.items()
+            }
+            urls = list(self.urls)
+        
+        cache = {}
+        for entry in urls:
+            if entry['cache'] is not None:
+                cache[entry['cache']] = cache.get(entry['cache'], 0) + 1
+        fetched = [entry for entry in urls if 'error' not in entry]
+        latencies = sorted(entry['latency'] for entry in fetched)
+        
+        totals = {
+            'requests': len(urls),
+            'failed': len(urls) - len(fetched),
+            'bytes': sum(entry['bytes'] for entry in fetched),
+            'cache': cache,
+            'latency_p50': latencies[len(latencies) // 2] if latencies else None,
+            'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else None,
+        }
+        return dict(summary, started_at=self.started_at,
+                    wall_time=round(time.perf_counter() - self._origin, 6),
+                    phases=phases, totals=totals, urls=urls)
+    
+    def write(self, path, **summary):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(**summary), f, ensure_ascii=False, indent=2)
+    
+    def write_trace(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+class RangeNotSupported(Exception):
+    """Server không trả 206 cho request Range (hoặc file đã thay đổi)"""
+
+
+class CloneCancelled(BaseException):
+    """Clone bị hủy qua CancelToken.
+    
+    Kế thừa BaseException (như KeyboardInterrupt) để đi xuyên qua các khối except Exception
+    dùng cho lỗi tải/xử lý từng tài nguyên.
+    """
+
+
+class CancelToken:
+    """Token hủy / tạm dừng một clone, dùng được từ thread khác (UI, service).
+    
+    Cloner gọi check() giữa các lần tải và giữa các chunk: check() chặn lại khi đang pause,
+    raise CloneCancelled khi đã cancel() hoặc quá time_limit (giây, None = không giới hạn).
+    """
+    
+    def __init__(self, time_limit=None):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self.deadline = time.monotonic() + time_limit if time_limit else None
+        self.reason = None
+    
+    def cancel(self, reason='cancelled'):
+        if self.reason is None:
+            self.reason = reason
+        self._cancelled.set()
+        self._running.set()  # Đánh thức các thread đang pause để chúng thoát
+    
+    def pause(self):
+        if not self._cancelled.is_set():
+            self._running.clear()
+    
+    def resume(self):
+        self._running.set()
+    
+    @property
+    def cancelled(self):
+        if self.deadline is not None and not self._cancelled.is_set() and time.monotonic() >= self.deadline:
+            self.cancel('time limit exceeded')
+        return self._cancelled.is_set()
+    
+    @property
+    def paused(self):
+        return not self._running.is_set()
+    
+    def check(self):
+        """Raise CloneCancelled nếu đã hủy; chờ (chặn thread) khi đang pause"""
+        while True:
+            if self.cancelled:
+                raise CloneCancelled(self.reason)
+            if self._running.is_set():
+                return
+            # Chờ có giới hạn để vẫn kiểm tra được deadline trong lúc pause
+            self._running.wait(0.5)
+    
+    def sleep(self, seconds):
+        """Chờ seconds giây (retry backoff); raise CloneCancelled ngay khi bị hủy"""
+        deadline = time.monotonic() + seconds
+        while True:
+            self.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._cancelled.wait(min(remaining, 0.5))
+
+
+def parse_retry_after(value):
+    """Giá trị header Retry-After (số giây hoặc HTTP-date) -> số giây cần chờ, None nếu không hợp lệ"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostThrottle:
+    """Điều phối request tới một host, dùng như context manager quanh mỗi request.
+    
+    - Concurrency theo AIMD: bắt đầu ở max_concurrency (per_host_limit), giảm một nửa khi bị rate
+      limit (429) hoặc tỉ lệ lỗi (5xx, mất kết nối, timeout) cao, giảm nhẹ khi độ trễ tới header tăng
+      vọt so với mức thấp nhất đã thấy. Sau RECOVERY_INTERVAL không giảm thì tăng lại +1 mỗi
+      INCREASE_INTERVAL: mỗi lần vượt quá giới hạn của server tốn cả một Retry-After.
+    - Token bucket: tối đa rate request/giây (None = không giới hạn), burst tối đa một giây.
+    - block(seconds): tạm dừng cả host (Retry-After), các request khác tới host cũng chờ.
+    
+    clock: hàm trả về thời gian (giây, mặc định time.monotonic), thay được trong test.
+    decreases: số lần đã giảm concurrency.
+    """
+    
+    DECREASE_INTERVAL = 1.0  # Giảm tối đa một lần mỗi khoảng này (nhiều lỗi cùng lúc = một tín hiệu)
+    RECOVERY_INTERVAL = 5.0
+    INCREASE_INTERVAL = 1.0
+    ERROR_RATE_LIMIT = 0.2  # EWMA tỉ lệ lỗi; lỗi lẻ tẻ không làm giảm concurrency
+    LATENCY_FACTOR = 4.0
+    LATENCY_SLACK = 0.25  # giây, để dao động độ trễ nhỏ (localhost, CDN gần) không thành tín hiệu nghẽn
+    
+    def __init__(self, max_concurrency, rate=None, cancel_token=None, clock=time.monotonic):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.active = 0
+        self.rate = rate
+        self.burst = max(1.0, rate or 0)
+        self.tokens = self.burst
+        self.cancel_token = cancel_token
+        self.clock = clock
+        self._refilled_at = clock()
+        self._blocked_until = 0.0
+        self._decreased_at = self._increased_at = 0.0
+        self.error_rate = 0.0
+        self.latency = None  # EWMA độ trễ tới header
+        self.base_latency = None
+        self.decreases = 0
+        self._cond = threading.Condition()
+    
+    def _take(self, now):
+        """Lấy slot nếu được (đang giữ lock); trả về 0, hoặc số giây nên chờ trước khi thử lại"""
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.active >= int(self.limit):
+            return 0.05
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        self.active += 1
+        return 0
+    
+    def try_acquire(self):
+        """Phiên bản không chặn của acquire() (cho asyncio): 0 nếu đã lấy slot, ngược lại số giây nên chờ"""
+        with self._cond:
+            return self._take(self.clock())
+    
+    def acquire(self):
+        with self._cond:
+            while True:
+                if self.cancel_token is not None and self.cancel_token.cancelled:
+                    raise CloneCancelled(self.cancel_token.reason)
+                wait = self._take(self.clock())
+                if not wait:
+                    return
+                # release() đánh thức ngay; chờ có giới hạn để theo dõi token bucket / block / hủy
+                self._cond.wait(min(wait, 0.5))
+    
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+    
+    def block(self, seconds):
+        """Không cấp slot mới trong seconds giây (Retry-After)"""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, self.clock() + seconds)
+    
+    def record(self, latency=None, rate_limited=False, failed=False):
+        """Phản hồi sau mỗi request (latency: giây tới khi nhận header). Trả về True nếu vừa giảm concurrency"""
+        with self._cond:
+            now = self.clock()
+            self.error_rate = self.error_rate * 0.9 + (0.1 if rate_limited or failed else 0.0)
+            factor = None
+            if rate_limited or (failed and self.error_rate > self.ERROR_RATE_LIMIT):
+                factor = 0.5
+            elif latency is not None and not failed:
+                self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+                self.base_latency = latency if self.base_latency is None else min(self.base_latency, latency)
+                if self.latency > self.base_latency * self.LATENCY_FACTOR + self.LATENCY_SLACK:
+                    factor = 0.75
+            
+            if factor is not None:
+                if now - self._decreased_at < self.DECREASE_INTERVAL or self.limit <= 1:
+                    return False
+                self.limit = max(1.0, self.limit * factor)
+                self._decreased_at = now
+                self.decreases += 1
+                return True
+            
+            if (not failed and latency is not None and self.limit < self.max_concurrency
+                    and now - self._decreased_at >= self.RECOVERY_INTERVAL
+                    and now - self._increased_at >= self.INCREASE_INTERVAL):
+                self.limit = min(float(self.max_concurrency), self.limit + 1)
+                self._increased_at = now
+                self._cond.notify_all()
+            return False
+
+
+# Phần đầu (scheme + host, group 1) và phần còn lại của URL http(s) trong HTML
+_URL_START_RE = re.compile(r'https?://([^/"\'\s<>)]*)')
+_URL_TAIL_RE = re.compile(r'[^"\'\s<>)]*')
+
+# Host của URL tuyệt đối hoặc protocol-relative (//host/...)
+_URL_HOST_RE = re.compile(r'^(?:[A-Za-z][A-Za-z0-9+.-]*:)?//([^/?#\\]*)')
+
+
+class DomainMatcher:
+    """So khớp host với danh sách domain theo hậu tố (domain hoặc subdomain của nó).
+    
+    Host được tra theo từng hậu tố nhãn trong một set, nên chi phí không phụ thuộc
+    độ dài danh sách; kết quả được cache theo host. 'evil-ladicdn.com.attacker'
+    không khớp 'ladicdn.com' như khi so chuỗi con.
+    """
+    
+    def __init__(self, domains=()):
+        self.domains = tuple(dict.fromkeys(d for d in map(self.normalize, domains) if d))
+        self._suffixes = frozenset(self.domains)
+        self._cache = {}  # netloc -> bool
+    
+    @staticmethod
+    def normalize(domain):
+        """'*.Example.com.' / '.example.com' -> 'example.com'"""
+        domain = domain.strip().lower()
+        if domain.startswith('*.'):
+            domain = domain[2:]
+        return domain.strip('.')
+    
+    def match_host(self, netloc):
+        matched = self._cache.get(netloc)
+        if matched is None:
+            host = netloc.rpartition('@')[2].lower()
+            if not host.startswith('['):
+                host = host.partition(':')[0]  # Bỏ port (trừ IPv6 [..])
+            host = host.rstrip('.')
+            matched = False
+            while host:
+                if host in self._suffixes:
+                    matched = True
+                    break
+                host = host.partition('.')[2]
+            self._cache[netloc] = matched
+        return matched
+    
+    def matches(self, url):
+        """URL (tuyệt đối hoặc //host/...) có host thuộc danh sách domain không"""
+        match = _URL_HOST_RE.match(url)
+        return match is not None and self.match_host(match.group(1))
+
+
+def load_domain_list(path):
+    """Đọc danh sách domain từ file: mỗi dòng một domain, bỏ qua dòng trống và comment #"""
+    domains = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                domains.append(line)
+    return domains
+
 
 class WebsiteCloner:
-    def __init__(self, base_url, output_dir="cloned_site", max_depth=3, download_all_external=True):
+    # Các domain cần loại bỏ hoàn toàn (không download, không giữ link)
+    # Bao gồm các CDN phổ biến mà ta muốn clone resources về local
+    EXTERNAL_CDN_DOMAINS = (
+        'ladicdn.com', 'w.ladicdn.com', 's.ladicdn.com',
+        'cdn.ladicdn.com', 'static.ladipage.net',
+        'a.ladipage.com', 'api1.ldpform.com', 'api.sales.ldpform.net'
+    )
+    
+    # Các domain cho preconnect/dns-prefetch cần loại bỏ
+    REMOVE_PRECONNECT_DOMAINS = (
+        'ladicdn.com', 'ladipage.com', 'ldpform.com', 'ldpform.net',
+        'fonts.googleapis.com', 'fonts.gstatic.com'
+    )
+    
+    METRICS_FILENAME = 'clone_metrics.json'
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    
+    # Link tới các file này không được crawl như trang HTML
+    NON_PAGE_EXTENSIONS = {
+        '.pdf', '.zip', '.rar', '.7z', '.gz', '.tar', '.doc', '.docx', '.xls', '.xlsx',
+        '.ppt', '.pptx', '.exe', '.dmg', '.apk', '.xml', '.json', '.txt'
+    }
+    # Ghi vào vị trí của trang tải lỗi: các trang đã rewrite trước đó vẫn link tới vị trí này
+    PAGE_REDIRECT_HTML = ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+                          '<meta http-equiv="refresh" content="0; url={url}"><title>{url}</title></head>'
+                          '<body><a href="{url}">{url}</a></body></html>\n')
+    
+    # Thứ tự các bước rewrite HTML (giữ nguyên thứ tự download để tên file không đổi)
+    HTML_STAGES = (
+        'dns-prefetch', 'preconnect', 'preload', 'style', 'stylesheet', 'script', 'img',
+        'srcset', 'style-attr', 'media', 'icon', 'svg', 'page-link', 'inline-script'
+    )
+    # Rewrite streaming: các tag cần cả nội dung (không chỉ thuộc tính) được gom nguyên element
+    STREAM_BUFFERED_TAGS = ('style', 'script', 'video', 'audio')
+    STREAM_GC_THRESHOLD = 1024 * 1024
+    # Tải file lớn theo Range
+    RANGE_MIN_SEGMENT = 1024 * 1024
+    RANGE_MIN_CHUNK = 64 * 1024
+    RANGE_MAX_CHUNK = 4 * 1024 * 1024
+    RANGE_RETRIES = 3
+    # Thử lại lỗi tạm thời: jittered exponential backoff (RETRY_BACKOFF * 2^lần), tôn trọng Retry-After
+    RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+    RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                        urllib3.exceptions.HTTPError)
+    NO_RETRY_EXCEPTIONS = (requests.exceptions.SSLError, urllib3.exceptions.NameResolutionError)
+    RETRY_BACKOFF = 0.5
+    RETRY_MAX_DELAY = 30
+    RETRY_AFTER_MAX = 120  # Retry-After dài hơn (giây): bỏ qua URL thay vì treo clone
+    
+    HTML_STAGE_MESSAGES = {
+        'dns-prefetch': "  → Cleaning up external preconnect/preload tags...",
+        'style': "  → Processing inline <style> tags...",
+        'inline-script': "  → Processing inline <script> tags for external URLs...",
+    }
+    
+    def __init__(self, base_url, output_dir="cloned_site", max_depth=3, download_all_external=True,
+                 jobs=8, per_host_limit=6, max_pending=None,
+                 progress_callback=None, log_callback=None, log_handler=None, log_level='INFO',
+                 http_cache=None, asset_store=None,
+                 range_threshold=8 * 1024 * 1024, range_segments=4, resume=True,
+                 external_cdn_domains=None, remove_preconnect_domains=None, trace_path=None,
+                 cancel_token=None, time_limit=None, stream_threshold=None, parser='html.parser',
+                 retries=3, host_rate=None, srcset='all', optimize=None, optimize_workers=None, output=None):
         self.base_url = base_url.rstrip('/')
         self.domain = urlparse(base_url).netloc
-        self.output_dir = Path(output_dir)
+        # Backend output (DirectoryOutput / ZipOutput / TarOutput / MemoryOutput, xem open_output).
+        # output_dir là thư mục làm việc của backend; đường dẫn trong output tính theo output.name()
+        self.output = output if output is not None else DirectoryOutput(output_dir)
+        self.output_dir = self.output.root
         self.max_depth = max_depth
         self.download_all_external = download_all_external  # Download tất cả resources từ external domains
         
-        # Các domain cần loại bỏ hoàn toàn (không download, không giữ link)
-        # Bao gồm các CDN phổ biến mà ta muốn clone resources về local
-        self.external_cdn_domains = [
-            'ladicdn.com', 'w.ladicdn.com', 's.ladicdn.com',
-            'cdn.ladicdn.com', 'static.ladipage.net',
-            'a.ladipage.com', 'api1.ldpform.com', 'api.sales.ldpform.net'
-        ]
+        # Download song song: jobs <= 1 nghĩa là chạy tuần tự như cũ
+        self.jobs = max(1, int(jobs))
+        self.per_host_limit = max(1, int(per_host_limit))
+        # Số lần thử lại lỗi tạm thời mỗi URL; host_rate: số request/giây tối đa tới mỗi host (None = không giới hạn).
+        # Concurrency từng host tự giảm / tăng lại theo phản hồi của server (HostThrottle)
+        self.retries = max(0, int(retries))
+        self.host_rate = host_rate
+        self.max_pending = max_pending or self.jobs * 4  # Số request tối đa đang chờ trong queue
         
-        # Các domain cho preconnect/dns-prefetch cần loại bỏ
-        self.remove_preconnect_domains = [
-            'ladicdn.com', 'ladipage.com', 'ldpform.com', 'ldpform.net',
-            'fonts.googleapis.com', 'fonts.gstatic.com'
-        ]
+        # File media lớn hơn range_threshold được tải bằng range_segments kết nối Range song song
+        self.range_threshold = range_threshold
+        self.range_segments = max(1, int(range_segments))
+        
+        # Callback nhận ProgressEvent và log message (mặc định: print ra stdout).
+        # log_handler(level, message) được ưu tiên hơn log_callback(message); log dưới
+        # log_level bị bỏ qua ngay trong log()
+        self.progress_callback = progress_callback
+        self.log_callback = log_callback
+        self.log_handler = log_handler
+        self.log_threshold = LOG_LEVELS[log_level]
+        
+        # HttpCache dùng chung giữa các lần clone (None = không cache)
+        self.http_cache = http_cache
+        # AssetStore dùng chung giữa các clone (None = lưu file trực tiếp)
+        self.asset_store = asset_store
+        
+        # Trang HTML từ stream_threshold byte trở lên được rewrite streaming (bộ nhớ không phụ thuộc
+        # độ lớn trang) thay vì dựng cả cây BeautifulSoup. None = tắt, 0 = mọi trang
+        self.stream_threshold = stream_threshold
+        
+        # Parser HTML (PARSER_BACKENDS): các handler rewrite chạy như nhau trên mọi backend
+        if parser not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown parser backend: {parser} (choose from {', '.join(PARSER_BACKENDS)})")
+        if not parser_available(parser):
+            raise ImportError(f"Parser '{parser}' cần thư viện {parser}: pip install {parser}")
+        self.parser = parser
+        
+        # Ứng viên srcset được tải (parse_srcset_mode): 'all', 'largest', '800w', '2x' hoặc số ứng viên
+        self.srcset_mode = parse_srcset_mode(srcset)
+        
+        # Bước tối ưu output sau khi clone (OPTIMIZE_STEPS, None = tắt), chạy trên optimize_workers process
+        self.optimize = tuple(optimize) if optimize else None
+        if self.optimize and not self.output.persistent:
+            raise ValueError("optimize chỉ dùng được với output dạng thư mục")
+        self.optimize_workers = optimize_workers
+        self.optimize_report = None
+        
+        # Hủy / tạm dừng từ bên ngoài (UI, service). time_limit (giây): tự hủy clone chạy quá lâu
+        self.cancel_token = cancel_token if cancel_token is not None else CancelToken(time_limit)
+        
+        # Thời gian theo phase + thống kê từng URL, ghi ra output_dir/clone_metrics.json khi clone xong.
+        # trace_path: ghi thêm file Chrome trace-event
+        self.metrics = CloneMetrics(trace=trace_path is not None)
+        self.trace_path = trace_path
+        
+        # Danh sách domain CDN / preconnect (None = mặc định của class), so khớp theo hậu tố
+        self.external_cdn_domains = (self.EXTERNAL_CDN_DOMAINS if external_cdn_domains is None
+                                     else external_cdn_domains)
+        self.remove_preconnect_domains = (self.REMOVE_PRECONNECT_DOMAINS if remove_preconnect_domains is None
+                                          else remove_preconnect_domains)
         
         # Tracking
         self.downloaded_urls = set()
         self.url_mapping = {}  # Map original URL to local path
+        self.processed_css = set()  # CSS đã xử lý (dùng chung giữa các trang)
+        self.processed_js = set()  # File JS đã quét URL CDN (theo path: file dedup có thể dùng chung)
+        self._allocated_names = {}  # resource_type -> tên file đã cấp phát
+        self._name_counters = {}  # (resource_type, tên gốc) -> hậu tố _N kế tiếp
+        self._saved_by_digest = {}  # SHA-256 nội dung -> file local đã lưu
+        self.media_urls = set()  # URL từ <video>/<audio>/<source>, ứng viên tải theo Range
+        
+        # Crawl nhiều trang (BFS theo max_depth)
+        self.frontier = deque()  # (URL trang, độ sâu) chờ xử lý
+        self.page_paths = {}  # page_key(URL) -> đường dẫn local của trang
+        self._used_page_paths = set()
+        self.failed_pages = set()  # page_key của trang tải lỗi (không xếp hàng lại, link giữ URL gốc)
+        self.pages_cloned = []
         self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            'User-Agent': self.USER_AGENT
         })
         
+        # Trạng thái cho chế độ download song song
+        self.prefetched = {}  # URL -> (file tạm, content-type) hoặc Exception
+        self._executor = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._host_slots = {}  # host -> HostThrottle giới hạn số kết nối / tốc độ
+        self._pending_slots = threading.BoundedSemaphore(self.max_pending)
+        self._staging_counter = 0
+        
+        # Handler rewrite HTML (duyệt cây một lần, dispatch theo tag/thuộc tính)
+        self._register_default_html_handlers()
+        
         # Tạo thư mục output
         self.create_directories()
+        
+        # Journal trong output_dir: lần clone sau bỏ qua các URL đã xong và còn nguyên vẹn.
+        # resume=False: bỏ journal cũ, clone lại từ đầu. Output archive / memory không resume được
+        self.journal = CloneJournal(self.output_dir, resume) if self.output.persistent else NullJournal()
+        self.resumed = self.restore_from_journal()
+    
+    def restore_from_journal(self):
+        """Khôi phục downloaded_urls/url_mapping từ các entry hợp lệ trong journal.
+        
+        Trang HTML không khôi phục ở đây mà được bỏ qua trong vòng lặp clone().
+        Trả về số tài nguyên đã khôi phục.
+        """
+        restored = 0
+        for url, entry in self.journal.entries.items():
+            if entry['k'] == 'page' or not self.journal.is_valid(url):
+                continue
+            local_path = self.journal.local_path(url)
+            self.downloaded_urls.add(url)
+            self.url_mapping[url] = local_path
+            self._allocated_names.setdefault(local_path.parent.name, set()).add(local_path.name)
+            if entry['k'] == 'css':
+                self.processed_css.add(local_path)
+            elif entry['k'] == 'js':
+                self.processed_js.add(local_path)
+            else:
+                self._saved_by_digest.setdefault(entry['h'], local_path)
+            restored += 1
+        return restored
+    
+    def completed_page(self, page_url):
+        """Entry journal của trang đã clone xong và còn hợp lệ (None nếu phải làm lại)"""
+        key = self.page_key(page_url)
+        entry = self.journal.entries.get(key)
+        if entry is None or entry['k'] != 'page' or not self.journal.is_valid(key):
+            return None
+        return entry
+    
+    def skip_completed_page(self, page_url, depth):
+        """Bỏ qua trang đã có trong journal (thêm lại link con vào frontier). Trả về True nếu bỏ qua"""
+        entry = self.completed_page(page_url)
+        key = self.page_key(page_url)
+        if entry is None or self.journal.local_path(key) != self.page_paths[key]:
+            return False
+        self.log(f"\n[Page depth {depth}] {page_url} (already cloned, skipped)")
+        if depth < self.max_depth:
+            self.enqueue_pages(entry.get('l', []), depth + 1)
+        self.downloaded_urls.add(page_url)
+        self.url_mapping[page_url] = self.page_paths[key]
+        self.pages_cloned.append(self.page_paths[key])
+        return True
+    
+    def write_metrics(self, main_html_path=None):
+        """Ghi clone_metrics.json (và trace nếu bật) vào cuối mỗi lần clone"""
+        try:
+            metrics_path = self.output_dir / self.METRICS_FILENAME
+            self.metrics.write(metrics_path, url=self.base_url,
+                               output_dir=self.output.label, ok=main_html_path is not None,
+                               pages=len(self.pages_cloned), files=len(self.downloaded_urls),
+                               jobs=self.jobs, parser=self.parser, optimize=self.optimize_summary())
+            self.output.commit(metrics_path)
+            if self.trace_path is not None:
+                self.metrics.write_trace(self.trace_path)
+        except OSError as e:
+            self.log(f"  ✗ Error writing metrics: {e}", 'ERROR')
+    
+    def log_cancelled(self, error):
+        if self.output.persistent:
+            self.log(f"Clone cancelled ({error}), resumable from journal: {self.output_dir}", 'WARNING')
+        else:
+            self.log(f"Clone cancelled ({error}), partial output: {self.output.label}", 'WARNING')
+    
+    def optimize_summary(self):
+        """Tóm tắt bước tối ưu cho clone_metrics.json (None nếu không chạy)"""
+        report = self.optimize_report
+        if report is None:
+            return None
+        return {
+            'steps': list(self.optimize), 'files': report.optimized, 'unchanged': report.unchanged,
+            'bytes_before': report.bytes_before, 'bytes_after': report.bytes_after,
+            'variants': report.variants, 'errors': len(report.errors),
+        }
+    
+    def optimize_clone(self):
+        """Tối ưu output_dir sau khi clone (optimize_output) rồi cập nhật journal cho các file bị ghi đè"""
+        self.log(f"\n→ Optimizing output ({', '.join(self.optimize)})...")
+        for missing in optimize_unavailable(self.optimize):
+            self.log(f"  ! Skipped: {missing}", 'WARNING')
+        
+        with self.metrics.phase('optimize'):
+            report = optimize_output(self.output_dir, self.optimize, workers=self.optimize_workers,
+                                     skip=(self.METRICS_FILENAME,), cancel_token=self.cancel_token)
+            self.journal.refresh(report.changed)
+        self.optimize_report = report
+        
+        for path, error in report.errors:
+            self.log(f"  ✗ Error optimizing {path}: {error}", 'ERROR')
+        saved = report.bytes_before - report.bytes_after
+        self.log(f"✓ Optimized {report.optimized} files ({report.unchanged} unchanged): "
+                 f"{report.bytes_before / 1024:.1f} KB → {report.bytes_after / 1024:.1f} KB, "
+                 f"saved {saved / 1024:.1f} KB", 'SUCCESS')
+        for suffix, (count, size) in sorted(report.variants.items()):
+            self.log(f"  {suffix}: {count} files, {size / 1024:.1f} KB")
+    
+    def log(self, message, level='INFO'):
+        """Ghi log tiến trình (qua log_handler/log_callback nếu có, ngược lại print)"""
+        if LOG_LEVELS[level] < self.log_threshold:
+            return
+        if self.log_handler is not None:
+            self.log_handler(level, message)
+        elif self.log_callback is not None:
+            self.log_callback(message)
+        else:
+            print(message)
+    
+    def emit(self, kind, url, **data):
+        """Gửi ProgressEvent tới progress_callback (có thể được gọi từ worker thread)"""
+        if self.progress_callback is not None:
+            self.progress_callback(ProgressEvent(kind, url, **data))
+    
+    @property
+    def external_cdn_domains(self):
+        return self._cdn_matcher.domains
+    
+    @external_cdn_domains.setter
+    def external_cdn_domains(self, domains):
+        self._cdn_matcher = DomainMatcher(domains)
+    
+    @property
+    def remove_preconnect_domains(self):
+        return self._preconnect_matcher.domains
+    
+    @remove_preconnect_domains.setter
+    def remove_preconnect_domains(self, domains):
+        self._preconnect_matcher = DomainMatcher(domains)
     
     def is_external_cdn(self, url):
         """Kiểm tra xem URL có thuộc external CDN cần clone về local không"""
-        parsed = urlparse(url)
-        domain = parsed.netloc.lower()
-        for cdn in self.external_cdn_domains:
-            if cdn in domain:
-                return True
-        return False
+        return self._cdn_matcher.matches(url)
     
     def should_remove_preconnect(self, url):
         """Kiểm tra xem preconnect/dns-prefetch có nên bị loại bỏ không"""
         if not url:
             return False
-        parsed = urlparse(url)
-        domain = parsed.netloc.lower()
-        for d in self.remove_preconnect_domains:
-            if d in domain:
-                return True
-        return False
+        return self._preconnect_matcher.matches(url)
     
     def create_directories(self):
         """Tạo cấu trúc thư mục - index.html sẽ ở root"""
@@ -85,6 +1729,114 @@ class WebsiteCloner:
         for directory in directories:
             directory.mkdir(parents=True, exist_ok=True)
     
+    def page_key(self, url):
+        """Chuẩn hóa URL trang để loại trùng trong frontier (bỏ #fragment, path rỗng = '/')"""
+        url, _ = urldefrag(url)
+        parsed = urlparse(url)
+        return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(),
+                               path=parsed.path or '/').geturl()
+    
+    def is_page_link(self, url):
+        """Kiểm tra link <a href> có phải trang HTML cùng domain cần crawl không"""
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or parsed.netloc.lower() != self.domain.lower():
+            return False
+        ext = os.path.splitext(parsed.path)[1].lower()
+        if ext in self.NON_PAGE_EXTENSIONS:
+            return False
+        # Link tới css/js/ảnh/font/media là tài nguyên, không phải trang
+        return self.get_resource_type(parsed.path) == 'other'
+    
+    def page_local_path(self, url):
+        """Tạo đường dẫn local cho trang, mô phỏng theo path của URL"""
+        parsed = urlparse(url)
+        path = unquote(parsed.path)
+        
+        if not path or path.endswith('/'):
+            path += 'index.html'
+        else:
+            ext = os.path.splitext(path)[1].lower()
+            if not ext:
+                path += '/index.html'
+            elif ext not in ('.html', '.htm'):
+                path += '.html'
+        
+        # Trang có query string: thêm hash để không đè lên nhau
+        if parsed.query:
+            name, ext = os.path.splitext(path)
+            path = f"{name}_{hashlib.md5(parsed.query.encode()).hexdigest()[:8]}{ext}"
+        
+        parts = [re.sub(r'[<>:"\\|?*]', '_', part) for part in path.split('/')
+                 if part not in ('', '.', '..')]
+        local_path = self.output_dir.joinpath(*parts)
+        
+        # Tránh trùng với trang đã cấp phát (vd: index.html của trang chính)
+        used = self._used_page_paths
+        base_path = local_path
+        counter = 1
+        while local_path in used:
+            local_path = base_path.with_name(f"{base_path.stem}_{counter}{base_path.suffix}")
+            counter += 1
+        
+        return local_path
+    
+    def start_frontier(self):
+        """Khởi tạo frontier với trang chính (luôn lưu vào root/index.html)"""
+        main_path = self.output_dir / 'index.html'
+        self.frontier.append((self.base_url, 0))
+        self.page_paths[self.page_key(self.base_url)] = main_path
+        self._used_page_paths.add(main_path)
+    
+    def page_links(self, soup, page_url, tasks=None):
+        """Danh sách page_key của các link <a href> cùng domain (theo thứ tự, không trùng)"""
+        if tasks is None:
+            tasks = self.scan_html(soup)
+        
+        links = []
+        seen = set()
+        for handler, tag in tasks['page-link']:
+            url = urljoin(page_url, tag['href'].strip())
+            if not self.is_page_link(url):
+                continue
+            key = self.page_key(url)
+            if key not in seen:
+                seen.add(key)
+                links.append(key)
+        return links
+    
+    def enqueue_pages(self, links, depth):
+        """Thêm các trang (page_key) chưa thấy vào frontier ở độ sâu depth"""
+        added = 0
+        for key in links:
+            if key in self.page_paths or key in self.failed_pages:
+                continue
+            self.page_paths[key] = self.page_local_path(key)
+            self._used_page_paths.add(self.page_paths[key])
+            self.frontier.append((key, depth))
+            added += 1
+        if added:
+            self.log(f"  → Queued {added} new pages (depth {depth})")
+    
+    def page_failed(self, page_url):
+        """Trang tải lỗi: các trang rewrite sau link thẳng về URL gốc. Link của các trang đã rewrite
+        trước đó (link tới trang được rewrite lúc xếp hàng) trỏ tới vị trí local của trang, nên ghi
+        vào đó một trang chuyển hướng về URL gốc. Trang không vào journal nên lần resume sẽ tải lại"""
+        key = self.page_key(page_url)
+        self.failed_pages.add(key)
+        local_path = self.page_paths.pop(key, None)
+        if local_path is None:
+            return
+        try:
+            local_path.parent.mkdir(parents=True, exist_ok=True)
+            self.write_text(local_path, self.PAGE_REDIRECT_HTML.format(url=html.escape(key)))
+            self.output.commit(local_path)
+        except OSError as e:
+            self.log(f"  ✗ Error writing redirect page for {page_url}: {e}", 'ERROR')
+    
+    def enqueue_links(self, soup, page_url, depth, tasks=None):
+        """Thêm các link <a href> cùng domain chưa thấy vào frontier ở độ sâu depth"""
+        self.enqueue_pages(self.page_links(soup, page_url, tasks), depth)
+    
     def get_resource_type(self, url, content_type=None):
         """Xác định loại tài nguyên dựa vào URL và content-type"""
         url_lower = url.lower()
@@ -101,423 +1853,1833 @@ class WebsiteCloner:
         elif any(url_lower.endswith(ext) for ext in ['.mp4', '.webm', '.ogg', '.mp3', '.wav']):
             return 'media'
         
-        # Kiểm tra content-type
-        if content_type:
-            if 'text/css' in content_type:
-                return 'css'
-            elif 'javascript' in content_type:
-                return 'js'
-            elif 'image' in content_type:
-                return 'images'
-            elif 'font' in content_type:
-                return 'fonts'
-            elif 'video' in content_type or 'audio' in content_type:
-                return 'media'
+        # Kiểm tra content-type
+        if content_type:
+            if 'text/css' in content_type:
+                return 'css'
+            elif 'javascript' in content_type:
+                return 'js'
+            elif 'image' in content_type:
+                return 'images'
+            elif 'font' in content_type:
+                return 'fonts'
+            elif 'video' in content_type or 'audio' in content_type:
+                return 'media'
+        
+        return 'other'
+    
+    def generate_local_filename(self, url, resource_type):
+        """Tạo tên file local duy nhất"""
+        parsed = urlparse(url)
+        path = unquote(parsed.path)
+        
+        # Tạo hash ngắn từ URL để tránh trùng lặp
+        url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
+        
+        # Lấy tên file gốc
+        if path and path != '/':
+            filename = os.path.basename(path)
+            if not filename:
+                filename = f'resource_{url_hash}'
+        else:
+            filename = f'resource_{url_hash}'
+        
+        # Thêm extension nếu thiếu
+        if '.' not in filename:
+            ext_map = {
+                'css': '.css',
+                'js': '.js',
+                'images': '.png',
+                'fonts': '.woff2',
+                'media': '.mp4'
+            }
+            filename += ext_map.get(resource_type, '.bin')
+        
+        # Tạo tên unique: tra index trong bộ nhớ, không đọc file trên đĩa
+        names = self._allocated_names.setdefault(resource_type, set())
+        if filename in names:
+            name, ext = os.path.splitext(filename)
+            key = (resource_type, filename)
+            counter = self._name_counters.get(key, 1)
+            while f"{name}_{counter}{ext}" in names:
+                counter += 1
+            self._name_counters[key] = counter + 1
+            filename = f"{name}_{counter}{ext}"
+        names.add(filename)
+        
+        local_path = self.output_dir / resource_type / filename
+        return local_path
+    
+    def _get_session(self):
+        """Mỗi worker thread dùng một Session riêng (requests.Session không thread-safe)"""
+        if threading.current_thread() is threading.main_thread():
+            return self.session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(self.session.headers)
+            self._local.session = session
+        return session
+    
+    def _host_slot(self, url):
+        """HostThrottle giới hạn số kết nối đồng thời (AIMD) và tốc độ request tới cùng một host"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = HostThrottle(self.per_host_limit, self.host_rate, self.cancel_token)
+                self._host_slots[host] = slot
+        return slot
+    
+    def _host_feedback(self, url, latency=None, status=None, failed=False):
+        """Báo kết quả một request cho HostThrottle của host (log khi concurrency bị giảm).
+        failed: lỗi kết nối / timeout (không có status)"""
+        throttle = self._host_slot(url)
+        if throttle.record(latency, rate_limited=status == 429, failed=failed or (status or 0) >= 500):
+            self.log(f"  ! {urlparse(url).netloc}: server overloaded, "
+                     f"limiting to {int(throttle.limit)} connections", 'WARNING')
+    
+    def is_retryable(self, error):
+        """Lỗi kết nối tạm thời (mất kết nối, timeout...), không tính lỗi DNS / SSL"""
+        cause = getattr(error.args[0], 'reason', None) if error.args else None
+        if isinstance(error, self.NO_RETRY_EXCEPTIONS) or isinstance(cause, self.NO_RETRY_EXCEPTIONS):
+            return False
+        return isinstance(error, self.RETRY_EXCEPTIONS)
+    
+    def retry_delay(self, url, error, attempt):
+        """Số giây chờ trước khi thử lại URL sau lần lỗi thứ attempt (từ 0), None = không thử lại.
+        
+        Status / headers lấy từ error.response (requests) hoặc error.status / error.headers (aiohttp).
+        Với 429 (rate limit), cả host bị tạm dừng tới hết Retry-After (hoặc backoff) để request khác
+        cũng chờ; các lỗi khác chỉ làm chậm lần thử lại của chính URL đó.
+        """
+        if attempt >= self.retries:
+            return None
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None) or getattr(error, 'status', None)
+        if status is not None:
+            if status not in self.RETRY_STATUSES:
+                return None
+        elif self.is_retryable(error):
+            self._host_feedback(url, failed=True)
+        else:
+            return None
+        
+        # Full jitter: các worker lỗi cùng lúc không thử lại cùng lúc
+        delay = random.uniform(0, min(self.RETRY_MAX_DELAY, self.RETRY_BACKOFF * 2 ** attempt))
+        headers = getattr(response, 'headers', None) or getattr(error, 'headers', None) or {}
+        retry_after = parse_retry_after(headers.get('Retry-After'))
+        if retry_after is not None:
+            if retry_after > self.RETRY_AFTER_MAX:
+                return None
+            delay = retry_after + random.uniform(0, self.RETRY_BACKOFF)
+        if status == 429:
+            self._host_slot(url).block(delay)
+        return delay
+    
+    def _staging_path(self, url):
+        """Đường dẫn file tạm trong output_dir/.staging (cùng ổ đĩa để os.replace được)"""
+        staging_dir = self.output_dir / '.staging'
+        staging_dir.mkdir(exist_ok=True)
+        with self._lock:
+            self._staging_counter += 1
+            counter = self._staging_counter
+        return staging_dir / f"{hashlib.md5(url.encode()).hexdigest()[:12]}_{counter}.part"
+    
+    def is_large_file_candidate(self, url):
+        """URL có thể là file media lớn (thử tải bằng nhiều kết nối Range)"""
+        return url in self.media_urls or self.get_resource_type(urlparse(url).path) == 'media'
+    
+    def _save_range_state(self, state_path, state):
+        temp_path = state_path.with_name(f"{state_path.name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, state_path)
+    
+    def _load_range_state(self, state_path, part_path, url, validator):
+        """Đọc trạng thái tải dở; bỏ qua nếu file trên server đã thay đổi"""
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('url') != url or any(state.get(k) != v for k, v in validator.items()):
+            return None
+        if not part_path.exists() or part_path.stat().st_size != validator['size']:
+            return None
+        return state
+    
+    def fetch_ranged(self, url, dest_path):
+        """Tải file lớn bằng nhiều kết nối Range song song vào file .part đã cấp phát trước.
+        
+        Tiến độ từng segment được ghi vào output_dir/.partial/<hash>.json nên lần chạy sau
+        (hoặc lần retry) tiếp tục từ chỗ dừng. Trả về Content-Type, hoặc None nếu file nhỏ
+        hơn range_threshold / server không hỗ trợ Range (khi đó tải bình thường).
+        """
+        session = self._get_session()
+        with self._host_slot(url):
+            head = session.head(url, timeout=30, allow_redirects=True,
+                                headers={'Accept-Encoding': 'identity'})
+        
+        size = head.headers.get('Content-Length', '')
+        if (head.status_code >= 400 or not size.isdigit() or int(size) < self.range_threshold
+                or head.headers.get('Accept-Ranges', '').lower() != 'bytes'):
+            return None
+        
+        size = int(size)
+        validator = {'size': size, 'etag': head.headers.get('ETag'),
+                     'last_modified': head.headers.get('Last-Modified')}
+        partial_dir = self.output_dir / '.partial'
+        partial_dir.mkdir(exist_ok=True)
+        key = hashlib.md5(url.encode()).hexdigest()
+        part_path = partial_dir / f"{key}.part"
+        state_path = partial_dir / f"{key}.json"
+        
+        state = self._load_range_state(state_path, part_path, url, validator)
+        if state is None:
+            count = max(1, min(self.range_segments, size // self.RANGE_MIN_SEGMENT))
+            step = -(-size // count)
+            segments = [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+            state = dict(validator, url=url, segments=segments)
+            with open(part_path, 'wb') as f:
+                f.truncate(size)  # Cấp phát trước toàn bộ file
+            self._save_range_state(state_path, state)
+        else:
+            done = sum(segment[2] for segment in state['segments'])
+            self.log(f"  → Resuming {url} from {done}/{size} bytes")
+        
+        lock = threading.Lock()
+        progress = {'received': sum(segment[2] for segment in state['segments']), 'saved_at': time.monotonic()}
+        if_range = validator['etag'] or validator['last_modified']
+        
+        def fetch_segment(segment):
+            # done: byte đã ghi vào .part; segment[2] (được lưu vào trạng thái) chỉ cập nhật sau khi
+            # chính segment này flush, nên trạng thái không bao giờ tính byte còn nằm trong buffer
+            done = segment[2]
+            attempts = 0
+            while segment[0] + done <= segment[1]:
+                position = segment[0] + done
+                headers = {'Range': f"bytes={position}-{segment[1]}", 'Accept-Encoding': 'identity'}
+                if if_range:
+                    headers['If-Range'] = if_range
+                try:
+                    with self._host_slot(url):
+                        response = self._get_session().get(head.url, headers=headers, timeout=30, stream=True)
+                        if response.status_code != 206:
+                            response.close()
+                            raise RangeNotSupported(f"HTTP {response.status_code} for ranged request")
+                        
+                        with response, open(part_path, 'r+b') as f:
+                            f.seek(position)
+                            chunk_size = self.RANGE_MIN_CHUNK
+                            try:
+                                while segment[0] + done <= segment[1]:
+                                    self.cancel_token.check()
+                                    remaining = segment[1] - (segment[0] + done) + 1
+                                    started = time.monotonic()
+                                    data = response.raw.read(min(chunk_size, remaining))
+                                    if not data:
+                                        break
+                                    f.write(data)
+                                    done += len(data)
+                                    
+                                    # Chunk size thích ứng: nhắm ~0.25s cho mỗi lần đọc
+                                    elapsed = max(time.monotonic() - started, 1e-3)
+                                    target = len(data) / elapsed * 0.25
+                                    chunk_size = int(min(max((chunk_size + target) / 2, self.RANGE_MIN_CHUNK),
+                                                         self.RANGE_MAX_CHUNK))
+                                    
+                                    with lock:
+                                        progress['received'] += len(data)
+                                        self.emit('bytes', url, bytes=progress['received'], total=size)
+                                        save = time.monotonic() - progress['saved_at'] > 1
+                                    if save:
+                                        f.flush()
+                                        with lock:
+                                            segment[2] = done
+                                            self._save_range_state(state_path, state)
+                                            progress['saved_at'] = time.monotonic()
+                            finally:
+                                # Kể cả khi bị đứt giữa chừng: byte đã flush được tính vào trạng thái
+                                f.flush()
+                                with lock:
+                                    segment[2] = done
+                    attempts = 0
+                except RangeNotSupported:
+                    raise
+                except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                    attempts += 1
+                    if attempts > self.RANGE_RETRIES:
+                        raise
+                    self.log(f"  ! Segment {segment[0]}-{segment[1]} of {url} interrupted ({e}), retrying...", 'WARNING')
+        
+        self.emit('started', url)
+        try:
+            with ThreadPoolExecutor(max_workers=len(state['segments'])) as executor:
+                for future in [executor.submit(fetch_segment, segment) for segment in state['segments']]:
+                    future.result()
+        except RangeNotSupported as e:
+            self.log(f"  ! Range download not possible for {url} ({e}), using single connection", 'WARNING')
+            part_path.unlink(missing_ok=True)
+            state_path.unlink(missing_ok=True)
+            return None
+        except BaseException:
+            # Lỗi hoặc bị hủy: giữ lại file .part và trạng thái để lần sau tải tiếp
+            with lock:
+                self._save_range_state(state_path, state)
+            raise
+        
+        if part_path.stat().st_size != size:
+            raise IOError(f"Size mismatch for {url}: expected {size} bytes")
+        os.replace(part_path, dest_path)
+        state_path.unlink(missing_ok=True)
+        
+        if self.http_cache is not None:
+            self.http_cache.store(url, head.headers, dest_path)
+        return head.headers.get('Content-Type', '')
+    
+    def fetch_to_file(self, url, dest_path, info=None):
+        """Tải nội dung URL vào dest_path, trả về Content-Type.
+        
+        info (dict, tùy chọn) nhận status và trạng thái cache ('hit' | 'revalidated' | 'miss').
+        """
+        info = {} if info is None else info
+        cache = self.http_cache
+        entry = cache.lookup(url) if cache is not None else None
+        if cache is not None:
+            info['cache'] = 'miss'
+        if entry is not None and cache.is_fresh(entry):
+            self.log(f"  → Cache hit: {url}")
+            info['cache'] = 'hit'
+            if cache.copy_to(entry, dest_path):
+                info['status'] = 200  # Bản cache còn hạn: như response 200 của server
+                return entry.content_type
+            self.log(f"  → Cache body evicted, downloading: {url}")
+            info['cache'] = 'miss'
+            entry = None
+        
+        # File media lớn: tải song song theo Range (có resume)
+        if entry is None and self.range_segments > 1 and self.is_large_file_candidate(url):
+            content_type = self.fetch_ranged(url, dest_path)
+            if content_type is not None:
+                info.update(status=206, ranged=True)
+                return content_type
+        
+        headers = cache.conditional_headers(entry) if entry is not None else {}
+        
+        with self._host_slot(url):
+            self.emit('started', url)
+            response = self._get_session().get(url, headers=headers, timeout=30, stream=True)
+            info['status'] = response.status_code
+            self._host_feedback(url, response.elapsed.total_seconds(), response.status_code)
+            
+            if response.status_code == 304 and entry is not None:
+                self.log(f"  → Cache revalidated (304): {url}")
+                info['cache'] = 'revalidated'
+                response.close()
+                cache.revalidated(entry, response.headers)
+                if cache.copy_to(entry, dest_path):
+                    return entry.content_type
+                # Body bị process khác evict sau lookup: tải lại không kèm header điều kiện
+                self.log(f"  → Cache body evicted, downloading: {url}")
+                info['cache'] = 'miss'
+                response = self._get_session().get(url, timeout=30, stream=True)
+                info['status'] = response.status_code
+            
+            if not response.ok:
+                response.close()  # Trả kết nối về pool trước khi retry
+                response.raise_for_status()
+            
+            total = response.headers.get('Content-Length')
+            total = int(total) if total and total.isdigit() else None
+            received = 0
+            with response, open(dest_path, 'wb') as f:  # Đóng response để trả kết nối khi bị hủy
+                for chunk in response.iter_content(chunk_size=8192):
+                    self.cancel_token.check()
+                    f.write(chunk)
+                    received += len(chunk)
+                    self.emit('bytes', url, bytes=received, total=total)
+        
+        if cache is not None:
+            cache.store(url, response.headers, dest_path)
+        
+        return response.headers.get('Content-Type', '')
+    
+    def _fetch_staged(self, url):
+        """Tải URL vào file tạm. Trả về (file tạm, content-type) hoặc Exception nếu lỗi"""
+        temp_path = None
+        info = {}
+        started = time.perf_counter()
+        try:
+            self.cancel_token.check()
+            self.log(f"Downloading: {url}")
+            temp_path = self._staging_path(url)
+            with self.metrics.phase('fetch', url=url):
+                content_type = self.fetch_with_retry(url, temp_path, info)
+            self.metrics.record_url(url, bytes=temp_path.stat().st_size,
+                                    latency=time.perf_counter() - started, **info)
+            return temp_path, content_type
+        except BaseException as e:
+            if temp_path is not None and temp_path.exists():
+                temp_path.unlink()
+            if not isinstance(e, Exception):  # CloneCancelled: dừng cả clone
+                raise
+            self.record_failed_fetch(url, e, started, info)
+            return e
+    
+    def fetch_with_retry(self, url, temp_path, info):
+        """fetch_to_file, thử lại lỗi tạm thời theo retry_delay (số lần thử lại ghi vào info['retries'])"""
+        attempt = 0
+        while True:
+            try:
+                return self.fetch_to_file(url, temp_path, info)
+            except Exception as e:
+                delay = self.retry_delay(url, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                info['retries'] = attempt
+                self.log(f"  ! {url}: {e}; retry {attempt}/{self.retries} in {delay:.1f}s", 'WARNING')
+                self.cancel_token.sleep(delay)
+    
+    def record_failed_fetch(self, url, error, started, info):
+        """Ghi metrics cho URL tải lỗi (status lấy từ HTTPError nếu có)"""
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None) or getattr(error, 'status', None)
+        info = dict(info, status=status or info.get('status'))
+        self.metrics.record_url(url, latency=time.perf_counter() - started, error=str(error), **info)
+    
+    def _filter_prefetch(self, urls):
+        """Lọc bỏ URL trùng, không phải http(s), hoặc đã tải/đã prefetch"""
+        pending = []
+        seen = set()
+        for url in urls:
+            if not url.startswith(('http://', 'https://')) or url in seen:
+                continue
+            seen.add(url)
+            if url not in self.downloaded_urls and url not in self.prefetched:
+                pending.append(url)
+        return pending
+    
+    def prefetch(self, urls):
+        """Tải song song danh sách URL vào vùng staging.
+        
+        Việc đặt tên file và ghi vào output vẫn diễn ra tuần tự trong download_resource
+        theo đúng thứ tự gọi, nên kết quả giống hệt chế độ tuần tự.
+        """
+        if self.jobs <= 1:
+            return
+        
+        pending = self._filter_prefetch(urls)
+        if not pending:
+            return
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        
+        futures = []
+        for url in pending:
+            self.cancel_token.check()
+            # Giới hạn số request đang chờ để không đẩy hàng nghìn task vào queue
+            self._pending_slots.acquire()
+            self.emit('queued', url)
+            future = self._executor.submit(self._fetch_staged, url)
+            future.add_done_callback(lambda _: self._pending_slots.release())
+            futures.append((url, future))
+        
+        for url, future in futures:
+            self.prefetched[url] = future.result()
+    
+    def close(self):
+        """Giải phóng thread pool và xóa các file tạm còn sót lại"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.prefetched.clear()
+        self.journal.close()
+        shutil.rmtree(self.output_dir / '.staging', ignore_errors=True)
+        try:
+            (self.output_dir / '.partial').rmdir()  # Chỉ xóa khi không còn file tải dở
+        except OSError:
+            pass
+    
+    def write_text(self, path, content):
+        """Ghi file text qua file tạm + os.replace.
+        
+        Không ghi đè lên inode cũ, nên file là hardlink vào AssetStore không làm hỏng kho.
+        """
+        path = Path(path)
+        temp_path = path.with_name(f"{path.name}.tmp")
+        with self.metrics.phase('write'):
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+    
+    def download_resource(self, url, is_main_page=False, page_path=None):
+        """Download một tài nguyên (hoặc một trang HTML vào page_path)"""
+        if url in self.downloaded_urls:
+            return self.url_mapping.get(url)
+        # data:/blob:/javascript:... không tải được (data URI base64 có thể dài nhiều MB)
+        if not url.startswith(('http://', 'https://')):
+            return None
+        
+        # Lấy kết quả đã prefetch (nếu có), nếu không thì tải ngay
+        staged = self.prefetched.pop(url, None)
+        if staged is None:
+            self.emit('queued', url)
+            staged = self._fetch_staged(url)
+        
+        try:
+            if isinstance(staged, Exception):
+                raise staged
+            temp_path, content_type = staged
+            size = os.path.getsize(temp_path)
+            
+            # Nếu là trang chính, lưu vào root với tên index.html
+            if is_main_page or page_path is not None:
+                local_path = Path(page_path) if page_path is not None else self.output_dir / 'index.html'
+                local_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, local_path)
+            else:
+                resource_type = self.get_resource_type(url, content_type)
+                with self.metrics.phase('store'):
+                    digest = file_digest(temp_path)
+                    
+                    # Nội dung trùng file đã lưu (URL khác): dùng lại file đó.
+                    # CSS không dedup vì url() tương đối phụ thuộc URL của chính file CSS.
+                    local_path = self._saved_by_digest.get(digest) if resource_type != 'css' else None
+                    if local_path is not None:
+                        os.unlink(temp_path)
+                        self.log(f"  → Same content as {local_path}")
+                        # Hash theo nội dung hiện tại (file JS dùng chung có thể đã được rewrite)
+                        self.journal.record('asset', url, local_path)
+                    else:
+                        local_path = self.generate_local_filename(url, resource_type)
+                        
+                        # Lưu file (đi qua AssetStore nếu có)
+                        if self.asset_store is not None:
+                            self.asset_store.place(temp_path, local_path, resource_type, digest)
+                        else:
+                            os.replace(temp_path, local_path)
+                        self._saved_by_digest.setdefault(digest, local_path)
+                        
+                        # CSS/JS được ghi journal (và commit vào output) sau khi process_css/process_js rewrite xong
+                        if resource_type not in ('css', 'js'):
+                            self.journal.record('asset', url, local_path, digest)
+                            self.output.commit(local_path)
+            
+            self.downloaded_urls.add(url)
+            self.url_mapping[url] = local_path
+            
+            self.log(f"  → Saved to: {local_path}", 'SUCCESS')
+            self.emit('done', url, bytes=size, path=local_path)
+            return local_path
+            
+        except Exception as e:
+            self.log(f"  ✗ Error downloading {url}: {e}", 'ERROR')
+            self.emit('failed', url, error=e)
+            return None
+    
+    def extract_urls_from_css(self, css_content, base_url):
+        """Trích xuất URLs từ CSS (url(...) và @import): [(ref gốc, URL tuyệt đối)]"""
+        return [(ref.ref, urljoin(base_url, ref.ref)) for ref in css_references(css_content)]
+    
+    def download_css_refs(self, refs, base_url):
+        """Download tài nguyên của các CssRef theo thứ tự, stylesheet @import được xử lý đệ quy.
+        
+        Trả về [(CssRef, URL tuyệt đối, local path hoặc None)].
+        """
+        results = []
+        for ref in refs:
+            absolute_url = urljoin(base_url, ref.ref)
+            local_path = self.download_resource(absolute_url)
+            if local_path and ref.is_import:
+                self.process_css(local_path, absolute_url)
+            results.append((ref, absolute_url, local_path))
+        return results
+    
+    def prefetch_css_graph(self, css_content, css_url):
+        """Tải trước song song cả đồ thị @import của một file CSS, theo từng tầng.
+        
+        Mỗi tầng prefetch các stylesheet import và tài nguyên url() của tầng đó, rồi đọc
+        nội dung stylesheet vừa tải (trong staging) để tìm tầng kế tiếp.
+        """
+        if self.jobs <= 1:
+            return
+        
+        seen = {css_url}
+        level = [(css_content, css_url)]
+        while level:
+            imports, assets = [], []
+            for content, base_url in level:
+                for ref in css_references(content):
+                    (imports if ref.is_import else assets).append(urljoin(base_url, ref.ref))
+            imports = [url for url in dict.fromkeys(imports) if url not in seen]
+            seen.update(imports)
+            self.prefetch(imports + assets)
+            
+            level = []
+            for url in imports:
+                staged = self.prefetched.get(url)
+                if staged and not isinstance(staged, Exception):
+                    with open(staged[0], 'r', encoding='utf-8', errors='ignore') as f:
+                        level.append((f.read(), url))
+    
+    def process_css(self, css_path, original_url):
+        """Xử lý file CSS: download tài nguyên bên trong (theo cả @import) và rewrite url() một lượt"""
+        # CSS dùng chung giữa nhiều trang chỉ xử lý một lần; đánh dấu trước khi
+        # đệ quy vào @import để vòng import (a → b → a) không lặp vô hạn
+        if css_path in self.processed_css:
+            return
+        self.processed_css.add(css_path)
+        
+        with self.metrics.phase('css', url=original_url):
+            try:
+                with open(css_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    css_content = f.read()
+                
+                refs = css_references(css_content)
+                self.prefetch_css_graph(css_content, original_url)
+                
+                replacements = []
+                deps = []
+                for ref, absolute_url, local_path in self.download_css_refs(refs, original_url):
+                    deps.append(absolute_url)
+                    if local_path:
+                        # Tính relative path từ CSS file đến resource
+                        replacements.append((ref, self._relative_url(local_path, css_path)))
+                
+                # Lưu CSS đã cập nhật
+                self.write_text(css_path, rewrite_css(css_content, replacements))
+                self.journal.record('css', original_url, css_path, deps=deps)
+                self.output.commit(css_path)
+                
+            except Exception as e:
+                self.log(f"Error processing CSS {css_path}: {e}", 'ERROR')
+    
+    def process_inline_style(self, style_content, base_url, html_path):
+        """Xử lý inline CSS trong <style> tags - download cả external URLs"""
+        try:
+            refs = css_references(style_content)
+            self.log(f"    DEBUG: Found {len(refs)} URLs in inline style", 'DEBUG')
+            
+            replacements = []
+            for ref, absolute_url, local_path in self.download_css_refs(refs, base_url):
+                if local_path:
+                    # Tính relative path từ HTML file đến resource
+                    relative_path = self._relative_url(local_path, html_path)
+                    replacements.append((ref, relative_path))
+                    self.log(f"    ✓ Replaced in CSS: {ref.ref[:40]}... → {relative_path}", 'SUCCESS')
+            
+            return rewrite_css(style_content, replacements)
+            
+        except Exception as e:
+            self.log(f"Error processing inline style: {e}", 'ERROR')
+            import traceback
+            self.log(traceback.format_exc(), 'ERROR')
+            return style_content
+    
+    def is_cdn_asset_url(self, url):
+        """URL file tài nguyên (basename có extension) trên external CDN"""
+        if not self.is_external_cdn(url):
+            return False
+        path = urlparse(url).path
+        return bool(path) and '.' in os.path.basename(path)
+    
+    def process_js(self, js_path, original_url):
+        """Quét file JS đã tải tìm URL external CDN trong chuỗi, tải theo lô và rewrite một lượt.
+        
+        JS nạp ảnh/font lúc chạy theo URL tương đối với trang (không phải file JS), và một file JS
+        dùng chung cho mọi trang, nên đường dẫn thay vào xem _js_asset_url.
+        File JS tải được từ trong JS (chunk lazy-load) cũng được xử lý đệ quy.
+        """
+        if js_path in self.processed_js:
+            return
+        self.processed_js.add(js_path)
+        
+        with self.metrics.phase('js', url=original_url):
+            try:
+                with open(js_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    js_content = f.read()
+                
+                refs = [ref for ref in js_url_references(js_content) if self.is_external_cdn(ref.url)]
+                if refs:
+                    self.log(f"  → Processing JS: {js_path.name} ({len(refs)} CDN URLs)")
+                self.prefetch([ref.url for ref in refs if self.is_cdn_asset_url(ref.url)])
+                
+                replacements = []
+                deps = []
+                for ref in refs:
+                    if self.is_cdn_asset_url(ref.url):
+                        deps.append(ref.url)
+                        local_path = self.download_resource(ref.url)
+                        if not local_path:
+                            continue
+                        if local_path.parent.name == 'js':
+                            self.process_js(local_path, ref.url)
+                        relative_path = self._js_asset_url(local_path)
+                    else:
+                        # Domain root của CDN: trỏ về gốc của output
+                        relative_path = '.' if self.max_depth == 0 else ''
+                    if ref.escaped:
+                        relative_path = relative_path.replace('/', '\\/')
+                    replacements.append((ref.start, ref.end, relative_path))
+                
+                if replacements:
+                    self.write_text(js_path, splice_text(js_content, replacements))
+                    self.log(f"    ✓ Replaced {len(replacements)} CDN URLs in {js_path.name}", 'SUCCESS')
+                self.journal.record('js', original_url, js_path, deps=deps)
+                self.output.commit(js_path)
+                
+            except Exception as e:
+                self.log(f"Error processing JS {js_path}: {e}", 'ERROR')
+    
+    def _js_asset_url(self, local_path):
+        """URL thay vào file JS cho local_path.
+        
+        Chỉ clone một trang (max_depth=0): tương đối với index.html ở gốc, mở được qua file://.
+        Có trang con (vd: sub/page/index.html): đường dẫn tuyệt đối từ gốc site (/images/x.png)
+        để đúng với mọi trang, cần xem clone qua HTTP với output là document root (vd: serve).
+        """
+        if self.max_depth == 0:
+            return self._relative_url(local_path, self.output_dir / 'index.html')
+        return '/' + self.output.name(local_path)
+    
+    def _register_default_html_handlers(self):
+        """Đăng ký các handler rewrite HTML mặc định (mỗi handler ứng với một bước xử lý cũ)"""
+        self._tag_handlers = {}
+        self._any_tag_handlers = []
+        self.html_stages = list(self.HTML_STAGES)
+        
+        register = self.register_html_handler
+        register('dns-prefetch', ('link',), self._remove_dns_prefetch,
+                 match=lambda tag: 'dns-prefetch' in self._rel_values(tag))
+        register('preconnect', ('link',), self._remove_preconnect,
+                 match=lambda tag: 'preconnect' in self._rel_values(tag))
+        register('preload', ('link',), self._remove_preload,
+                 match=lambda tag: 'preload' in self._rel_values(tag))
+        register('style', ('style',), self._rewrite_style_tag, self._collect_style_tag)
+        register('stylesheet', ('link',), self._rewrite_stylesheet, self._collect_href,
+                 match=lambda tag: 'stylesheet' in self._rel_values(tag))
+        register('script', ('script',), self._rewrite_script_src,
+                 partial(self._collect_url_attr, 'src'), attr='src')
+        register('img', ('img',), partial(self._rewrite_url_attr, 'src'),
+                 partial(self._collect_url_attr, 'src'), attr='src')
+        register('srcset', ('img', 'source'), self._rewrite_srcset, self._collect_srcset, attr='srcset')
+        register('style-attr', None, self._rewrite_style_attr, self._collect_style_attr, attr='style')
+        register('media', ('video', 'audio'), self._rewrite_media, self._collect_media)
+        register('icon', ('link',), self._rewrite_icon, self._collect_href,
+                 match=lambda tag: any('icon' in value.lower() for value in self._rel_values(tag)))
+        register('svg', ('image', 'use'), self._rewrite_svg, self._collect_svg)
+        register('page-link', ('a',), self._rewrite_page_link, attr='href')
+        register('inline-script', ('script',), self._rewrite_inline_script, self._collect_inline_script)
+    
+    def register_html_handler(self, stage, tags, rewrite, collect=None, attr=None, match=None):
+        """Đăng ký handler rewrite HTML.
+        
+        tags: tên các tag áp dụng (None = mọi tag có thuộc tính attr).
+        rewrite(tag, original_url, html_path) trả về True nếu đã xóa tag khỏi cây.
+        collect(tag, original_url) trả về các URL sẽ download (dùng cho prefetch).
+        """
+        if stage not in self.html_stages:
+            self.html_stages.append(stage)
+        handler = HtmlHandler(stage, attr, match, rewrite, collect)
+        if tags is None:
+            self._any_tag_handlers.append(handler)
+        else:
+            for name in tags:
+                self._tag_handlers.setdefault(name, []).append(handler)
+    
+    @staticmethod
+    def _rel_values(tag):
+        rel = tag.get('rel')
+        if not rel:
+            return []
+        return rel.split() if isinstance(rel, str) else rel
+    
+    def scan_html(self, soup):
+        """Duyệt cây HTML đúng một lần, gom các tag khớp handler theo từng bước xử lý"""
+        tasks = {stage: [] for stage in self.html_stages}
+        tag_handlers = self._tag_handlers
+        any_tag_handlers = self._any_tag_handlers
+        
+        with self.metrics.phase('scan'):
+            for tag in soup.find_all(True):
+                for handlers in (tag_handlers.get(tag.name, ()), any_tag_handlers):
+                    for handler in handlers:
+                        if handler.attr is not None and not tag.has_attr(handler.attr):
+                            continue
+                        if handler.match is not None and not handler.match(tag):
+                            continue
+                        tasks[handler.stage].append((handler, tag))
+        
+        return tasks
+    
+    def _relative_url(self, local_path, html_path):
+        """Đường dẫn tương đối (dạng URL) từ file HTML/CSS tới local_path, tính trên đường dẫn ảo
+        trong output (file có thể đã được commit vào archive, không còn trên đĩa)"""
+        return posixpath.relpath(self.output.name(local_path), posixpath.dirname(self.output.name(html_path)) or '.')
+    
+    # ---------- Handlers: thu thập URL để prefetch ----------
+    
+    def _collect_style_tag(self, tag, original_url):
+        style_content = tag.get_text()
+        if not style_content:
+            return []
+        return [u for _, u in self.extract_urls_from_css(style_content, original_url)]
+    
+    def _collect_href(self, tag, original_url):
+        return [urljoin(original_url, tag['href'])] if tag.get('href') else []
+    
+    def _collect_url_attr(self, attr, tag, original_url):
+        return [urljoin(original_url, tag[attr])]
+    
+    def _srcset_candidates(self, tag):
+        """Các ứng viên srcset được giữ lại theo srcset_mode"""
+        return select_srcset(parse_srcset(tag['srcset']), self.srcset_mode)
+    
+    def _collect_srcset(self, tag, original_url):
+        return [urljoin(original_url, candidate.url) for candidate in self._srcset_candidates(tag)]
+    
+    def _collect_style_attr(self, tag, original_url):
+        return [u for _, u in self.extract_urls_from_css(tag['style'], original_url)]
+    
+    def _collect_media(self, tag, original_url):
+        urls = []
+        if tag.get('src'):
+            urls.append(urljoin(original_url, tag['src']))
+        for source in tag.find_all('source', src=True):
+            urls.append(urljoin(original_url, source['src']))
+        self.media_urls.update(urls)
+        return urls
+    
+    def _collect_svg(self, tag, original_url):
+        urls = []
+        for attr in ['href', 'xlink:href']:
+            if tag.has_attr(attr):
+                url = tag[attr]
+                if not (url.startswith('#') or url.startswith('data:')):
+                    urls.append(urljoin(original_url, url))
+        return urls
+    
+    def _collect_inline_script(self, tag, original_url):
+        urls = []
+        if tag.string:
+            for quote, url in re.findall(r'(["\'])(https?://[^"\'\s<>]+)\1', str(tag.string)):
+                if self.is_cdn_asset_url(url):
+                    urls.append(url)
+        return urls
+    
+    # ---------- Handlers: rewrite ----------
+    
+    def _remove_dns_prefetch(self, tag, original_url, html_path):
+        tag.decompose()
+        return True
+    
+    def _remove_preconnect(self, tag, original_url, html_path):
+        # Loại bỏ preconnect tags tới external domains
+        href = tag.get('href', '')
+        if self.should_remove_preconnect(href):
+            self.log(f"    ✗ Removed preconnect: {href}")
+            tag.decompose()
+            return True
+        return False
+    
+    def _remove_preload(self, tag, original_url, html_path):
+        # Loại bỏ preload tới external scripts/styles
+        href = tag.get('href', '')
+        if href and (self.is_external_cdn(href) or self.should_remove_preconnect(href)):
+            self.log(f"    ✗ Removed preload: {href}")
+            tag.decompose()
+            return True
+        return False
+    
+    def _rewrite_style_tag(self, style_tag, original_url, html_path):
+        # Sử dụng get_text() thay vì .string để đảm bảo lấy được nội dung ngay cả khi có comments
+        style_content = style_tag.get_text()
+        if style_content:
+            updated_style = self.process_inline_style(style_content, original_url, html_path)
+            if updated_style != style_content:
+                # Gán .string (BeautifulSoup: clear() + NavigableString; LexborTag: inner_html)
+                style_tag.string = updated_style
+                self.log(f"    ✓ Updated style block id={style_tag.get('id', 'unknown')}", 'SUCCESS')
+    
+    def _rewrite_stylesheet(self, tag, original_url, html_path):
+        # Download và thay thế CSS external
+        if tag.get('href'):
+            css_url = urljoin(original_url, tag['href'])
+            local_path = self.download_resource(css_url)
+            
+            if local_path:
+                tag['href'] = self._relative_url(local_path, html_path)
+                
+                # Process CSS để download fonts, images trong CSS
+                self.process_css(local_path, css_url)
+    
+    def _rewrite_url_attr(self, attr, tag, original_url, html_path):
+        # Download và thay thế JS/images
+        local_path = self.download_resource(urljoin(original_url, tag[attr]))
+        
+        if local_path:
+            tag[attr] = self._relative_url(local_path, html_path)
+    
+    def _rewrite_script_src(self, tag, original_url, html_path):
+        # Download JS, thay src rồi quét URL CDN bên trong file JS
+        script_url = urljoin(original_url, tag['src'])
+        local_path = self.download_resource(script_url)
+        
+        if local_path:
+            tag['src'] = self._relative_url(local_path, html_path)
+            self.process_js(local_path, script_url)
+    
+    def _rewrite_srcset(self, tag, original_url, html_path):
+        # Download srcset images (<img> và <picture><source>), chỉ các ứng viên được chọn theo srcset_mode
+        new_srcset = []
+        
+        for candidate in self._srcset_candidates(tag):
+            url = candidate.url
+            local_path = self.download_resource(urljoin(original_url, url))
+            
+            if local_path:
+                url = self._relative_url(local_path, html_path)
+            
+            new_srcset.append(f"{url} {candidate.descriptor}" if candidate.descriptor else url)
+        
+        tag['srcset'] = ', '.join(new_srcset)
+    
+    def _rewrite_style_attr(self, tag, original_url, html_path):
+        # Download background images từ inline style attributes
+        style = tag['style']
+        refs = [ref for ref in css_references(style) if not ref.is_import]
+        
+        replacements = []
+        for ref, absolute_url, local_path in self.download_css_refs(refs, original_url):
+            if local_path:
+                replacements.append((ref, f'url("{self._relative_url(local_path, html_path)}")'))
+        
+        tag['style'] = rewrite_css(style, replacements, whole_token=True)
+    
+    def _rewrite_media(self, tag, original_url, html_path):
+        # Download video/audio sources
+        self.media_urls.update(self._collect_media(tag, original_url))
+        if tag.get('src'):
+            local_path = self.download_resource(urljoin(original_url, tag['src']))
+            
+            if local_path:
+                tag['src'] = self._relative_url(local_path, html_path)
+        
+        for source in tag.find_all('source', src=True):
+            local_path = self.download_resource(urljoin(original_url, source['src']))
+            
+            if local_path:
+                source['src'] = self._relative_url(local_path, html_path)
+    
+    def _rewrite_icon(self, tag, original_url, html_path):
+        # Download favicon
+        if tag.get('href'):
+            local_path = self.download_resource(urljoin(original_url, tag['href']))
+            
+            if local_path:
+                tag['href'] = self._relative_url(local_path, html_path)
+    
+    def _rewrite_svg(self, tag, original_url, html_path):
+        # Download SVG images (<image href="..."> và <use href="...">)
+        # Lưu ý: SVG có thể dùng href (SVG 2) hoặc xlink:href (SVG 1.1)
+        for attr in ['href', 'xlink:href']:
+            if tag.has_attr(attr):
+                url = tag[attr]
+                # Bỏ qua reference ID nội bộ (bắt đầu bằng #)
+                if url.startswith('#') or url.startswith('data:'):
+                    continue
+                
+                local_path = self.download_resource(urljoin(original_url, url))
+                
+                if local_path:
+                    tag[attr] = self._relative_url(local_path, html_path)
+                    self.log(f"    ✓ Replaced SVG {tag.name}: {url} → {tag[attr]}", 'SUCCESS')
+    
+    def _rewrite_page_link(self, tag, original_url, html_path):
+        # Cập nhật link giữa các trang đã clone
+        href = tag['href'].strip()
+        if not href or href.startswith('#'):
+            return
+        url, fragment = urldefrag(urljoin(original_url, href))
+        key = self.page_key(url)
+        if key in self.failed_pages:
+            # Trang không tải được: link về trang gốc
+            tag['href'] = f"{url}#{fragment}" if fragment else url
+            return
+        page_path = self.page_paths.get(key)
+        if page_path is not None:
+            relative_path = self._relative_url(page_path, html_path)
+            tag['href'] = f"{relative_path}#{fragment}" if fragment else relative_path
+    
+    def _rewrite_inline_script(self, script_tag, original_url, html_path):
+        # Xử lý URLs trong INLINE SCRIPTs
+        if not script_tag.string:
+            return
+        
+        content = str(script_tag.string)
+        # Tìm các URL trong script (đơn giản, bắt đầu bằng http/https)
+        # Group 1: Quote (hoặc rỗng), Group 2: URL
+        urls = re.findall(r'(["\'])(https?://[^"\'\s<>]+)\1', content)
+        modified = False
+        for quote, url in urls:
+            if self.is_external_cdn(url):
+                # Nếu là file resource (ảnh, script...), download
+                if self.is_cdn_asset_url(url):
+                    local_path = self.download_resource(url)
+                    if local_path:
+                        relative_path = self._relative_url(local_path, html_path)
+                        content = content.replace(url, relative_path)
+                        modified = True
+                        self.log(f"    ✓ Replaced in JS: {url} → {relative_path}", 'SUCCESS')
+                else:
+                    # Nếu là domain root, replace bằng '.' để trỏ về local
+                    content = content.replace(url, '.')
+                    modified = True
+                    self.log(f"    ✓ Replaced CDN root in JS: {url} → .", 'SUCCESS')
+        
+        if modified:
+            script_tag.string = content
+    
+    def collect_html_urls(self, soup, original_url, tasks=None):
+        """Thu thập (theo thứ tự) tất cả URL mà process_html sẽ download"""
+        if tasks is None:
+            tasks = self.scan_html(soup)
         
-        return 'other'
+        urls = []
+        for stage in self.html_stages:
+            for handler, tag in tasks[stage]:
+                if handler.collect is not None:
+                    urls.extend(handler.collect(tag, original_url))
+        return urls
     
-    def generate_local_filename(self, url, resource_type):
-        """Tạo tên file local duy nhất"""
-        parsed = urlparse(url)
-        path = unquote(parsed.path)
+    def collect_stylesheet_urls(self, soup, original_url, tasks=None):
+        """Thu thập URL tài nguyên bên trong các file CSS đã prefetch (fonts, images...)"""
+        if tasks is None:
+            tasks = self.scan_html(soup)
         
-        # Tạo hash ngắn từ URL để tránh trùng lặp
-        url_hash = hashlib.md5(url.encode()).hexdigest()[:8]
+        return self.collect_staged_css_urls(urljoin(original_url, tag['href'])
+                                            for handler, tag in tasks['stylesheet'] if tag.get('href'))
+    
+    def collect_staged_css_urls(self, css_urls):
+        """URL tài nguyên bên trong các stylesheet (theo URL) đã có trong staging"""
+        urls = []
+        for css_url in css_urls:
+            staged = self.prefetched.get(css_url)
+            if not staged or isinstance(staged, Exception):
+                continue
+            with open(staged[0], 'r', encoding='utf-8', errors='ignore') as f:
+                css_content = f.read()
+            urls.extend(u for _, u in self.extract_urls_from_css(css_content, css_url))
+        return urls
+    
+    def collect_script_urls(self, soup, original_url, tasks=None):
+        """Thu thập URL tài nguyên CDN bên trong các file JS đã prefetch"""
+        if tasks is None:
+            tasks = self.scan_html(soup)
         
-        # Lấy tên file gốc
-        if path and path != '/':
-            filename = os.path.basename(path)
-            if not filename:
-                filename = f'resource_{url_hash}'
-        else:
-            filename = f'resource_{url_hash}'
+        return self.collect_staged_js_urls(urljoin(original_url, tag['src']) for handler, tag in tasks['script'])
+    
+    def collect_staged_js_urls(self, script_urls):
+        """URL tài nguyên CDN bên trong các file JS (theo URL) đã có trong staging"""
+        urls = []
+        for script_url in script_urls:
+            staged = self.prefetched.get(script_url)
+            if not staged or isinstance(staged, Exception):
+                continue
+            with open(staged[0], 'r', encoding='utf-8', errors='ignore') as f:
+                js_content = f.read()
+            urls.extend(ref.url for ref in js_url_references(js_content) if self.is_cdn_asset_url(ref.url))
+        return urls
+    
+    def replace_remaining_cdn_urls(self, html_content, html_path):
+        """Thay các URL external CDN còn sót trong HTML bằng file local, trong một lượt quét.
         
-        # Thêm extension nếu thiếu
-        if '.' not in filename:
-            ext_map = {
-                'css': '.css',
-                'js': '.js',
-                'images': '.png',
-                'fonts': '.woff2',
-                'media': '.mp4'
-            }
-            filename += ext_map.get(resource_type, '.bin')
+        URL đã download được thay bằng đường dẫn tương đối; URL chưa download
+        (có thể là domain root) được thay bằng '.'.
+        """
+        if not self.external_cdn_domains:
+            return html_content
         
-        # Tạo tên unique
-        base_filename = filename
-        counter = 1
-        local_path = self.output_dir / resource_type / filename
+        replacements = {}
+        spans = []
+        pos = 0
+        while True:
+            match = _URL_START_RE.search(html_content, pos)
+            if match is None:
+                break
+            # Host không phải CDN: tìm tiếp từ sau host (URL CDN có thể nằm trong query)
+            pos = match.end()
+            if not self._cdn_matcher.match_host(match.group(1)):
+                continue
+            
+            pos = _URL_TAIL_RE.match(html_content, pos).end()
+            url = html_content[match.start():pos]
+            relative_path = replacements.get(url)
+            if relative_path is None:
+                # Kiểm tra xem file đã được download chưa
+                local_path = self.url_mapping.get(url)
+                if local_path is not None:
+                    relative_path = self._relative_url(local_path, html_path)
+                    self.log(f"    ✓ Post-replaced: {url[:50]}... → {relative_path}", 'SUCCESS')
+                else:
+                    relative_path = '.'
+                    self.log(f"    ✓ Post-replaced CDN root: {url}", 'SUCCESS')
+                replacements[url] = relative_path
+            spans.append((match.start(), pos, relative_path))
         
-        while local_path.exists() and local_path.read_bytes() != b'':
-            name, ext = os.path.splitext(base_filename)
-            filename = f"{name}_{counter}{ext}"
-            local_path = self.output_dir / resource_type / filename
-            counter += 1
+        return splice_text(html_content, spans)
+    
+    def parse_html(self, html_path):
+        """Đọc và parse file HTML bằng parser backend đã chọn"""
+        with self.metrics.phase('parse'):
+            with open(html_path, 'r', encoding='utf-8', errors='ignore') as f:
+                markup = f.read()
+            if self.parser == 'selectolax':
+                return LexborDocument(markup)
+            return BeautifulSoup(markup, self.parser)
+    
+    def process_html(self, html_path, original_url, depth=None):
+        """Xử lý file HTML và download tất cả tài nguyên.
         
-        return local_path
+        depth: độ sâu của trang khi crawl; nếu depth < max_depth thì các link
+        cùng domain được thêm vào frontier.
+        """
+        if self.use_streaming(html_path):
+            return self.process_html_streaming(html_path, original_url, depth)
+        
+        try:
+            soup = self.parse_html(html_path)
+            tasks = self.scan_html(soup)
+            
+            links = self.page_links(soup, original_url, tasks)
+            if depth is not None and depth < self.max_depth:
+                self.enqueue_pages(links, depth + 1)
+            
+            urls = self.collect_html_urls(soup, original_url, tasks)
+            
+            # Download song song: thu thập tất cả URL rồi tải trước
+            if self.jobs > 1:
+                self.log(f"  → Prefetching {len(urls)} resources with {self.jobs} workers...")
+                self.prefetch(urls)
+                self.prefetch(self.collect_stylesheet_urls(soup, original_url, tasks)
+                              + self.collect_script_urls(soup, original_url, tasks))
+        except Exception as e:
+            self.log(f"Error processing HTML {html_path}: {e}", 'ERROR')
+            return
+        
+        if self.rewrite_html(soup, html_path, original_url, tasks):
+            self.record_page(original_url, html_path, urls, links)
     
-    def download_resource(self, url, is_main_page=False):
-        """Download một tài nguyên"""
-        if url in self.downloaded_urls:
-            return self.url_mapping.get(url)
+    def record_page(self, page_url, html_path, urls, links):
+        """Ghi journal cho trang đã rewrite xong (kèm tài nguyên phụ thuộc và link con)"""
+        deps = list(dict.fromkeys(u for u in urls if u.startswith(('http://', 'https://'))))
+        try:
+            self.journal.record('page', self.page_key(page_url), html_path, deps=deps, links=links)
+        except OSError as e:
+            self.log(f"  ✗ Error writing journal for {page_url}: {e}", 'ERROR')
+    
+    def rewrite_html(self, soup, html_path, original_url, tasks=None):
+        """Download tài nguyên, cập nhật đường dẫn trong soup và lưu lại file HTML.
         
+        Cây HTML chỉ được duyệt một lần (scan_html); các handler sau đó chạy theo
+        thứ tự bước trong html_stages để thứ tự download (và tên file) không đổi.
+        Trả về True nếu đã lưu file HTML thành công.
+        """
         try:
-            print(f"Downloading: {url}")
-            response = self.session.get(url, timeout=30, stream=True)
-            response.raise_for_status()
+            if tasks is None:
+                tasks = self.scan_html(soup)
             
-            content_type = response.headers.get('Content-Type', '')
+            self.run_html_handlers(tasks, original_url, html_path, log_stages=True)
             
-            # Nếu là trang chính, lưu vào root với tên index.html
-            if is_main_page:
-                local_path = self.output_dir / 'index.html'
-            else:
-                resource_type = self.get_resource_type(url, content_type)
-                local_path = self.generate_local_filename(url, resource_type)
+            # Serialize (không dùng prettify để tránh mất modifications)
+            with self.metrics.phase('serialize'):
+                html_content = str(soup)
             
-            # Lưu file
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # ========== POST-PROCESSING: Replace remaining CDN URLs ==========
+            self.log("  → Post-processing: Replacing any remaining CDN URLs...")
+            with self.metrics.phase('post-process'):
+                html_content = self.replace_remaining_cdn_urls(html_content, html_path)
             
-            self.downloaded_urls.add(url)
-            self.url_mapping[url] = local_path
+            # Lưu HTML đã cập nhật (ghi file đúng một lần)
+            self.write_text(html_path, html_content)
             
-            print(f"  → Saved to: {local_path}")
-            return local_path
+            self.log(f"✓ Processed HTML: {html_path}", 'SUCCESS')
+            return True
             
         except Exception as e:
-            print(f"  ✗ Error downloading {url}: {e}")
-            return None
+            self.log(f"Error processing HTML {html_path}: {e}", 'ERROR')
+            return False
     
-    def extract_urls_from_css(self, css_content, base_url):
-        """Trích xuất URLs từ CSS (url(...))"""
-        urls = []
-        # Pattern cải tiến: url('...'), url("..."), url(...)
-        # Group 2 là nội dung URL
-        matches = re.finditer(r'url\(\s*(["\']?)(.*?)\1\s*\)', css_content, re.IGNORECASE)
-        
-        for match in matches:
-            match_str = match.group(2).strip()
-            # Bỏ qua data URIs và empty
-            if match_str.startswith('data:') or not match_str:
+    def run_html_handlers(self, tasks, original_url, html_path, log_stages=False):
+        """Chạy handler rewrite theo thứ tự html_stages trên các tag đã scan"""
+        removed = set()  # id của các tag đã bị decompose
+        for stage in self.html_stages:
+            message = self.HTML_STAGE_MESSAGES.get(stage) if log_stages else None
+            if message:
+                self.log(message)
+            if not tasks[stage]:
                 continue
             
-            # Resolve relative URL
-            absolute_url = urljoin(base_url, match_str)
-            urls.append((match_str, absolute_url))
+            with self.metrics.phase(f'rewrite:{stage}'):
+                for handler, tag in tasks[stage]:
+                    if id(tag) in removed:
+                        continue
+                    if handler.rewrite(tag, original_url, html_path):
+                        removed.add(id(tag))
     
-        return urls
+    # ---------- Rewrite streaming (trang HTML rất lớn) ----------
     
-    def process_css(self, css_path, original_url):
-        """Xử lý file CSS và download tài nguyên bên trong"""
+    def use_streaming(self, html_path):
+        """Trang có được rewrite streaming không (theo stream_threshold)"""
+        if self.stream_threshold is None:
+            return False
         try:
-            with open(css_path, 'r', encoding='utf-8', errors='ignore') as f:
-                css_content = f.read()
-            
-            urls = self.extract_urls_from_css(css_content, original_url)
+            return os.path.getsize(html_path) >= self.stream_threshold
+        except OSError:
+            return False
+    
+    def _stream_select(self, name, attrs):
+        """Start tag có thể khớp handler nào không (lọc nhanh trước khi dựng fragment)"""
+        if name in self._tag_handlers:
+            return True
+        for handler in self._any_tag_handlers:
+            if handler.attr is None or any(key == handler.attr for key, _ in attrs):
+                return True
+        return False
+    
+    def _release_fragment(self, fragment):
+        """Cây BeautifulSoup có vòng tham chiếu (parent/children) nên chỉ được giải phóng khi GC chạy;
+        với fragment lớn (script/JSON, data URI nhiều MB) gọi GC ngay để bộ nhớ không dồn lại"""
+        if len(fragment) >= self.STREAM_GC_THRESHOLD:
+            gc.collect()
+    
+    def _stream_parser(self, process, write=lambda text, markup: None):
+        return HtmlTokenStream(self._stream_select, process, write, self.STREAM_BUFFERED_TAGS)
+    
+    def scan_html_stream(self, html_path, original_url):
+        """Lượt 1 của rewrite streaming: thu thập URL / link con mà không dựng cây cả trang.
+        
+        Mỗi tag khớp handler được parse thành một soup nhỏ để dùng lại scan_html và các
+        handler collect. Fragment luôn parse bằng html.parser, bất kể self.parser: lxml / Lexbor
+        tự bọc fragment vào <html><body>. Trả về HtmlStreamScan.
+        """
+        stage_urls = {stage: [] for stage in self.html_stages}
+        links, seen_links = [], set()
+        stylesheets, scripts = [], []
+        
+        def process(fragment, name, whole):
+            soup = BeautifulSoup(fragment, 'html.parser')
+            tasks = self.scan_html(soup)
+            for stage, items in tasks.items():
+                for handler, tag in items:
+                    if handler.collect is not None:
+                        stage_urls[stage].extend(url for url in handler.collect(tag, original_url)
+                                                 if url.startswith(('http://', 'https://')))
+            for key in self.page_links(soup, original_url, tasks):
+                if key not in seen_links:
+                    seen_links.add(key)
+                    links.append(key)
+            stylesheets.extend(urljoin(original_url, tag['href'])
+                               for handler, tag in tasks['stylesheet'] if tag.get('href'))
+            scripts.extend(urljoin(original_url, tag['src']) for handler, tag in tasks['script'])
+            del soup, tasks
+            self._release_fragment(fragment)
+            return ''
+        
+        with self.metrics.phase('stream-scan'):
+            stream_html_file(html_path, self._stream_parser(process))
+        urls = [url for stage in self.html_stages for url in stage_urls[stage]]
+        return HtmlStreamScan(urls, links, stylesheets, scripts)
+    
+    def rewrite_html_stream(self, html_path, original_url):
+        """Lượt 2 của rewrite streaming: rewrite từng tag khi token đi qua và ghi output dần ra file.
+        
+        Handler chạy theo thứ tự tài liệu (trong mỗi tag vẫn theo html_stages), nên khi hai URL
+        khác nhau trùng tên file, hậu tố _N có thể khác chế độ dựng cây. Trả về True nếu thành công.
+        """
+        temp_path = html_path.with_name(f"{html_path.name}.tmp")
+        
+        def process(fragment, name, whole):
+            soup = BeautifulSoup(fragment, 'html.parser')
+            self.run_html_handlers(self.scan_html(soup), original_url, html_path)
+            text = str(soup)
+            del soup
+            self._release_fragment(fragment)
+            # Fragment chỉ có start tag: bỏ end tag mà BeautifulSoup tự thêm vào
+            if not whole and text.endswith(f'</{name}>'):
+                text = text[:-len(name) - 3]
+            return text
+        
+        def post_process(text):
+            return self.replace_remaining_cdn_urls(text, html_path)
+        
+        try:
+            with self.metrics.phase('stream-rewrite'):
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    writer = HtmlStreamWriter(f, post_process)
+                    stream_html_file(html_path, self._stream_parser(process, writer.write))
+                    writer.flush()
+                os.replace(temp_path, html_path)
             
-            for original_ref, absolute_url in urls:
-                # Download resource
-                local_path = self.download_resource(absolute_url)
-                
-                if local_path:
-                    # Tính relative path từ CSS file đến resource
-                    relative_path = os.path.relpath(local_path, css_path.parent)
-                    relative_path = relative_path.replace('\\', '/')
-                    
-                    # Simple string replace
-                    css_content = css_content.replace(original_ref, relative_path)
+            self.log(f"✓ Processed HTML (streaming): {html_path}", 'SUCCESS')
+            return True
             
-            # Lưu CSS đã cập nhật
-            with open(css_path, 'w', encoding='utf-8') as f:
-                f.write(css_content)
-                
         except Exception as e:
-            print(f"Error processing CSS {css_path}: {e}")
+            self.log(f"Error processing HTML {html_path}: {e}", 'ERROR')
+            return False
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
     
-    def process_inline_style(self, style_content, base_url, html_path):
-        """Xử lý inline CSS trong <style> tags - download cả external URLs"""
+    def process_html_streaming(self, html_path, original_url, depth=None):
+        """Như process_html nhưng quét và rewrite streaming (hai lượt đọc file, không giữ cả trang)"""
+        self.log(f"  → Streaming rewrite ({os.path.getsize(html_path) / 1024 / 1024:.1f} MB)")
         try:
-            urls = self.extract_urls_from_css(style_content, base_url)
-            print(f"    DEBUG: Found {len(urls)} URLs in inline style")
-            
-            for original_ref, absolute_url in urls:
-                print(f"    DEBUG: Processing URL: {absolute_url[:60]}...")
-                # Download resource (bao gồm cả external CDN)
-                local_path = self.download_resource(absolute_url)
-                
-                if local_path:
-                    # Tính relative path từ HTML file đến resource
-                    relative_path = os.path.relpath(local_path, html_path.parent)
-                    relative_path = relative_path.replace('\\', '/')
-                    
-                    # Quan trọng: Cần escape đúng các ký tự đặc biệt trong URL
-                    escaped_ref = re.escape(original_ref)
-                    
-                    # Simple string replace
-                    if original_ref in style_content:
-                        style_content = style_content.replace(original_ref, relative_path)
-                        print(f"    ✓ Replaced in CSS: {original_ref[:40]}... → {relative_path}")
-                    else:
-                        print(f"    ✗ URL not found in content: {original_ref[:40]}...")
-            
-            return style_content
+            scan = self.scan_html_stream(html_path, original_url)
+            if depth is not None and depth < self.max_depth:
+                self.enqueue_pages(scan.links, depth + 1)
             
+            if self.jobs > 1:
+                self.log(f"  → Prefetching {len(scan.urls)} resources with {self.jobs} workers...")
+                self.prefetch(scan.urls)
+                self.prefetch(self.collect_staged_css_urls(scan.stylesheets)
+                              + self.collect_staged_js_urls(scan.scripts))
         except Exception as e:
-            print(f"Error processing inline style: {e}")
-            import traceback
-            traceback.print_exc()
-            return style_content
+            self.log(f"Error processing HTML {html_path}: {e}", 'ERROR')
+            return
+        
+        if self.rewrite_html_stream(html_path, original_url):
+            self.record_page(original_url, html_path, scan.urls, scan.links)
     
-    def process_html(self, html_path, original_url):
-        """Xử lý file HTML và download tất cả tài nguyên"""
+    def clone(self):
+        """Clone toàn bộ website, trả về đường dẫn trang chính (None nếu không tải được)"""
+        self.log(f"\n{'='*60}")
+        self.log(f"Starting website clone: {self.base_url}")
+        self.log(f"Output directory: {self.output.label}")
+        self.log(f"{'='*60}\n")
+        
+        if self.resumed:
+            self.log(f"Resuming from journal: {self.resumed} resources already downloaded")
+        
+        self.start_frontier()
+        main_html_path = None
+        
         try:
-            with open(html_path, 'r', encoding='utf-8', errors='ignore') as f:
-                soup = BeautifulSoup(f.read(), 'html.parser')
-            
-            # ========== BƯỚC 1: Loại bỏ preconnect/dns-prefetch/preload tới external domains ==========
-            print("  → Cleaning up external preconnect/preload tags...")
-            
-            # Loại bỏ dns-prefetch tags
-            for tag in soup.find_all('link', rel='dns-prefetch'):
-                tag.decompose()
-            
-            # Loại bỏ preconnect tags tới external domains
-            for tag in soup.find_all('link', rel='preconnect'):
-                href = tag.get('href', '')
-                if self.should_remove_preconnect(href):
-                    print(f"    ✗ Removed preconnect: {href}")
-                    tag.decompose()
-            
-            # Loại bỏ preload tới external scripts/styles
-            for tag in soup.find_all('link', rel='preload'):
-                href = tag.get('href', '')
-                if href and (self.is_external_cdn(href) or self.should_remove_preconnect(href)):
-                    print(f"    ✗ Removed preload: {href}")
-                    tag.decompose()
-            
-            # ========== BƯỚC 2: Xử lý INLINE <style> tags (QUAN TRỌNG!) ==========
-            print("  → Processing inline <style> tags...")
-            from bs4 import NavigableString
-            for style_tag in soup.find_all('style'):
-                # Sử dụng get_text() thay vì .string để đảm bảo lấy được nội dung ngay cả khi có comments
-                style_content = style_tag.get_text()
-                if style_content:
-                    updated_style = self.process_inline_style(style_content, original_url, html_path)
-                    if updated_style != style_content:
-                        # Cập nhật nội dung bằng cách clear và append NavigableString
-                        style_tag.clear()
-                        style_tag.append(NavigableString(updated_style))
-                        print(f"    ✓ Updated style block id={style_tag.get('id', 'unknown')}")
-            
-            # Download và thay thế CSS external
-            for tag in soup.find_all('link', rel='stylesheet'):
-                if tag.get('href'):
-                    css_url = urljoin(original_url, tag['href'])
-                    local_path = self.download_resource(css_url)
-                    
-                    if local_path:
-                        relative_path = os.path.relpath(local_path, html_path.parent)
-                        tag['href'] = relative_path.replace('\\', '/')
-                        
-                        # Process CSS để download fonts, images trong CSS
-                        self.process_css(local_path, css_url)
-            
-            # Download và thay thế JS
-            for tag in soup.find_all('script', src=True):
-                js_url = urljoin(original_url, tag['src'])
-                local_path = self.download_resource(js_url)
-                
-                if local_path:
-                    relative_path = os.path.relpath(local_path, html_path.parent)
-                    tag['src'] = relative_path.replace('\\', '/')
-            
-            # Download và thay thế images
-            for tag in soup.find_all('img', src=True):
-                img_url = urljoin(original_url, tag['src'])
-                local_path = self.download_resource(img_url)
-                
-                if local_path:
-                    relative_path = os.path.relpath(local_path, html_path.parent)
-                    tag['src'] = relative_path.replace('\\', '/')
-            
-            # Download srcset images
-            for tag in soup.find_all('img', srcset=True):
-                srcset = tag['srcset']
-                new_srcset = []
-                
-                for item in srcset.split(','):
-                    parts = item.strip().split()
-                    if parts:
-                        img_url = urljoin(original_url, parts[0])
-                        local_path = self.download_resource(img_url)
-                        
-                        if local_path:
-                            relative_path = os.path.relpath(local_path, html_path.parent)
-                            parts[0] = relative_path.replace('\\', '/')
-                        
-                        new_srcset.append(' '.join(parts))
+            while self.frontier:
+                self.cancel_token.check()
+                page_url, depth = self.frontier.popleft()
                 
-                tag['srcset'] = ', '.join(new_srcset)
-            
-            # Download background images từ inline style attributes
-            for tag in soup.find_all(style=True):
-                style = tag['style']
-                urls = self.extract_urls_from_css(style, original_url)
+                # Trang đã clone xong ở lần chạy trước: chỉ thêm lại các link con
+                if self.skip_completed_page(page_url, depth):
+                    if depth == 0:
+                        main_html_path = self.page_paths[self.page_key(page_url)]
+                    continue
                 
-                for original_ref, absolute_url in urls:
-                    local_path = self.download_resource(absolute_url)
-                    
-                    if local_path:
-                        relative_path = os.path.relpath(local_path, html_path.parent)
-                        relative_path = relative_path.replace('\\', '/')
-                        
-                        style = re.sub(
-                            r'url\(\s*["\']?' + re.escape(original_ref) + r'["\']?\s*\)',
-                            f'url("{relative_path}")',
-                            style
-                        )
+                # Tải trước HTML của các trang kế tiếp trong frontier
+                self.prefetch([page_url] + [url for url, _ in islice(self.frontier, self.max_pending)
+                                            if self.completed_page(url) is None])
                 
-                tag['style'] = style
-            
-            # Download video/audio sources
-            for tag in soup.find_all(['video', 'audio']):
-                if tag.get('src'):
-                    media_url = urljoin(original_url, tag['src'])
-                    local_path = self.download_resource(media_url)
-                    
-                    if local_path:
-                        relative_path = os.path.relpath(local_path, html_path.parent)
-                        tag['src'] = relative_path.replace('\\', '/')
+                html_path = self.download_resource(page_url, page_path=self.page_paths[self.page_key(page_url)])
+                if not html_path:
+                    if depth == 0:
+                        self.log("Failed to download main page!", 'ERROR')
+                        return None
+                    self.page_failed(page_url)
+                    continue
                 
-                for source in tag.find_all('source', src=True):
-                    media_url = urljoin(original_url, source['src'])
-                    local_path = self.download_resource(media_url)
-                    
-                    if local_path:
-                        relative_path = os.path.relpath(local_path, html_path.parent)
-                        source['src'] = relative_path.replace('\\', '/')
-            
-            # Download favicon
-            for tag in soup.find_all('link', rel=lambda x: x and 'icon' in str(x).lower()):
-                if tag.get('href'):
-                    icon_url = urljoin(original_url, tag['href'])
-                    local_path = self.download_resource(icon_url)
-                    
-                    if local_path:
-                        relative_path = os.path.relpath(local_path, html_path.parent)
-                        tag['href'] = relative_path.replace('\\', '/')
-
-            # Download SVG images (<image href="..."> và <use href="...">)
-            # Lưu ý: SVG có thể dùng href (SVG 2) hoặc xlink:href (SVG 1.1)
-            for tag in soup.find_all(['image', 'use']):
-                # Kiểm tra cả href và xlink:href
-                for attr in ['href', 'xlink:href']:
-                    if tag.has_attr(attr):
-                        url = tag[attr]
-                        # Bỏ qua reference ID nội bộ (bắt đầu bằng #)
-                        if url.startswith('#') or url.startswith('data:'):
-                            continue
-                            
-                        full_url = urljoin(original_url, url)
-                        local_path = self.download_resource(full_url)
-                        
-                        if local_path:
-                            relative_path = os.path.relpath(local_path, html_path.parent)
-                            tag[attr] = relative_path.replace('\\', '/')
-                            print(f"    ✓ Replaced SVG {tag.name}: {url} → {relative_path.replace('\\', '/')}")
-            
-            # ========== BƯỚC BONUS: Xử lý URLs trong INLINE SCRIPTs ==========
-            print("  → Processing inline <script> tags for external URLs...")
-            for script_tag in soup.find_all('script'):
-                if script_tag.string:
-                     content = str(script_tag.string)
-                     # Tìm các URL trong script (đơn giản, bắt đầu bằng http/https)
-                     # Group 1: Quote (hoặc rỗng), Group 2: URL
-                     urls = re.findall(r'(["\'])(https?://[^"\'\s<>]+)\1', content)
-                     modified = False
-                     for quote, url in urls:
-                         if self.is_external_cdn(url):
-                             # Nếu là file resource (ảnh, script...), download
-                             path = urlparse(url).path
-                             if path and '.' in os.path.basename(path):
-                                 local_path = self.download_resource(url)
-                                 if local_path:
-                                     relative_path = os.path.relpath(local_path, html_path.parent).replace('\\', '/')
-                                     content = content.replace(url, relative_path)
-                                     modified = True
-                                     print(f"    ✓ Replaced in JS: {url} → {relative_path}")
-                             else:
-                                 # Nếu là domain root, replace bằng '.' để trỏ về local
-                                 content = content.replace(url, '.')
-                                 modified = True
-                                 print(f"    ✓ Replaced CDN root in JS: {url} → .")
-                     
-                     if modified:
-                         script_tag.string = content
-
-            # Lưu HTML đã cập nhật (không dùng prettify để tránh mất modifications)
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(str(soup))
-            
-            # ========== POST-PROCESSING: Replace remaining CDN URLs ==========
-            print("  → Post-processing: Replacing any remaining CDN URLs...")
-            with open(html_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # Tìm tất cả URLs từ external CDN domains còn sót lại
-            for domain in self.external_cdn_domains:
-                # Pattern: https://domain/path/to/file.ext
-                pattern = rf'https?://[^/]*{re.escape(domain)}[^"\'\s<>)]*'
-                matches = re.findall(pattern, html_content)
+                if depth == 0:
+                    main_html_path = html_path
+                self.log(f"\n[Page depth {depth}] {page_url}")
                 
-                for url in set(matches):  # Use set to avoid duplicates
-                    # Kiểm tra xem file đã được download chưa
-                    if url in self.url_mapping:
-                        local_path = self.url_mapping[url]
-                        relative_path = os.path.relpath(local_path, html_path.parent).replace('\\', '/')
-                        html_content = html_content.replace(url, relative_path)
-                        print(f"    ✓ Post-replaced: {url[:50]}... → {relative_path}")
-                    else:
-                        # Nếu chưa download (có thể là domain root), replace bằng '.'
-                        html_content = html_content.replace(url, '.')
-                        print(f"    ✓ Post-replaced CDN root: {url}")
-            
-            # Save lại file sau post-processing
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
+                # Process HTML để download tất cả resources
+                self.process_html(html_path, page_url, depth)
+                self.output.commit(html_path)
+                self.pages_cloned.append(html_path)
             
-            print(f"✓ Processed HTML: {html_path}")
-            
-        except Exception as e:
-            print(f"Error processing HTML {html_path}: {e}")
+            if self.optimize:
+                self.optimize_clone()
+        except CloneCancelled as e:
+            self.log_cancelled(e)
+            return None
+        except KeyboardInterrupt:
+            # Ctrl+C: báo các worker thread dừng ngay thay vì tải nốt hàng đợi trong close()
+            self.cancel_token.cancel('interrupted')
+            raise
+        finally:
+            self.close()
+            self.write_metrics(main_html_path)
+            self.output.close()
+        
+        self.log(f"\n{'='*60}")
+        self.log(f"✓ Clone completed!", 'SUCCESS')
+        self.log(f"  Pages cloned: {len(self.pages_cloned)}")
+        self.log(f"  Total files downloaded: {len(self.downloaded_urls)}")
+        if self.output.persistent:
+            self.log(f"  Main file: {main_html_path}")
+            self.log(f"  Metrics: {self.output_dir / self.METRICS_FILENAME}")
+        else:
+            self.log(f"  Output: {self.output.label} ({len(self.output.names)} files)")
+        self.log(f"{'='*60}\n")
+        return main_html_path
+
+
+# ---------- Tối ưu output sau khi clone ----------
+
+# Các bước của optimize_output. webp mặc định tắt vì thêm file mà HTML chưa dùng tới
+OPTIMIZE_STEPS = ('minify', 'images', 'webp', 'gzip', 'brotli')
+DEFAULT_OPTIMIZE_STEPS = ('minify', 'images', 'gzip', 'brotli')
+OPTIMIZE_MANIFEST = '.optimize_manifest.json'
+# File text đáng nén sẵn (.gz/.br cho server gửi Content-Encoding); ảnh, woff2... đã nén rồi
+PRECOMPRESS_EXTENSIONS = {
+    '.html', '.htm', '.css', '.js', '.mjs', '.json', '.svg', '.xml', '.txt', '.map',
+    '.ico', '.ttf', '.otf', '.eot'
+}
+# Sibling do optimize_output sinh ra (file.css.gz, file.png.webp...), không tối ưu lại
+OPTIMIZE_VARIANTS = ('.gz', '.br', '.webp')
+WEBP_QUALITY = 80
+
+# Kết quả tối ưu một file: kích thước trước/sau, variants = {hậu tố: kích thước} của sibling đã ghi
+OptimizedFile = namedtuple('OptimizedFile', ['path', 'before', 'after', 'variants', 'error'])
+# Báo cáo optimize_output. variants = {hậu tố: [số file, tổng byte]}, changed = file bị ghi đè
+OptimizeReport = namedtuple('OptimizeReport', ['optimized', 'unchanged', 'bytes_before', 'bytes_after',
+                                               'variants', 'changed', 'errors'])
+
+# Chuỗi (giữ nguyên), comment /*! (license, giữ nguyên) | khoảng trắng + comment thường
+_CSS_MINIFY_RE = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|/\*!.*?\*/)|(?:\s|/\*.*?\*/)+', re.S)
+
+
+def minify_css(css):
+    """Minify CSS không đổi ngữ nghĩa (rcssmin nếu có). Bản dựng sẵn chỉ bỏ comment và khoảng
+    trắng thừa cạnh { } ; , : >, không đụng tới + - ~ (calc) hay nội dung chuỗi"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(css, keep_bang_comments=True)
     
-    def clone(self):
-        """Clone toàn bộ website"""
-        print(f"\n{'='*60}")
-        print(f"Starting website clone: {self.base_url}")
-        print(f"Output directory: {self.output_dir}")
-        print(f"{'='*60}\n")
+    parts = []
+    last = 0
+    for match in _CSS_MINIFY_RE.finditer(css):
+        parts.append(css[last:match.start()])
+        last = match.end()
+        if match.group(1):
+            parts.append(match.group(1))
+            continue
+        # Khoảng trắng trước ':' giữ lại (selector "a :hover" khác "a:hover"), sau ')' cũng vậy
+        prev = css[match.start() - 1] if match.start() else ''
+        following = css[match.end():match.end() + 1]
+        if prev and following and prev not in '{};,:>(' and following not in '{};,>)!':
+            parts.append(' ')
+    parts.append(css[last:])
+    return ''.join(parts)
+
+
+def minify_js(js):
+    """Minify JS bằng rjsmin (None nếu không cài: tự viết minifier JS an toàn là không đáng)"""
+    if rjsmin is None:
+        return None
+    return rjsmin.jsmin(js, keep_bang_comments=True)
+
+
+_HTML_RAW_RE = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.S | re.I)
+# Giữ conditional comment của IE (<!--[if ...]>, <![endif]-->)
+_HTML_COMMENT_RE = re.compile(r'<!--(?!\[if|<!|>).*?-->', re.S)
+_HTML_SPACE_RE = re.compile(r'>\s+<')
+
+
+def _minify_html_text(text):
+    text = _HTML_COMMENT_RE.sub('', text)
+    # Thu khoảng trắng giữa hai tag về một ký tự (vẫn còn text node nên layout inline không đổi)
+    return _HTML_SPACE_RE.sub(lambda m: '>\n<' if '\n' in m.group(0) else '> <', text)
+
+
+def minify_html(html):
+    """Minify HTML thận trọng: bỏ comment, gộp khoảng trắng giữa các tag; nội dung
+    pre/textarea/script/style giữ nguyên"""
+    parts = []
+    last = 0
+    for match in _HTML_RAW_RE.finditer(html):
+        parts.append(_minify_html_text(html[last:match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(_minify_html_text(html[last:]))
+    return ''.join(parts)
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+    '.mjs': minify_js,
+    '.html': minify_html,
+    '.htm': minify_html,
+}
+
+
+def _recompress_png(path):
+    """Nén lại PNG không mất dữ liệu (Pillow optimize), giữ transparency/ICC/DPI. None nếu bỏ qua"""
+    try:
+        img = Image.open(path)
+    except OSError:
+        return None  # Không phải PNG thật (trang lỗi, placeholder...): giữ nguyên
+    with img:
+        if getattr(img, 'is_animated', False):
+            return None  # APNG: Pillow chỉ ghi lại frame đầu
+        img.load()
+        params = {key: img.info[key] for key in ('transparency', 'icc_profile', 'dpi', 'exif') if key in img.info}
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG', optimize=True, **params)
+        return buffer.getvalue()
+
+
+def _recompress_jpeg(path):
+    """Tối ưu bảng Huffman JPEG bằng jpegtran (lossless). Pillow phải decode/encode lại nên
+    không dùng: không có jpegtran thì bỏ qua"""
+    jpegtran = shutil.which('jpegtran')
+    if jpegtran is None:
+        return None
+    result = subprocess.run([jpegtran, '-copy', 'all', '-optimize', '-progressive', str(path)],
+                            capture_output=True)
+    return result.stdout if result.returncode == 0 and result.stdout else None
+
+
+def _webp_variant(path, lossless):
+    """Bản WebP của ảnh (lossless cho PNG, quality WEBP_QUALITY cho JPEG). None nếu bỏ qua"""
+    try:
+        img = Image.open(path)
+    except OSError:
+        return None
+    with img:
+        if getattr(img, 'is_animated', False):
+            return None
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.mode or 'transparency' in img.info else 'RGB')
+        buffer = io.BytesIO()
+        if lossless:
+            img.save(buffer, 'WEBP', lossless=True, method=6)
+        else:
+            img.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=6)
+        return buffer.getvalue()
+
+
+def _write_atomic(path, data):
+    # Ghi qua file tạm + os.replace: file có thể là hardlink tới AssetStore, không được sửa tại chỗ
+    temp_path = path.with_name(f"{path.name}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def _write_variant(path, suffix, data, limit):
+    """Ghi sibling path+suffix nếu nhỏ hơn limit byte, ngược lại xóa bản cũ (đã lỗi thời). Trả về kích thước"""
+    variant = path.with_name(path.name + suffix)
+    if data is None or len(data) >= limit:
+        variant.unlink(missing_ok=True)
+        return None
+    _write_atomic(variant, data)
+    return len(data)
+
+
+def _optimize_file(path, steps):
+    """Tối ưu một file (chạy trong process worker của optimize_output), trả về OptimizedFile"""
+    path = Path(path)
+    ext = path.suffix.lower()
+    before = after = 0
+    variants = {}
+    try:
+        data = path.read_bytes()
+        before = len(data)
+        optimized = None
         
-        # Download trang chính vào root/index.html
-        main_html_path = self.download_resource(self.base_url, is_main_page=True)
+        minifier = MINIFIERS.get(ext)
+        if 'minify' in steps and minifier is not None:
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError:
+                text = None
+            if text is not None:
+                minified = minifier(text)
+                optimized = minified.encode('utf-8') if minified is not None else None
+        elif 'images' in steps and Image is not None and ext == '.png':
+            optimized = _recompress_png(path)
+        elif 'images' in steps and ext in ('.jpg', '.jpeg'):
+            optimized = _recompress_jpeg(path)
         
-        if not main_html_path:
-            print("Failed to download main page!")
-            return
+        if optimized is not None and len(optimized) < before:
+            _write_atomic(path, optimized)
+            data = optimized
+        after = len(data)
+        
+        if 'webp' in steps and Image is not None and pil_features.check('webp') and ext in ('.png', '.jpg', '.jpeg'):
+            size = _write_variant(path, '.webp', _webp_variant(path, lossless=ext == '.png'), after)
+            if size is not None:
+                variants['.webp'] = size
+        
+        if ext in PRECOMPRESS_EXTENSIONS:
+            if 'gzip' in steps:
+                size = _write_variant(path, '.gz', gzip.compress(data, 9, mtime=0), after)
+                if size is not None:
+                    variants['.gz'] = size
+            if 'brotli' in steps and brotli is not None:
+                size = _write_variant(path, '.br', brotli.compress(data, quality=11), after)
+                if size is not None:
+                    variants['.br'] = size
+    except Exception as e:
+        return OptimizedFile(str(path), before, before, {}, f"{type(e).__name__}: {e}")
+    return OptimizedFile(str(path), before, after, variants, None)
+
+
+def optimize_unavailable(steps):
+    """Các phần của steps không chạy được vì thiếu thư viện / công cụ (list chuỗi để log)"""
+    missing = []
+    if 'minify' in steps and rjsmin is None:
+        missing.append('JS minify cần rjsmin')
+    if 'images' in steps and Image is None:
+        missing.append('nén lại PNG cần Pillow')
+    if 'images' in steps and shutil.which('jpegtran') is None:
+        missing.append('nén lại JPEG cần jpegtran')
+    if 'webp' in steps and (Image is None or not pil_features.check('webp')):
+        missing.append('WebP cần Pillow có hỗ trợ webp')
+    if 'brotli' in steps and brotli is None:
+        missing.append('.br cần brotli')
+    return missing
+
+
+def optimize_output(output_dir, steps=DEFAULT_OPTIMIZE_STEPS, workers=None, skip=(), cancel_token=None):
+    """Tối ưu thư mục clone: minify CSS/JS/HTML, nén lại PNG/JPEG không mất dữ liệu, sinh bản
+    .webp (tùy chọn) và .gz/.br cạnh file text.
+    
+    Mỗi file chạy trên một process worker (workers=None: mọi core, 1: chạy ngay trong process).
+    File chỉ bị thay khi bản tối ưu nhỏ hơn. OPTIMIZE_MANIFEST trong output_dir lưu size/mtime sau
+    khi tối ưu: lần chạy sau bỏ qua file không đổi. File/thư mục bắt đầu bằng '.' và đường dẫn
+    tương đối trong skip được bỏ qua. Trả về OptimizeReport.
+    """
+    output_dir = Path(output_dir)
+    steps = tuple(step for step in OPTIMIZE_STEPS if step in steps)
+    key = ','.join(steps)
+    manifest_path = output_dir / OPTIMIZE_MANIFEST
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    
+    files = []
+    unchanged = 0
+    current = {}
+    for path in sorted(output_dir.rglob('*')):
+        rel = path.relative_to(output_dir).as_posix()
+        if rel in skip or any(part.startswith('.') for part in path.relative_to(output_dir).parts):
+            continue
+        if path.suffix in OPTIMIZE_VARIANTS and path.with_suffix('').is_file():
+            continue
+        if not path.is_file():
+            continue
+        st = path.stat()
+        entry = manifest.get(rel)
+        if (entry and entry[:3] == [st.st_size, st.st_mtime_ns, key]
+                and all(path.with_name(path.name + suffix).is_file() for suffix in entry[3])):
+            current[rel] = entry
+            unchanged += 1
+            continue
+        files.append(path)
+    
+    results = []
+    try:
+        if workers == 1 or len(files) < 2:
+            for path in files:
+                if cancel_token is not None:
+                    cancel_token.check()
+                results.append(_optimize_file(path, steps))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_optimize_file, str(path), steps) for path in files]
+                try:
+                    for future in as_completed(futures):
+                        if cancel_token is not None:
+                            cancel_token.check()
+                        results.append(future.result())
+                except BaseException:
+                    pool.shutdown(cancel_futures=True)
+                    raise
+    finally:
+        # Lưu manifest cả khi bị hủy giữa chừng: các file đã xong không phải làm lại
+        for result in results:
+            if result.error is None:
+                path = Path(result.path)
+                st = path.stat()
+                current[path.relative_to(output_dir).as_posix()] = [st.st_size, st.st_mtime_ns, key,
+                                                                    sorted(result.variants)]
+        temp_path = manifest_path.with_name(f"{manifest_path.name}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_path, manifest_path)
+    
+    variants = {}
+    for result in results:
+        for suffix, size in result.variants.items():
+            totals = variants.setdefault(suffix, [0, 0])
+            totals[0] += 1
+            totals[1] += size
+    return OptimizeReport(
+        optimized=len(results), unchanged=unchanged,
+        bytes_before=sum(result.before for result in results),
+        bytes_after=sum(result.after for result in results),
+        variants=variants,
+        changed=[result.path for result in results if result.after < result.before],
+        errors=[(result.path, result.error) for result in results if result.error is not None],
+    )
+
+
+def default_output_dir(url):
+    """Thư mục output mặc định: tên domain của URL (bỏ ký tự : để an toàn trên Windows)"""
+    return urlparse(url).netloc.replace(':', '_')
+
+
+def read_url_list(path):
+    """Đọc danh sách URL cho batch: mỗi dòng một URL, bỏ qua dòng trống và comment #"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+# Kết quả một job trong clone_batch (elapsed/cpu tính bằng giây)
+BatchResult = namedtuple('BatchResult', ['url', 'output_dir', 'ok', 'error', 'elapsed', 'cpu',
+                                         'pages', 'files'])
+
+
+def _batch_job(url, output_dir, log_path, trace_path, cache, cache_size, asset_store, output_format,
+               cloner_kwargs):
+    """Chạy một clone trong process worker của clone_batch"""
+    started = time.monotonic()
+    cpu_started = time.process_time()
+    log_file = open(log_path, 'w', encoding='utf-8') if log_path else None
+    http_cache = None
+    error = None
+    pages = files = 0
+    try:
+        if cache is not None:
+            http_cache = HttpCache(cache or None, max_size=cache_size)
+        store = AssetStore(asset_store or None) if asset_store is not None else None
         
-        # Process HTML để download tất cả resources
-        self.process_html(main_html_path, self.base_url)
+        log_callback = (lambda message: print(message, file=log_file)) if log_file else (lambda message: None)
+        output = open_output(output_dir, output_format)
+        try:
+            cloner = WebsiteCloner(url, output=output, http_cache=http_cache, asset_store=store,
+                                   log_callback=log_callback, trace_path=trace_path, **cloner_kwargs)
+        except BaseException:
+            # Output chỉ được đóng trong clone(): constructor lỗi thì tự xóa thư mục nháp của archive
+            if not output.persistent:
+                shutil.rmtree(output.root, ignore_errors=True)
+            raise
+        if cloner.clone() is None:
+            error = (f"Cancelled: {cloner.cancel_token.reason}" if cloner.cancel_token.reason
+                     else "Failed to download main page")
+        pages, files = len(cloner.pages_cloned), len(cloner.downloaded_urls)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        if http_cache is not None:
+            http_cache.close()
+        if log_file is not None:
+            log_file.close()
+    
+    return BatchResult(url, str(output_dir), error is None, error, time.monotonic() - started,
+                       time.process_time() - cpu_started, pages, files)
+
+
+def clone_batch(urls, output_root='.', workers=None, log_dir=None, on_result=None,
+                cache=None, cache_size=None, asset_store=None, output_format='dir', trace_dir=None,
+                **cloner_kwargs):
+    """Clone nhiều website song song trên một process pool.
+    
+    Mỗi job ghi vào output_root/<tên domain> (như main(); trùng domain thì thêm hậu tố _2, _3...),
+    hoặc output_root/<tên domain>.<output_format> nếu output là archive (zip, tar, tar.gz).
+    jobs/per_host_limit trong cloner_kwargs là giới hạn download đồng thời của từng worker.
+    cache/asset_store là thư mục ('' = mặc định, None = tắt) vì object không chuyển qua process được.
+    log_dir: thư mục ghi log chi tiết của từng job (None = bỏ log).
+    trace_dir: thư mục ghi Chrome trace-event của từng job, <tên domain>.trace.json (None = không trace).
+    on_result(BatchResult) được gọi ngay khi mỗi job xong. Trả về list BatchResult theo thứ tự urls.
+    """
+    output_root = Path(output_root)
+    for directory in (log_dir, trace_dir):
+        if directory is not None:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+    if cache_size is None:
+        cache_size = HttpCache.DEFAULT_MAX_SIZE
+    # Các job đã chạy song song trên process pool: bước tối ưu của mỗi job chạy ngay trong worker
+    cloner_kwargs.setdefault('optimize_workers', 1)
+    
+    results = [None] * len(urls)
+    used_dirs = set()
+    jobs = []
+    for index, url in enumerate(urls):
+        if not url.startswith(('http://', 'https://')):
+            results[index] = BatchResult(url, None, False, "URL phải bắt đầu với http:// hoặc https://",
+                                         0.0, 0.0, 0, 0)
+            if on_result is not None:
+                on_result(results[index])
+            continue
+        
+        name = default_output_dir(url)
+        unique, counter = name, 2
+        while unique in used_dirs:
+            unique = f"{name}_{counter}"
+            counter += 1
+        used_dirs.add(unique)
         
-        print(f"\n{'='*60}")
-        print(f"✓ Clone completed!")
-        print(f"  Total files downloaded: {len(self.downloaded_urls)}")
-        print(f"  Main file: {main_html_path}")
-        print(f"{'='*60}\n")
+        log_path = Path(log_dir) / f"{unique}.log" if log_dir is not None else None
+        trace_path = Path(trace_dir) / f"{unique}.trace.json" if trace_dir is not None else None
+        target = output_root / (unique if output_format == 'dir' else f"{unique}.{output_format}")
+        jobs.append((index, url, target, log_path, trace_path))
+    
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_batch_job, url, output_dir, log_path, trace_path, cache, cache_size, asset_store,
+                            output_format, cloner_kwargs): (index, url, output_dir)
+                for index, url, output_dir, log_path, trace_path in jobs
+            }
+            for future in as_completed(futures):
+                index, url, output_dir = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:  # Worker chết (BrokenProcessPool...)
+                    result = BatchResult(url, str(output_dir), False, f"{type(e).__name__}: {e}",
+                                         0.0, 0.0, 0, 0)
+                results[index] = result
+                if on_result is not None:
+                    on_result(result)
+    return results
+
+
+def format_batch_summary(results, wall_time):
+    """Báo cáo tổng kết batch (list dòng text)"""
+    succeeded = [r for r in results if r.ok]
+    failed = [r for r in results if not r.ok]
+    job_time = sum(r.elapsed for r in results)
+    
+    lines = [
+        '=' * 60,
+        f"Batch completed: {len(succeeded)}/{len(results)} succeeded, {len(failed)} failed",
+        f"  Wall time: {wall_time:.1f}s (sum of job times {job_time:.1f}s, "
+        f"CPU {sum(r.cpu for r in results):.1f}s)",
+    ]
+    if succeeded:
+        slowest = max(succeeded, key=lambda r: r.elapsed)
+        lines.append(f"  Pages: {sum(r.pages for r in succeeded)}, files: {sum(r.files for r in succeeded)}, "
+                     f"slowest: {slowest.url} ({slowest.elapsed:.1f}s)")
+    if failed:
+        lines.append("  Failed:")
+        lines.extend(f"    ✗ {r.url}: {r.error}" for r in failed)
+    lines.append('=' * 60)
+    return lines
 
 
 def main():
+    # Subcommand serve (web_cloner_serve, cần aiohttp): import muộn để clone không phụ thuộc aiohttp
+    if sys.argv[1:2] == ['serve']:
+        from web_cloner_serve import main as serve_main
+        serve_main(sys.argv[2:])
+        return
+    
     parser = argparse.ArgumentParser(
         description='Clone toàn bộ website bao gồm tất cả tài nguyên static',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -526,39 +3688,196 @@ Ví dụ:
   python website_cloner.py https://example.com
   python website_cloner.py https://example.com -o my_site
   python website_cloner.py https://example.com -o my_site -d 5
+  python website_cloner.py https://example.com -j 16
+  python website_cloner.py https://example.com --cache
+  python website_cloner.py https://example.com -o site.zip
+  python website_cloner.py https://example.com -o - > site.tar.gz
+  python website_cloner.py --batch urls.txt -o sites --workers 4 -j 4
+  python website_cloner.py serve my_site --port 8000
         """
     )
     
-    parser.add_argument('url', help='URL của website cần clone')
+    parser.add_argument('url', nargs='?', help='URL của website cần clone')
     parser.add_argument('-o', '--output', default=None, 
-                       help='Thư mục output (mặc định: tên domain của website)')
+                       help='Thư mục output (mặc định: tên domain của website; với --batch: thư mục chứa '
+                            'các thư mục output, mặc định thư mục hiện tại). File .zip / .tar / .tar.gz: ghi '
+                            'thẳng vào archive; - = archive tar.gz ra stdout')
+    parser.add_argument('--output-format', choices=[f for f in OUTPUT_FORMATS if f != 'memory'], default=None,
+                       help='Định dạng output (mặc định đoán theo đuôi của -o); với --batch: mỗi website '
+                            'một archive <domain>.<định dạng>')
+    parser.add_argument('--batch', metavar='FILE',
+                       help='Clone nhiều website từ file danh sách URL (mỗi dòng một URL) trên process pool')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                       help='Số process song song khi chạy --batch (mặc định: min(4, số CPU))')
+    parser.add_argument('--log-dir', metavar='DIR',
+                       help='Với --batch: ghi log chi tiết của từng website vào DIR/<domain>.log')
+    parser.add_argument('--report', metavar='FILE',
+                       help='Với --batch: ghi báo cáo kết quả dạng JSON')
     parser.add_argument('-d', '--depth', type=int, default=3,
-                       help='Độ sâu crawl (mặc định: 3)')
+                       help='Độ sâu crawl link cùng domain, 0 = chỉ trang chính (mặc định: 3)')
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                       help='Số luồng download song song, 1 = tuần tự (mặc định: 8)')
+    parser.add_argument('--per-host', type=int, default=6,
+                       help='Số kết nối đồng thời tối đa tới mỗi host, tự giảm khi server quá tải (mặc định: 6)')
+    parser.add_argument('--retries', type=int, default=3,
+                       help='Số lần thử lại mỗi URL khi lỗi tạm thời (429/5xx, mất kết nối), có backoff và Retry-After')
+    parser.add_argument('--rate', type=float, default=None, metavar='REQ/S',
+                       help='Số request/giây tối đa tới mỗi host (mặc định không giới hạn)')
+    parser.add_argument('--range-threshold', type=int, default=8, metavar='MB',
+                       help='File media lớn hơn ngưỡng này được tải song song theo Range, có resume (mặc định: 8)')
+    parser.add_argument('--segments', type=int, default=4,
+                       help='Số kết nối Range song song cho mỗi file lớn, 1 = tắt (mặc định: 4)')
+    parser.add_argument('--cache', nargs='?', const='', default=None, metavar='DIR',
+                       help=f'Bật HTTP cache trên đĩa, dùng chung với GUI (mặc định: {HttpCache.DEFAULT_DIR})')
+    parser.add_argument('--cache-size', type=int, default=1024, metavar='MB',
+                       help='Dung lượng tối đa của cache, MB (mặc định: 1024)')
+    parser.add_argument('--asset-store', nargs='?', const='', default=None, metavar='DIR',
+                       help=f'Kho tài nguyên dùng chung giữa các clone, file output là hardlink vào kho '
+                            f'(mặc định: {AssetStore.DEFAULT_DIR})')
+    parser.add_argument('--cdn-domains', metavar='FILE',
+                       help='File danh sách domain CDN cần clone về local, mỗi dòng một domain '
+                            '(thay cho danh sách mặc định)')
+    parser.add_argument('--cdn-domain', action='append', default=[], metavar='DOMAIN',
+                       help='Thêm domain CDN (kể cả subdomain), dùng nhiều lần được')
+    parser.add_argument('--preconnect-domains', metavar='FILE',
+                       help='File danh sách domain có preconnect/dns-prefetch cần loại bỏ (thay cho mặc định)')
+    parser.add_argument('--preconnect-domain', action='append', default=[], metavar='DOMAIN',
+                       help='Thêm domain preconnect/dns-prefetch cần loại bỏ, dùng nhiều lần được')
+    parser.add_argument('--trace', metavar='FILE',
+                       help='Ghi file Chrome trace-event (mở bằng chrome://tracing hoặc Perfetto) để profile; '
+                            'với --batch: thư mục, mỗi website một file <domain>.trace.json')
+    parser.add_argument('--stream-html', nargs='?', type=float, const=0, default=None, metavar='MB',
+                       help='Rewrite streaming (ít bộ nhớ) cho trang HTML từ MB trở lên; không ghi MB = mọi trang')
+    parser.add_argument('--srcset', default='all', metavar='MODE',
+                       help='Ảnh srcset cần tải: all (mặc định), largest, độ rộng / mật độ mục tiêu (800w, 2x) '
+                            'hoặc số ứng viên N (trải đều, luôn có ảnh lớn nhất); srcset được rewrite tương ứng')
+    parser.add_argument('--optimize', nargs='?', const=','.join(DEFAULT_OPTIMIZE_STEPS), default=None,
+                       metavar='STEPS',
+                       help=f'Tối ưu output sau khi clone trên mọi core: các bước {",".join(OPTIMIZE_STEPS)} '
+                            f'cách nhau dấu phẩy (không ghi STEPS = {",".join(DEFAULT_OPTIMIZE_STEPS)}); '
+                            f'file không đổi từ lần trước được bỏ qua')
+    parser.add_argument('--parser', choices=PARSER_BACKENDS, default='html.parser',
+                       help='Parser HTML: html.parser (stdlib), lxml hoặc selectolax (nhanh hơn, cần cài thêm)')
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='INFO',
+                       help='Mức log tối thiểu được in ra (DEBUG để xem chi tiết từng URL trong CSS inline)')
+    parser.add_argument('--time-limit', type=float, default=None, metavar='SECONDS',
+                       help='Dừng clone (mỗi URL trong --batch) sau số giây này; phần đã tải được giữ lại để resume')
+    parser.add_argument('--no-resume', action='store_true',
+                       help=f'Bỏ qua journal ({CloneJournal.FILENAME}) của lần clone trước, tải lại từ đầu')
     
     args = parser.parse_args()
     
+    if (args.url is None) == (args.batch is None):
+        parser.error("cần đúng một trong hai: URL hoặc --batch FILE")
+    try:
+        parse_srcset_mode(args.srcset)
+    except ValueError as e:
+        parser.error(str(e))
+    optimize = args.optimize.split(',') if args.optimize is not None else None
+    unknown = [step for step in optimize or () if step not in OPTIMIZE_STEPS]
+    if unknown:
+        parser.error(f"--optimize: bước không hợp lệ {', '.join(unknown)} (chọn trong {', '.join(OPTIMIZE_STEPS)})")
+    if optimize and (args.output_format or guess_output_format(args.output or '')) != 'dir':
+        parser.error("--optimize chỉ dùng được với output dạng thư mục")
+    if args.batch is not None and args.output == '-':
+        parser.error("--batch không ghi ra stdout được")
+    if not parser_available(args.parser):
+        parser.error(f"--parser {args.parser} cần thư viện {args.parser}: pip install {args.parser}")
+    
     # Kiểm tra URL
-    if not args.url.startswith(('http://', 'https://')):
+    if args.url is not None and not args.url.startswith(('http://', 'https://')):
         print("Error: URL phải bắt đầu với http:// hoặc https://")
         sys.exit(1)
     
+    try:
+        cdn_domains = (load_domain_list(args.cdn_domains) if args.cdn_domains
+                       else list(WebsiteCloner.EXTERNAL_CDN_DOMAINS)) + args.cdn_domain
+        preconnect_domains = (load_domain_list(args.preconnect_domains) if args.preconnect_domains
+                              else list(WebsiteCloner.REMOVE_PRECONNECT_DOMAINS)) + args.preconnect_domain
+    except OSError as e:
+        print(f"Error: không đọc được file danh sách domain: {e}")
+        sys.exit(1)
+    
+    cloner_kwargs = dict(max_depth=args.depth, jobs=args.jobs, per_host_limit=args.per_host,
+                         range_threshold=args.range_threshold * 1024 * 1024, range_segments=args.segments,
+                         resume=not args.no_resume, log_level=args.log_level, time_limit=args.time_limit,
+                         stream_threshold=None if args.stream_html is None else int(args.stream_html * 1024 * 1024),
+                         parser=args.parser, retries=args.retries, host_rate=args.rate, srcset=args.srcset,
+                         optimize=optimize, external_cdn_domains=cdn_domains, remove_preconnect_domains=preconnect_domains)
+    
+    if args.batch is not None:
+        run_batch(args, cloner_kwargs)
+        return
+    
     # Tự động xác định thư mục output nếu không được cung cấp
     output_dir = args.output
     if output_dir is None:
-        parsed = urlparse(args.url)
-        domain = parsed.netloc
-        # Xử lý tên thư mục an toàn cho Windows (bỏ ký tự :)
-        safe_domain = domain.replace(':', '_')
-        output_dir = safe_domain
+        output_dir = default_output_dir(args.url)
         print(f"Output directory not specified. Using domain name: {output_dir}")
+    try:
+        output = open_output(output_dir, args.output_format)
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    if output_dir == '-':
+        # stdout là archive: log ra stderr
+        cloner_kwargs['log_callback'] = lambda message: print(message, file=sys.stderr)
     
     # Bắt đầu clone
-    cloner = WebsiteCloner(args.url, output_dir, args.depth)
+    http_cache = None
+    if args.cache is not None:
+        http_cache = HttpCache(args.cache or None, max_size=args.cache_size * 1024 * 1024)
+    
+    asset_store = AssetStore(args.asset_store or None) if args.asset_store is not None else None
+    
+    cloner = WebsiteCloner(args.url, output=output, http_cache=http_cache, asset_store=asset_store,
+                           trace_path=args.trace, **cloner_kwargs)
     cloner.clone()
     
-    print(f"\nMở file sau để xem kết quả:")
-    print(f"  file://{os.path.abspath(cloner.output_dir / 'index.html')}")
+    if output.persistent:
+        print(f"\nMở file sau để xem kết quả:")
+        print(f"  file://{os.path.abspath(cloner.output_dir / 'index.html')}")
+    elif output_dir != '-':
+        print(f"\nĐã ghi output vào: {output.label}")
+
+
+def run_batch(args, cloner_kwargs):
+    """Chế độ --batch của CLI: clone danh sách URL và in báo cáo tổng kết"""
+    try:
+        urls = read_url_list(args.batch)
+    except OSError as e:
+        print(f"Error: không đọc được file danh sách URL: {e}")
+        sys.exit(1)
+    
+    output_root = args.output or '.'
+    print(f"Batch: {len(urls)} URLs, {args.workers} workers × {args.jobs} downloads, output: {output_root}")
+    
+    def on_result(result):
+        if result.ok:
+            print(f"  ✓ {result.url} → {result.output_dir} "
+                  f"({result.pages} pages, {result.files} files, {result.elapsed:.1f}s)")
+        else:
+            print(f"  ✗ {result.url}: {result.error}")
+    
+    started = time.monotonic()
+    results = clone_batch(urls, output_root, workers=args.workers, log_dir=args.log_dir, trace_dir=args.trace,
+                          on_result=on_result, cache=args.cache, cache_size=args.cache_size * 1024 * 1024,
+                          asset_store=args.asset_store, output_format=args.output_format or 'dir', **cloner_kwargs)
+    wall_time = time.monotonic() - started
+    
+    print()
+    for line in format_batch_summary(results, wall_time):
+        print(line)
+    
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'wall_time': wall_time, 'results': [r._asdict() for r in results]},
+                      f, ensure_ascii=False, indent=2)
+        print(f"Report: {args.report}")
+    
+    if not all(r.ok for r in results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Process pool của --batch trong bản EXE (PyInstaller)
     main()
\ No newline at end of file
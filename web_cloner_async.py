@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Async Website Cloner - API asyncio cho WebsiteCloner
+Download qua aiohttp (connection pool có thể dùng chung giữa nhiều clone) và báo tiến trình
+bằng ProgressEvent thay vì print, để chạy nhiều clone trong cùng một event loop.
+
+Ví dụ:
+    async with aiohttp.ClientSession() as http:
+        cloner = AsyncWebsiteCloner('https://example.com', 'my_site', session=http)
+        async for event in cloner.events():
+            print(event.kind, event.url)
+"""
+
+import asyncio
+import contextlib
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlparse
+
+from web_cloner import WebsiteCloner, ProgressEvent, CloneCancelled
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+async def write_response(response, path, on_chunk=None):
+    """Ghi body của response aiohttp vào path mà không chặn event loop.
+    
+    Chunk được gom thành khối ~WRITE_BUFFER_SIZE rồi ghi trong executor (mở/đóng file cũng vậy);
+    khối trước đang ghi thì vẫn đọc tiếp khối sau, tối đa hai khối trong bộ nhớ.
+    on_chunk(số byte đã nhận) là coroutine gọi sau mỗi chunk (báo tiến trình, kiểm tra hủy).
+    Trả về số byte đã ghi.
+    """
+    loop = asyncio.get_running_loop()
+    f = await loop.run_in_executor(None, open, path, 'wb')
+    pending = None
+    buffer = []
+    buffered = received = 0
+    try:
+        async for chunk in response.content.iter_chunked(65536):
+            received += len(chunk)
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= WRITE_BUFFER_SIZE:
+                if pending is not None:
+                    await pending
+                pending = loop.run_in_executor(None, f.write, b''.join(buffer))
+                buffer, buffered = [], 0
+            if on_chunk is not None:
+                await on_chunk(received)
+        if pending is not None:
+            await pending
+            pending = None
+        if buffer:
+            await loop.run_in_executor(None, f.write, b''.join(buffer))
+    finally:
+        if pending is not None:
+            # Lỗi / bị hủy giữa chừng: chờ lần ghi đang chạy xong rồi mới đóng file
+            with contextlib.suppress(Exception):
+                await asyncio.wait([pending])
+        await loop.run_in_executor(None, f.close)
+    return received
+
+
+class AsyncWebsiteCloner(WebsiteCloner):
+    if aiohttp is not None:
+        RETRY_EXCEPTIONS = WebsiteCloner.RETRY_EXCEPTIONS + (
+            aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+        NO_RETRY_EXCEPTIONS = WebsiteCloner.NO_RETRY_EXCEPTIONS + (
+            aiohttp.ClientSSLError, getattr(aiohttp, 'ClientConnectorDNSError', ()))  # aiohttp >= 3.10
+    
+    def __init__(self, base_url, output_dir="cloned_site", max_depth=3, session=None,
+                 timeout=30, **kwargs):
+        if aiohttp is None:
+            raise ImportError("AsyncWebsiteCloner cần thư viện aiohttp: pip install aiohttp")
+        
+        # Mặc định không print gì, log chỉ đi qua log_callback
+        kwargs.setdefault('log_callback', lambda message: None)
+        super().__init__(base_url, output_dir, max_depth, **kwargs)
+        
+        self.http = session  # aiohttp.ClientSession dùng chung (tùy chọn)
+        self.timeout = timeout
+        self._loop = None
+        self._http = None
+        self._slots = None  # Giới hạn số download đồng thời của clone này
+        self._ahost_slots = {}
+        self._rewrite_executor = None
+        self._subscribers = []
+    
+    def _loop_from_thread(self):
+        """Event loop của clone nếu đang được gọi từ thread khác (executor), ngược lại None"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return None
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        return None if running is loop else loop
+    
+    def emit(self, kind, url, **data):
+        """Chuyển ProgressEvent về thread của event loop rồi mới gọi callback/iterator"""
+        event = ProgressEvent(kind, url, **data)
+        loop = self._loop_from_thread()
+        if loop is None:
+            self._deliver(event)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event)
+    
+    def _deliver(self, event):
+        if self.progress_callback is not None:
+            self.progress_callback(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+    
+    def prefetch(self, urls):
+        """Gọi từ thread rewrite (chuỗi @import, URL tìm thấy trong JS): chuyển về event loop
+        để aprefetch tải song song qua aiohttp, chờ xong rồi rewrite tiếp.
+        
+        Thread rewrite là thread riêng của clone (_run_rewrite), còn aprefetch chỉ dùng executor
+        mặc định của loop, nên việc chờ ở đây không chiếm mất thread mà aprefetch cần.
+        """
+        loop = self._loop_from_thread()
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aprefetch(urls), loop).result()
+    
+    def _fetch_staged(self, url):
+        """URL chưa được prefetch (download_resource trong thread rewrite): vẫn tải qua aiohttp trên
+        event loop. fetch_ranged (file media lớn) là phần duy nhất còn tải bằng requests"""
+        loop = self._loop_from_thread()
+        if loop is None:
+            return super()._fetch_staged(url)
+        return asyncio.run_coroutine_threadsafe(self._afetch_staged(url), loop).result()
+    
+    async def acheck(self):
+        """Phiên bản async của cancel_token.check(): chờ bằng asyncio.sleep khi đang pause"""
+        token = self.cancel_token
+        while True:
+            if token.cancelled:
+                raise CloneCancelled(token.reason)
+            if not token.paused:
+                return
+            await asyncio.sleep(0.2)
+    
+    async def asleep(self, seconds):
+        """Phiên bản async của cancel_token.sleep() (retry backoff)"""
+        deadline = time.monotonic() + seconds
+        while True:
+            await self.acheck()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, 0.2))
+    
+    @contextlib.asynccontextmanager
+    async def _ahost_slot(self, url):
+        """Semaphore per_host_limit (đánh thức ngay khi có slot) rồi tới HostThrottle dùng chung
+        với phần đồng bộ (concurrency AIMD, token bucket, Retry-After), chờ bằng asyncio.sleep"""
+        host = urlparse(url).netloc.lower()
+        slot = self._ahost_slots.get(host)
+        if slot is None:
+            slot = asyncio.Semaphore(self.per_host_limit)
+            self._ahost_slots[host] = slot
+        throttle = self._host_slot(url)
+        async with slot:
+            while True:
+                wait = throttle.try_acquire()
+                if not wait:
+                    break
+                await self.acheck()
+                await asyncio.sleep(min(wait, 0.5))
+            try:
+                yield throttle
+            finally:
+                throttle.release()
+    
+    async def _afetch_staged(self, url):
+        """Tải URL vào file tạm bằng aiohttp. Trả về (file tạm, content-type) hoặc Exception"""
+        temp_path = None
+        info = {}
+        started = None
+        try:
+            await self.acheck()
+            self.log(f"Downloading: {url}")
+            temp_path = self._staging_path(url)
+            attempt = 0
+            while True:
+                try:
+                    async with self._slots:
+                        if started is None:
+                            started = time.perf_counter()
+                        result = await self._afetch_to_file(url, temp_path, info)
+                    break
+                except Exception as e:
+                    delay = self.retry_delay(url, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    info['retries'] = attempt
+                    self.log(f"  ! {url}: {e}; retry {attempt}/{self.retries} in {delay:.1f}s", 'WARNING')
+                await self.asleep(delay)
+            
+            duration = time.perf_counter() - started
+            self.metrics.span('fetch', started, duration, url=url)
+            self.metrics.record_url(url, bytes=temp_path.stat().st_size, latency=duration, **info)
+            return result
+        except BaseException as e:
+            if temp_path is not None and temp_path.exists():
+                temp_path.unlink()
+            if not isinstance(e, Exception):  # CloneCancelled / asyncio.CancelledError
+                raise
+            if started is not None:
+                self.record_failed_fetch(url, e, started, info)
+            return e
+    
+    async def _afetch_to_file(self, url, temp_path, info):
+        """Phiên bản aiohttp của fetch_to_file. Trả về (file tạm, content-type)"""
+        cache = self.http_cache
+        entry = await self._run_sync(cache.lookup, url) if cache is not None else None
+        if cache is not None:
+            info['cache'] = 'miss'
+        if entry is not None and cache.is_fresh(entry):
+            self.log(f"  → Cache hit: {url}")
+            info['cache'] = 'hit'
+            if await self._run_sync(cache.copy_to, entry, temp_path):
+                info['status'] = 200  # Bản cache còn hạn: như response 200 của server
+                return temp_path, entry.content_type
+            self.log(f"  → Cache body evicted, downloading: {url}")
+            info['cache'] = 'miss'
+            entry = None
+        
+        # File media lớn: tải theo Range bằng implementation đồng bộ (trong executor)
+        if entry is None and self.range_segments > 1 and self.is_large_file_candidate(url):
+            content_type = await self._run_sync(self.fetch_ranged, url, temp_path)
+            if content_type is not None:
+                info.update(status=206, ranged=True)
+                return temp_path, content_type
+                
+        headers = dict(self.session.headers)
+        if entry is not None:
+            headers.update(cache.conditional_headers(entry))
+        
+        self.emit('started', url)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout,
+                                        sock_read=self.timeout)
+        # Slot của host chỉ giữ quanh GET (như fetch_to_file): fetch_ranged ở trên tự lấy slot trong thread
+        async with self._ahost_slot(url):
+            sent = time.perf_counter()
+            async with self._http.get(url, headers=headers, timeout=timeout) as response:
+                info['status'] = response.status
+                self._host_feedback(url, time.perf_counter() - sent, response.status)
+                if response.status == 304 and entry is not None:
+                    self.log(f"  → Cache revalidated (304): {url}")
+                    info['cache'] = 'revalidated'
+                    await self._run_sync(cache.revalidated, entry, response.headers)
+                    if await self._run_sync(cache.copy_to, entry, temp_path):
+                        return temp_path, entry.content_type
+                    # Body bị process khác evict sau lookup: tải lại không kèm header điều kiện
+                    self.log(f"  → Cache body evicted, downloading: {url}")
+                    info['cache'] = 'miss'
+                    async with self._http.get(url, headers=dict(self.session.headers),
+                                              timeout=timeout) as fresh:
+                        info['status'] = fresh.status
+                        return await self._astream_to_file(fresh, url, temp_path)
+                
+                return await self._astream_to_file(response, url, temp_path)
+    
+    async def _astream_to_file(self, response, url, temp_path):
+        """Ghi body của response aiohttp vào temp_path và lưu vào HTTP cache"""
+        response.raise_for_status()
+        
+        total = response.content_length
+        
+        async def on_chunk(received):
+            await self.acheck()
+            self.emit('bytes', url, bytes=received, total=total)
+        
+        await write_response(response, temp_path, on_chunk)
+        
+        if self.http_cache is not None:
+            await self._run_sync(self.http_cache.store, url, response.headers, temp_path)
+        return temp_path, response.headers.get('Content-Type', '')
+    
+    async def aprefetch(self, urls):
+        """Tải song song danh sách URL vào vùng staging qua aiohttp"""
+        pending = self._filter_prefetch(urls)
+        for url in pending:
+            self.emit('queued', url)
+        results = await asyncio.gather(*(self._afetch_staged(url) for url in pending), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        for url, result in zip(pending, results):
+            self.prefetched[url] = result
+    
+    async def _run_sync(self, func, *args):
+        """Chạy I/O chặn (HTTP cache SQLite, ghi file, journal) trong executor mặc định của event loop"""
+        return await self._loop.run_in_executor(None, functools.partial(func, *args))
+    
+    async def _run_rewrite(self, func, *args):
+        """Chạy parse/rewrite và download_resource trong thread riêng của clone này: các hàm này có thể
+        chờ event loop (prefetch, _fetch_staged) mà không chiếm thread của executor mặc định"""
+        return await self._loop.run_in_executor(self._rewrite_executor, functools.partial(func, *args))
+    
+    def _pending_pages(self):
+        """Các trang sắp tới trong frontier chưa có trong journal (kiểm tra journal đọc file nên chạy ngoài loop)"""
+        return [url for url, _ in islice(self.frontier, self.max_pending) if self.completed_page(url) is None]
+    
+    async def _aprocess_html_streaming(self, html_path, page_url, depth):
+        """Phiên bản async của process_html_streaming (prefetch qua aiohttp giữa hai lượt).
+        Trả về False nếu lượt quét lỗi"""
+        try:
+            scan = await self._run_rewrite(self.scan_html_stream, html_path, page_url)
+            if depth < self.max_depth:
+                self.enqueue_pages(scan.links, depth + 1)
+            await self.aprefetch(scan.urls)
+            await self.aprefetch(await self._run_rewrite(self.collect_staged_css_urls, scan.stylesheets)
+                                 + await self._run_rewrite(self.collect_staged_js_urls, scan.scripts))
+        except Exception as e:
+            self.log(f"Error processing HTML {html_path}: {e}", 'ERROR')
+            return False
+        
+        if await self._run_rewrite(self.rewrite_html_stream, html_path, page_url):
+            await self._run_sync(self.record_page, page_url, html_path, scan.urls, scan.links)
+        return True
+    
+    async def clone(self):
+        """Clone website, trả về đường dẫn index.html (hoặc None nếu lỗi)"""
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.jobs)
+        self._ahost_slots = {}
+        self._rewrite_executor = ThreadPoolExecutor(max_workers=1)
+        
+        self.log(f"Starting website clone: {self.base_url}")
+        self.log(f"Output directory: {self.output.label}")
+        
+        self._http = self.http
+        if self._http is None:
+            connector = aiohttp.TCPConnector(limit=self.jobs, limit_per_host=self.per_host_limit)
+            self._http = aiohttp.ClientSession(connector=connector)
+        
+        if self.resumed:
+            self.log(f"Resuming from journal: {self.resumed} resources already downloaded")
+        
+        self.start_frontier()
+        main_html_path = None
+        
+        try:
+            while self.frontier:
+                await self.acheck()
+                page_url, depth = self.frontier.popleft()
+                if await self._run_sync(self.skip_completed_page, page_url, depth):
+                    if depth == 0:
+                        main_html_path = self.page_paths[self.page_key(page_url)]
+                    continue
+                
+                await self.aprefetch([page_url] + await self._run_sync(self._pending_pages))
+                
+                html_path = await self._run_rewrite(functools.partial(
+                    self.download_resource, page_url, page_path=self.page_paths[self.page_key(page_url)]))
+                if not html_path:
+                    if depth == 0:
+                        self.log("Failed to download main page!", 'ERROR')
+                        return None
+                    await self._run_sync(self.page_failed, page_url)
+                    continue
+                if depth == 0:
+                    main_html_path = html_path
+                
+                if self.use_streaming(html_path):
+                    if await self._aprocess_html_streaming(html_path, page_url, depth):
+                        self.pages_cloned.append(html_path)
+                    await self._run_sync(self.output.commit, html_path)
+                    continue
+                
+                try:
+                    soup = await self._run_rewrite(self.parse_html, html_path)
+                    tasks = await self._run_rewrite(self.scan_html, soup)
+                    links = await self._run_rewrite(self.page_links, soup, page_url, tasks)
+                    if depth < self.max_depth:
+                        self.enqueue_pages(links, depth + 1)
+                    urls = await self._run_rewrite(self.collect_html_urls, soup, page_url, tasks)
+                    await self.aprefetch(urls)
+                    css_urls = await self._run_rewrite(self.collect_stylesheet_urls, soup, page_url, tasks)
+                    js_urls = await self._run_rewrite(self.collect_script_urls, soup, page_url, tasks)
+                    await self.aprefetch(css_urls + js_urls)
+                except Exception as e:
+                    self.log(f"Error processing HTML {html_path}: {e}", 'ERROR')
+                    continue
+                
+                if await self._run_rewrite(self.rewrite_html, soup, html_path, page_url, tasks):
+                    await self._run_sync(self.record_page, page_url, html_path, urls, links)
+                await self._run_sync(self.output.commit, html_path)
+                self.pages_cloned.append(html_path)
+            
+            if self.optimize:
+                await self._run_sync(self.optimize_clone)
+        except CloneCancelled as e:
+            self.log_cancelled(e)
+            return None
+        except asyncio.CancelledError:
+            # Task bị cancel: báo các thread trong executor (fetch_ranged, rewrite) dừng luôn
+            self.cancel_token.cancel('interrupted')
+            raise
+        finally:
+            if self.http is None:
+                await self._http.close()
+            self._http = None
+            await self._run_sync(self.close)
+            await self._run_sync(self.write_metrics, main_html_path)
+            await self._run_sync(self.output.close)
+            self._rewrite_executor.shutdown(wait=False)
+            self._rewrite_executor = None
+        
+        self.log(f"✓ Clone completed! Pages: {len(self.pages_cloned)}, "
+                 f"total files downloaded: {len(self.downloaded_urls)}", 'SUCCESS')
+        return main_html_path
+    
+    async def events(self):
+        """Chạy clone và yield từng ProgressEvent (async iterator)"""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        task = asyncio.ensure_future(self.clone())
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            await task
+        finally:
+            self._subscribers.remove(queue)
+            if not task.done():
+                task.cancel()
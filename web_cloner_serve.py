@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Serve mode - phục vụ thư mục clone qua HTTP local, tự tải các file còn thiếu từ origin
+Tài nguyên chỉ được JS yêu cầu lúc chạy không có trong clone tĩnh: khi trình duyệt xin một file
+chưa có, server tìm URL gốc (journal của clone, domain trang gốc, các domain CDN), tải một lần,
+lưu vào output_dir, ghi vào journal rồi trả về. Clone được bổ sung dần mà không chạy lại clone().
+
+Chạy:
+    python web_cloner.py serve my_site
+    python web_cloner.py serve my_site --port 8080 --origin https://example.com
+    python web_cloner.py serve my_site --offline
+"""
+
+import argparse
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import posixpath
+import re
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote, urlparse
+
+from web_cloner import CloneJournal, DomainMatcher, WebsiteCloner, load_domain_list
+from web_cloner_async import write_response
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = web = None
+
+
+class CloneServer:
+    """HTTP server (aiohttp) cho thư mục clone, tải file thiếu từ origin theo yêu cầu.
+    
+    URL gốc của một đường dẫn thiếu được thử theo thứ tự: URL trong journal (file đã clone nhưng
+    bị xóa), domain trang gốc (origin, mặc định lấy từ clone_metrics.json), rồi các host CDN mà
+    clone đã dùng (JS có CDN root bị thay bằng '.' hoặc '' nên URL CDN thành đường dẫn trên site
+    local).
+    Mỗi đường dẫn chỉ được tải một lần: request trùng trong lúc đang tải chờ chung một lần tải,
+    đường dẫn mà mọi origin đều trả 4xx được nhớ lại và trả 404 ngay (lỗi mạng, timeout, 5xx, 429
+    thì không nhớ, request sau thử lại).
+    """
+    
+    def __init__(self, output_dir, origin=None, cdn_domains=None, fetch_missing=True, session=None,
+                 timeout=30, log_callback=None):
+        if aiohttp is None:
+            raise ImportError("Serve mode cần thư viện aiohttp: pip install aiohttp")
+        
+        self.root = Path(output_dir).resolve()
+        if not self.root.is_dir():
+            raise FileNotFoundError(f"Output directory not found: {self.root}")
+        self.fetch_missing = fetch_missing
+        self.http = session  # aiohttp.ClientSession dùng chung (tùy chọn)
+        self.timeout = timeout
+        self.log_callback = log_callback
+        
+        # Journal của clone = url_mapping lưu trên đĩa: đường dẫn tương đối -> URL gốc
+        self.journal = CloneJournal(self.root)
+        self.url_for_path = {entry['p']: url for url, entry in self.journal.entries.items()}
+        
+        origin = origin or self._cloned_url()
+        self.origin = f"{urlparse(origin).scheme}://{urlparse(origin).netloc}" if origin else None
+        
+        # Host CDN đã xuất hiện trong clone, host dùng nhiều nhất thử trước
+        matcher = DomainMatcher(WebsiteCloner.EXTERNAL_CDN_DOMAINS if cdn_domains is None else cdn_domains)
+        hosts = Counter(f"{urlparse(url).scheme}://{urlparse(url).netloc}"
+                        for url in self.journal.entries if matcher.matches(url))
+        self.cdn_roots = [host for host, _ in hosts.most_common() if host != self.origin]
+        
+        self.fetched = 0
+        self.failed = set()  # Đường dẫn đã thử mọi URL gốc mà không tải được
+        self._inflight = {}  # Đường dẫn -> task đang tải
+        self._http = None
+        self._runner = None
+    
+    def log(self, message):
+        if self.log_callback is not None:
+            self.log_callback(message)
+        else:
+            print(message)
+    
+    def _cloned_url(self):
+        """URL đã clone vào thư mục (clone_metrics.json, hoặc trang chính trong journal)"""
+        try:
+            with open(self.root / WebsiteCloner.METRICS_FILENAME, 'r', encoding='utf-8') as f:
+                return json.load(f)['url']
+        except (OSError, ValueError, KeyError):
+            pass
+        for url, entry in self.journal.entries.items():
+            if entry['k'] == 'page' and entry['p'] == 'index.html':
+                return url
+        return None
+    
+    def local_name(self, request_path, query=''):
+        """Đường dẫn tương đối trong output_dir của request (None nếu ra ngoài root hoặc là file ẩn).
+        
+        Có query string thì hash của query nằm trong tên file (a.js?v=2 -> a.q<hash>.js), để các
+        phiên bản khác nhau của cùng một đường dẫn được tải và lưu riêng.
+        """
+        path = posixpath.normpath('/' + request_path.lstrip('/')).lstrip('/')
+        parts = [re.sub(r'[<>:"\\|?*]', '_', part) for part in path.split('/') if part not in ('', '.')]
+        if any(part.startswith('.') for part in parts):
+            return None  # Journal, staging... không phục vụ ra ngoài
+        if request_path.endswith('/') or not parts:
+            parts.append('index.html')
+        if query:
+            tag = 'q' + hashlib.md5(query.encode()).hexdigest()[:8]
+            stem, dot, ext = parts[-1].rpartition('.')
+            parts[-1] = f"{stem}.{tag}.{ext}" if dot else f"{parts[-1]}.{tag}"
+        return '/'.join(parts)
+    
+    def find_local(self, name):
+        """File có sẵn cho đường dẫn name (kể cả trang lưu theo page_local_path: x/index.html, x.php.html)"""
+        for candidate in (name, f"{name}/index.html", f"{name}.html"):
+            path = self.root / candidate
+            if path.is_file():
+                return path
+        return None
+    
+    def origin_urls(self, name, raw_path, query=''):
+        """Các URL gốc có thể của đường dẫn thiếu, theo thứ tự thử"""
+        urls = []
+        if name in self.url_for_path:
+            urls.append(self.url_for_path[name])
+        suffix = quote(raw_path, safe="/%:@!$&'()*+,;=~") + (f"?{query}" if query else '')
+        roots = ([self.origin] if self.origin else []) + self.cdn_roots
+        urls.extend(root + suffix for root in roots)
+        return list(dict.fromkeys(urls))
+    
+    async def handle(self, request):
+        name = self.local_name(request.path)
+        if name is None:
+            raise web.HTTPNotFound()
+        path = self.find_local(name)
+        if path is None and request.query_string:
+            # File của clone được lưu không kèm query; chưa có thì dùng bản riêng theo query
+            name = self.local_name(request.path, request.query_string)
+            path = self.find_local(name)
+        if path is None and self.fetch_missing:
+            path = await self.fetch(name, request.rel_url.raw_path, request.query_string)
+        if path is None:
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+    
+    async def fetch(self, name, raw_path, query=''):
+        """Tải đường dẫn thiếu từ origin; các request trùng trong lúc đang tải chờ chung một task"""
+        if name in self.failed:
+            return None
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(name, raw_path, query))
+            self._inflight[name] = task
+            task.add_done_callback(lambda _: self._inflight.pop(name, None))
+        # shield: client ngắt kết nối không hủy lần tải mà các request khác đang chờ
+        return await asyncio.shield(task)
+    
+    async def _fetch(self, name, raw_path, query):
+        path = self.root / name
+        loop = asyncio.get_running_loop()
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        transient = False  # Có URL gốc lỗi tạm thời (mạng, timeout, 5xx, 429): chưa kết luận là không có
+        for url in self.origin_urls(name, raw_path, query):
+            temp_path = path.with_name(f"{path.name}.tmp")
+            try:
+                async with self._http.get(url, timeout=timeout) as response:
+                    if response.status != 200:
+                        transient = transient or response.status in (408, 429) or response.status >= 500
+                        continue
+                    await loop.run_in_executor(None, functools.partial(path.parent.mkdir, parents=True,
+                                                                       exist_ok=True))
+                    await write_response(response, temp_path)
+                # Qua file tạm + os.replace: không ghi đè lên hardlink của AssetStore
+                await loop.run_in_executor(None, os.replace, temp_path, path)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                transient = True
+                self.log(f"  ✗ Error fetching {url}: {e}")
+                await loop.run_in_executor(None, functools.partial(temp_path.unlink, missing_ok=True))
+                continue
+            
+            await loop.run_in_executor(None, self.journal.record, 'asset', url, path)
+            self.url_for_path[name] = url
+            self.fetched += 1
+            self.log(f"  ✓ Fetched missing /{name} ← {url}")
+            return path
+        
+        if transient:
+            # Không nhớ vào failed: request sau sẽ thử lại
+            self.log(f"  ✗ Missing /{name} (origin temporarily unavailable)")
+        else:
+            self.failed.add(name)
+            self.log(f"  ✗ Missing /{name} (not found on origin)")
+        return None
+    
+    async def start(self, host='127.0.0.1', port=8000):
+        """Bắt đầu phục vụ (port=0: chọn port trống). Trả về (host, port) thực tế"""
+        self._http = self.http or aiohttp.ClientSession(headers={'User-Agent': WebsiteCloner.USER_AGENT})
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return self._runner.addresses[0][:2]
+    
+    async def stop(self):
+        # Chờ các lần tải đang dở xong để file và journal không bị cắt giữa chừng
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._http is not None and self.http is None:
+            await self._http.close()
+        self._http = None
+        self.journal.close()
+
+
+async def serve(output_dir, host='127.0.0.1', port=8000, **kwargs):
+    """Chạy CloneServer cho tới khi bị hủy (Ctrl+C)"""
+    server = CloneServer(output_dir, **kwargs)
+    host, port = await server.start(host, port)
+    server.log(f"Serving {server.root} at http://{host}:{port}/")
+    if server.fetch_missing:
+        server.log(f"Missing files are fetched from: {', '.join(([server.origin] if server.origin else []) + server.cdn_roots) or '(no origin)'}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        server.log(f"Stopped. Fetched {server.fetched} missing files, {len(server.failed)} not found")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='web_cloner.py serve',
+        description='Phục vụ thư mục clone qua HTTP local, tự tải file còn thiếu từ website gốc')
+    parser.add_argument('output_dir', help='Thư mục output của clone')
+    parser.add_argument('--host', default='127.0.0.1', help='Địa chỉ lắng nghe (mặc định: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='Port (mặc định: 8000)')
+    parser.add_argument('--origin', metavar='URL',
+                        help='Website gốc để tải file thiếu (mặc định: URL đã clone, lấy từ clone_metrics.json)')
+    parser.add_argument('--cdn-domains', metavar='FILE',
+                        help='File danh sách domain CDN, mỗi dòng một domain (thay cho danh sách mặc định)')
+    parser.add_argument('--cdn-domain', action='append', default=[], metavar='DOMAIN',
+                        help='Thêm domain CDN (kể cả subdomain), dùng nhiều lần được')
+    parser.add_argument('--offline', action='store_true', help='Chỉ phục vụ file có sẵn, không tải file thiếu')
+    args = parser.parse_args(argv)
+    
+    if aiohttp is None:
+        parser.error("serve cần thư viện aiohttp: pip install aiohttp")
+    try:
+        cdn_domains = (load_domain_list(args.cdn_domains) if args.cdn_domains
+                       else list(WebsiteCloner.EXTERNAL_CDN_DOMAINS)) + args.cdn_domain
+    except OSError as e:
+        parser.error(f"không đọc được file danh sách domain: {e}")
+    
+    try:
+        asyncio.run(serve(args.output_dir, args.host, args.port, origin=args.origin, cdn_domains=cdn_domains,
+                          fetch_missing=not args.offline))
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
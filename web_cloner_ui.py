@@ -2,30 +2,40 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import sys
 import threading
-import queue
+from collections import deque
 from urllib.parse import urlparse
 import os
 
 # Import modules từ web_cloner.py
 # Vì cả 2 file cùng thư mục nên import trực tiếp được
 try:
-    from web_cloner import WebsiteCloner
+    from web_cloner import WebsiteCloner, HttpCache, CancelToken, default_output_dir, LOG_LEVELS
 except ImportError:
     messagebox.showerror("Lỗi", "Không tìm thấy file web_cloner.py! Vui lòng đặt file này cùng thư mục với web_cloner.py")
     sys.exit(1)
 
 class PrintRedirector:
-    """Redirect stdout/stderr tới queue để UI cập nhật"""
-    def __init__(self, text_queue):
-        self.text_queue = text_queue
+    """Redirect stdout/stderr tới log buffer của UI, gom các mảnh print thành từng dòng"""
+    def __init__(self, emit, level='INFO'):
+        self.emit = emit
+        self.level = level
+        self.pending = ''
 
     def write(self, string):
-        self.text_queue.put(string)
+        lines = (self.pending + string).split('\n')
+        self.pending = lines.pop()
+        for line in lines:
+            self.emit(self.level, line)
 
     def flush(self):
-        pass
+        if self.pending:
+            self.emit(self.level, self.pending)
+            self.pending = ''
 
 class WebClonerUI:
+    MAX_LOG_LINES = 5000  # Số dòng tối đa giữ trong khung log
+    LOG_INTERVAL = 100  # ms giữa hai lần cập nhật khung log
+    
     def __init__(self, root):
         self.root = root
         self.root.title("Website Cloner Pro GUI")
@@ -39,10 +49,15 @@ class WebClonerUI:
         self.url_var = tk.StringVar()
         self.output_var = tk.StringVar(value="cloned_site")
         self.depth_var = tk.IntVar(value=4)  # Mặc định độ sâu là 4 theo yêu cầu
+        self.use_cache_var = tk.BooleanVar(value=False)  # Tắt mặc định như CLI (--cache)
         self.is_running = False
+        self.cancel_token = None  # CancelToken của clone đang chạy (nút Dừng / Tạm dừng)
+        self.http_cache = None  # HttpCache dùng chung với CLI (--cache), tạo khi cần
         
-        # Queue cho logging
-        self.log_queue = queue.Queue()
+        # Log từ thread clone: (level, message) được append vào deque (thread-safe), UI gom cả lô
+        # mỗi LOG_INTERVAL ms. maxlen = giới hạn scrollback: log cũ hơn sẽ bị bỏ trước khi vẽ
+        self.log_pending = deque(maxlen=self.MAX_LOG_LINES)
+        self.log_level_var = tk.StringVar(value='INFO')
         
         self._create_widgets()
         self._setup_logging()
@@ -76,6 +91,15 @@ class WebClonerUI:
         depth_spinbox = ttk.Spinbox(config_frame, from_=1, to=10, textvariable=self.depth_var, width=5)
         depth_spinbox.grid(row=2, column=1, sticky=tk.W, padx=5, pady=5)
         
+        # HTTP cache
+        ttk.Checkbutton(config_frame, text=f"Dùng HTTP cache ({HttpCache.DEFAULT_DIR})",
+                        variable=self.use_cache_var).grid(row=3, column=1, columnspan=2, sticky=tk.W, padx=5, pady=5)
+        
+        # Mức log
+        ttk.Label(config_frame, text="Mức log:").grid(row=4, column=0, sticky=tk.W, pady=5)
+        ttk.Combobox(config_frame, textvariable=self.log_level_var, values=list(LOG_LEVELS),
+                     state='readonly', width=10).grid(row=4, column=1, sticky=tk.W, padx=5, pady=5)
+        
         # Configure grid weights
         config_frame.columnconfigure(1, weight=1)
         
@@ -86,6 +110,9 @@ class WebClonerUI:
         self.start_btn = ttk.Button(control_frame, text="🚀 BẮT ĐẦU CLONE", command=self._start_clone_thread)
         self.start_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
         
+        self.pause_btn = ttk.Button(control_frame, text="⏸ TẠM DỪNG", command=self._toggle_pause, state=tk.DISABLED)
+        self.pause_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        
         self.stop_btn = ttk.Button(control_frame, text="⏹ DỪNG", command=self._stop_clone, state=tk.DISABLED)
         self.stop_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
         
@@ -97,6 +124,7 @@ class WebClonerUI:
         self.log_text.pack(fill=tk.BOTH, expand=True)
         
         # Tags coloring
+        self.log_text.tag_config('DEBUG', foreground='gray')
         self.log_text.tag_config('INFO', foreground='black')
         self.log_text.tag_config('ERROR', foreground='red')
         self.log_text.tag_config('SUCCESS', foreground='green')
@@ -155,29 +183,43 @@ class WebClonerUI:
             self.user_modified_output = False 
             self._auto_update_output_folder()
 
-    def _log(self, message, tag='INFO'):
+    def _emit_log(self, level, message):
+        """log_handler của cloner (gọi từ thread clone): chỉ append, không đụng tới widget"""
+        self.log_pending.append((level, message))
+
+    def _flush_log(self):
+        """Vẽ toàn bộ log đang chờ trong một lần insert cho mỗi đoạn cùng mức"""
+        batch = []
+        try:
+            while True:
+                batch.append(self.log_pending.popleft())
+        except IndexError:
+            pass
+        if not batch:
+            return
+        
+        # Gộp các dòng liên tiếp cùng mức thành (text, tag, text, tag, ...) cho một lệnh insert
+        chunks = []
+        for level, message in batch:
+            if chunks and chunks[-1] == level:
+                chunks[-2] += message + '\n'
+            else:
+                chunks += [message + '\n', level]
+        
+        follow = self.log_text.yview()[1] >= 0.999  # Chỉ tự cuộn khi user đang ở cuối
         self.log_text.configure(state='normal')
-        self.log_text.insert(tk.END, message, tag)
-        self.log_text.see(tk.END)
+        self.log_text.insert(tk.END, *chunks)
+        lines = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if lines > self.MAX_LOG_LINES:
+            self.log_text.delete('1.0', f'{lines - self.MAX_LOG_LINES + 1}.0')
         self.log_text.configure(state='disabled')
+        if follow:
+            self.log_text.see(tk.END)
 
     def _setup_logging(self):
-        """Kiểm tra queue và update log text"""
-        while not self.log_queue.empty():
-            msg = self.log_queue.get()
-            # Simple heuristic for coloring based on content
-            tag = 'INFO'
-            if "Error" in msg or "Fail" in msg or "✗" in msg:
-                tag = 'ERROR'
-            elif "Success" in msg or "✓" in msg or "Saved" in msg:
-                tag = 'SUCCESS'
-            elif "Warning" in msg:
-                tag = 'WARNING'
-                
-            self._log(msg, tag)
-            
-        # Schedule next check
-        self.root.after(100, self._setup_logging)
+        """Định kỳ đẩy log đang chờ lên khung log"""
+        self._flush_log()
+        self.root.after(self.LOG_INTERVAL, self._setup_logging)
 
     def _validate_inputs(self):
         url = self.url_var.get().strip()
@@ -194,8 +236,11 @@ class WebClonerUI:
             return
 
         self.is_running = True
+        self.cancel_token = CancelToken()
         self.start_btn.config(state=tk.DISABLED)
+        self.pause_btn.config(state=tk.NORMAL, text="⏸ TẠM DỪNG")
         self.stop_btn.config(state=tk.NORMAL)
+        self.log_pending.clear()
         self.log_text.configure(state='normal')
         self.log_text.delete(1.0, tk.END) # Clear old log
         self.log_text.configure(state='disabled')
@@ -213,45 +258,57 @@ class WebClonerUI:
              # Tuy nhiên logic dưới đây sẽ chạy trong thread, không nên update GUI var trực tiếp mà không cẩn thận
              pass 
 
+        if self.use_cache_var.get() and self.http_cache is None:
+            self.http_cache = HttpCache()
+        http_cache = self.http_cache if self.use_cache_var.get() else None
+        
         # Create thread
-        self.clone_thread = threading.Thread(target=self._run_cloner, args=(url, output_dir, self.depth_var.get()))
+        self.clone_thread = threading.Thread(target=self._run_cloner, args=(url, output_dir, self.depth_var.get(), http_cache,
+                                                                             self.log_level_var.get(), self.cancel_token))
         self.clone_thread.daemon = True # Kill thread if main closes
         self.clone_thread.start()
 
-    def _run_cloner(self, url, output, depth):
-        # Redirect stdout/stderr
+    def _run_cloner(self, url, output, depth, http_cache=None, log_level='INFO', cancel_token=None):
+        # Log của cloner đi qua log_handler (có mức sẵn); stdout/stderr chỉ còn bắt print lạc
+        # (thư viện khác, traceback)
         original_stdout = sys.stdout
         original_stderr = sys.stderr
         
-        sys.stdout = PrintRedirector(self.log_queue)
-        sys.stderr = PrintRedirector(self.log_queue)
+        sys.stdout = PrintRedirector(self._emit_log)
+        sys.stderr = PrintRedirector(self._emit_log, 'ERROR')
+        log = self._emit_log
         
         try:
-            print(f"--- BẮT ĐẦU CLONE: {url} ---")
-            print(f"Output: {output}")
-            print(f"Depth: {depth}\n")
+            log('INFO', f"--- BẮT ĐẦU CLONE: {url} ---")
+            log('INFO', f"Output: {output}")
+            log('INFO', f"Depth: {depth}\n")
             
             # Nếu output rỗng, tự đặt tên theo domain (logic from user request)
             if not output:
-                 parsed = urlparse(url)
-                 output = parsed.netloc.replace(':', '_')
-                 print(f"Output directory not specified. Auto-set to: {output}")
+                 output = default_output_dir(url)
+                 log('INFO', f"Output directory not specified. Auto-set to: {output}")
 
-            cloner = WebsiteCloner(url, output, depth)
+            cloner = WebsiteCloner(url, output, depth, http_cache=http_cache,
+                                   log_handler=self._emit_log, log_level=log_level, cancel_token=cancel_token)
             cloner.clone()
             
-            print("\n--- HOÀN TẤT ---")
+            if cloner.cancel_token.reason is not None:
+                log('WARNING', "\n--- ĐÃ DỪNG (lần clone sau vào cùng thư mục sẽ tiếp tục) ---")
+                return
+            log('SUCCESS', "\n--- HOÀN TẤT ---")
             
             # Show absolute path properly through main thread or just log
             abs_path = os.path.abspath(os.path.join(output, 'index.html'))
-            print(f"File chính: {abs_path}")
+            log('INFO', f"File chính: {abs_path}")
 
         except Exception as e:
-            print(f"\n[CRITICAL ERROR] {e}")
             import traceback
-            traceback.print_exc()
+            log('ERROR', f"\n[CRITICAL ERROR] {e}")
+            log('ERROR', traceback.format_exc())
         finally:
             # Restore stdout
+            sys.stdout.flush()
+            sys.stderr.flush()
             sys.stdout = original_stdout
             sys.stderr = original_stderr
             
@@ -259,18 +316,40 @@ class WebClonerUI:
             self.root.after(0, self._on_clone_finished)
 
     def _on_clone_finished(self):
+        self._flush_log()
         self.is_running = False
         self.start_btn.config(state=tk.NORMAL)
+        self.pause_btn.config(state=tk.DISABLED, text="⏸ TẠM DỪNG")
         self.stop_btn.config(state=tk.DISABLED)
-        messagebox.showinfo("Thông báo", "Quá trình Clone đã kết thúc!")
+        if self.cancel_token is not None and self.cancel_token.reason is not None:
+            messagebox.showinfo("Thông báo", "Đã dừng clone. Các file đã tải xong được giữ lại, "
+                                             "lần clone sau vào cùng thư mục sẽ tiếp tục.")
+        else:
+            messagebox.showinfo("Thông báo", "Quá trình Clone đã kết thúc!")
+
+    def _toggle_pause(self):
+        token = self.cancel_token
+        if token is None or not self.is_running:
+            return
+        if token.paused:
+            token.resume()
+            self.pause_btn.config(text="⏸ TẠM DỪNG")
+            self._emit_log('INFO', "--- TIẾP TỤC ---")
+        else:
+            token.pause()
+            self.pause_btn.config(text="▶ TIẾP TỤC")
+            self._emit_log('WARNING', "--- TẠM DỪNG (các download đang chạy sẽ dừng ở chunk kế tiếp) ---")
 
     def _stop_clone(self):
-        # Việc dừng thread đang chạy request network là khó khăn
-        # Cách đơn giản là đóng app hoặc báo user là "Dừng không được hỗ trợ triệt để"
-        # Hoặc đặt 1 flag trong WebsiteCloner nếu có thể modify class.
-        # Ở đây ta chỉ cảnh báo.
-        if messagebox.askyesno("Xác nhận", "Việc dừng đột ngột có thể làm file bị lỗi. Bạn có muốn thoát ứng dụng không?"):
-            self.root.quit()
+        # Hủy qua CancelToken: cloner dừng ở lần tải / chunk kế tiếp, xóa file tạm, giữ journal
+        # và file .part của download Range để lần clone sau tiếp tục
+        if self.cancel_token is None or not self.is_running:
+            return
+        if messagebox.askyesno("Xác nhận", "Dừng clone? Các file đã tải xong được lưu lại "
+                                          "và lần clone sau vào cùng thư mục sẽ tiếp tục."):
+            self.cancel_token.cancel()
+            self.pause_btn.config(state=tk.DISABLED)
+            self.stop_btn.config(state=tk.DISABLED)
 
 if __name__ == "__main__":
     if sys.platform.startswith('win'):